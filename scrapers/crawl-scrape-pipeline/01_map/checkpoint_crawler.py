@@ -2,39 +2,45 @@
 """
 Crawler with checkpoint/resume capability for interrupted crawls.
 Saves progress periodically and can resume from where it left off.
+
+Crawl state lives in a persistent Frontier (disk-backed queue, Bloom
+filter seen-set and per-URL results in SQLite). A checkpoint commits the
+frontier and appends the rows fetched since the last one to dump.csv, so
+checkpoints are cheap and memory stays bounded however large the site is.
 """
 
-import json
 import csv
 import sys
 import time
-import pickle
+from collections import Counter
 from pathlib import Path
-from typing import Dict, Set, List, Optional
+from typing import Dict, List, Optional
 from urllib.parse import urljoin, urlparse
 import requests
 from bs4 import BeautifulSoup
-from collections import deque
-from datetime import datetime
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
+from orchestration.frontier import Frontier
 from orchestration.utils_minimal import normalize_url, is_valid_url, logger
 
 
+CSV_FIELDS = ['url', 'status_code', 'content_type', 'size', 'last_modified']
+
+
 class CheckpointCrawler:
     """Crawler with checkpoint/resume functionality."""
     
-    def __init__(self, domain: str, checkpoint_file: Optional[str] = None):
+    def __init__(self, domain: str, checkpoint_dir: Optional[str] = None):
         self.domain = domain
-        self.checkpoint_file = checkpoint_file or f'{domain}_checkpoint.pkl'
-        self.checkpoint_path = Path(__file__).parent / self.checkpoint_file
+        self.checkpoint_dir = checkpoint_dir or f'{domain}_checkpoint'
+        self.checkpoint_path = Path(__file__).parent / self.checkpoint_dir
         self.output_file = Path(__file__).parent / 'dump.csv'
         
         # State to be checkpointed
-        self.visited_urls: Set[str] = set()
-        self.to_visit: deque = deque()
-        self.url_metadata: Dict[str, Dict] = {}
+        self.frontier: Optional[Frontier] = None
+        self.new_rows: List[Dict] = []  # fetched since the last checkpoint
+        self.status_counts: Counter = Counter()
         self.pages_crawled = 0
         self.start_time = None
         self.checkpoint_interval = 50  # Save every 50 pages
@@ -49,63 +55,54 @@ class CheckpointCrawler:
         })
         
     def save_checkpoint(self):
-        """Save current state to checkpoint file."""
-        checkpoint_data = {
-            'domain': self.domain,
-            'visited_urls': self.visited_urls,
-            'to_visit': list(self.to_visit),
-            'url_metadata': self.url_metadata,
-            'pages_crawled': self.pages_crawled,
-            'timestamp': datetime.now().isoformat()
-        }
+        """Commit the frontier and its results, then append the new rows to the CSV."""
+        self.frontier.checkpoint()
         
-        # Save as pickle for efficiency
-        with open(self.checkpoint_path, 'wb') as f:
-            pickle.dump(checkpoint_data, f)
+        # Only rows fetched since the last checkpoint; earlier ones are on disk
+        self.append_csv(self.new_rows)
+        self.new_rows = []
         
-        # Also save CSV incrementally
-        self.save_csv()
-        
-        logger.info(f"Checkpoint saved: {self.pages_crawled} pages crawled, {len(self.to_visit)} URLs in queue")
+        logger.info(f"Checkpoint saved: {self.pages_crawled} pages crawled, {len(self.frontier)} URLs in queue")
         
     def load_checkpoint(self) -> bool:
-        """Load state from checkpoint file if it exists."""
-        if not self.checkpoint_path.exists():
-            return False
-            
-        try:
-            with open(self.checkpoint_path, 'rb') as f:
-                checkpoint_data = pickle.load(f)
-            
-            # Restore state
-            self.domain = checkpoint_data['domain']
-            self.visited_urls = checkpoint_data['visited_urls']
-            self.to_visit = deque(checkpoint_data['to_visit'])
-            self.url_metadata = checkpoint_data['url_metadata']
-            self.pages_crawled = checkpoint_data['pages_crawled']
+        """Open the frontier, restoring results if a checkpoint exists."""
+        resumed = Frontier.exists(self.checkpoint_path)
+        self.frontier = Frontier(self.checkpoint_path)
+        self.start_csv()
+        
+        if resumed:
+            # Pages fetched after the last checkpoint were not committed and
+            # are simply fetched again. The CSV is rewritten once from the
+            # committed results, so a crash between the frontier commit and
+            # the CSV append neither loses nor repeats rows.
+            for record in self.frontier.iter_records():
+                self.new_rows.append(record)
+                self.status_counts[record['status_code']] += 1
+                if len(self.new_rows) >= 10000:
+                    self.append_csv(self.new_rows)
+                    self.new_rows = []
+            self.append_csv(self.new_rows)
+            self.new_rows = []
+            self.pages_crawled = sum(self.status_counts.values())
+            self.last_checkpoint = self.pages_crawled
             
             logger.info(f"Checkpoint loaded: {self.pages_crawled} pages already crawled")
-            logger.info(f"Resuming with {len(self.to_visit)} URLs in queue")
-            logger.info(f"Last checkpoint: {checkpoint_data['timestamp']}")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error loading checkpoint: {e}")
-            return False
+            logger.info(f"Resuming with {len(self.frontier)} URLs in queue")
+        
+        return resumed
     
-    def save_csv(self):
-        """Save current results to CSV."""
-        if not self.url_metadata:
+    def start_csv(self):
+        """Truncate the CSV to its header."""
+        with open(self.output_file, 'w', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=CSV_FIELDS).writeheader()
+    
+    def append_csv(self, rows: List[Dict]):
+        """Append rows to the CSV, in the order they were fetched."""
+        if not rows:
             return
         
-        with open(self.output_file, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ['url', 'status_code', 'content_type', 'size', 'last_modified']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for url in sorted(self.url_metadata.keys()):
-                writer.writerow(self.url_metadata[url])
+        with open(self.output_file, 'a', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=CSV_FIELDS).writerows(rows)
     
     def is_same_domain(self, netloc: str) -> bool:
         """Check if URL belongs to same domain."""
@@ -144,9 +141,8 @@ class CheckpointCrawler:
                         absolute_url = normalize_url(urljoin(url, href))
                         parsed = urlparse(absolute_url)
                         
-                        if (self.is_same_domain(parsed.netloc) and 
-                            absolute_url not in self.visited_urls):
-                            self.to_visit.append(absolute_url)
+                        if self.is_same_domain(parsed.netloc):
+                            self.frontier.add(absolute_url)
                             
                 except Exception as e:
                     logger.warning(f"Error parsing HTML for {url}: {e}")
@@ -173,22 +169,21 @@ class CheckpointCrawler:
         if not resumed:
             # Fresh start
             logger.info(f"Starting fresh crawl of {self.domain}")
-            self.to_visit.append(f'https://{self.domain}/')
-            self.to_visit.append(f'https://www.{self.domain}/')
+            self.frontier.add(f'https://{self.domain}/')
+            self.frontier.add(f'https://www.{self.domain}/')
         
-        while self.to_visit and self.pages_crawled < max_pages:
-            url = self.to_visit.popleft()
-            
-            if url in self.visited_urls:
-                continue
-            
-            self.visited_urls.add(url)
+        while self.pages_crawled < max_pages:
+            url = self.frontier.pop()
+            if url is None:
+                break
             
             logger.info(f"[{self.pages_crawled + 1}/{max_pages}] Fetching: {url}")
             
             metadata = self.fetch_url(url)
             if metadata:
-                self.url_metadata[url] = metadata
+                self.frontier.record(url, metadata)
+                self.new_rows.append(metadata)
+                self.status_counts[metadata['status_code']] += 1
                 self.pages_crawled += 1
                 
                 # Save checkpoint periodically
@@ -202,16 +197,18 @@ class CheckpointCrawler:
         # Final save
         self.save_checkpoint()
         
-        # Clean up checkpoint file on successful completion
-        if self.pages_crawled >= max_pages or not self.to_visit:
-            self.checkpoint_path.unlink(missing_ok=True)
-            logger.info("Crawl completed, checkpoint file removed")
+        # Clean up checkpoint directory on successful completion
+        if self.pages_crawled >= max_pages or not len(self.frontier):
+            self.frontier.destroy()
+            logger.info("Crawl completed, checkpoint removed")
+        else:
+            self.frontier.close()
         
         elapsed = time.time() - self.start_time
         logger.info(f"Crawled {self.pages_crawled} pages in {elapsed:.2f} seconds")
         logger.info(f"Average: {self.pages_crawled/elapsed:.2f} pages/second")
         
-        return self.url_metadata
+        return dict(self.status_counts)
 
 
 def main():
@@ -231,17 +228,12 @@ def main():
     else:
         print(f"Starting new crawl of {domain} (max {max_pages} pages)")
     
-    metadata = crawler.crawl(max_pages)
+    status_counts = crawler.crawl(max_pages)
     
-    print(f"\nCrawl complete! Found {len(metadata)} URLs")
+    print(f"\nCrawl complete! Found {sum(status_counts.values())} URLs")
     print(f"Results saved to: {crawler.output_file}")
     
     # Print status distribution
-    status_counts = {}
-    for m in metadata.values():
-        status = m['status_code']
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
     print("\nStatus code distribution:")
     for status, count in sorted(status_counts.items()):
         print(f"  {status}: {count}")
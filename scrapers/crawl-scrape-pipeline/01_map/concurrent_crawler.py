@@ -16,6 +16,7 @@ from collections import deque
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
+from orchestration.rate_control import RateController
 from orchestration.utils_minimal import normalize_url, is_valid_url, logger
 
 
@@ -31,6 +32,7 @@ class ConcurrentCrawler:
         self.to_visit = asyncio.Queue()
         self.session = None
         self.start_time = None
+        self.rate_controller = RateController(max_concurrency=max_concurrent)
         
     def is_same_domain(self, url: str) -> bool:
         """Check if URL belongs to the same domain."""
@@ -47,57 +49,64 @@ class ConcurrentCrawler:
         self.visited_urls.add(url)
         
         try:
-            async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                # Collect metadata
-                content = await response.read()
-                content_type = response.headers.get('content-type', '').split(';')[0].strip()
-                
-                self.url_metadata[url] = {
-                    'url': url,
-                    'status_code': response.status,
-                    'content_type': content_type,
-                    'size': len(content),
-                    'last_modified': response.headers.get('last-modified', '')
-                }
-                
-                logger.info(f"[{len(self.visited_urls)}/{self.max_pages}] Fetched {url} - Status: {response.status}, Size: {len(content)}")
-                
-                # Handle rate limiting
-                if response.status == 429:
-                    if retry_count < 3:
-                        retry_after = int(response.headers.get('Retry-After', 2 ** retry_count))
-                        logger.warning(f"Rate limited on {url}, retrying after {retry_after} seconds (attempt {retry_count + 1}/3)")
-                        await asyncio.sleep(retry_after)
-                        self.visited_urls.discard(url)  # Remove from visited to retry
-                        await self.fetch_url(url, retry_count + 1)
-                        return
-                    else:
-                        logger.error(f"Max retries exceeded for {url} due to rate limiting")
-                
-                # Extract links from HTML pages
-                if response.status == 200 and 'text/html' in content_type:
-                    try:
-                        soup = BeautifulSoup(content, 'html.parser')
-                        links_found = 0
+            # Wait for the host's adaptive rate controller to hand out a slot
+            async with self.rate_controller.slot(url):
+                start = time.time()
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    content = await response.read()
+                    status = response.status
+                    headers = response.headers
+                self.rate_controller.record(url, status, time.time() - start, headers)
+            
+            # Collect metadata
+            content_type = headers.get('content-type', '').split(';')[0].strip()
+            
+            self.url_metadata[url] = {
+                'url': url,
+                'status_code': status,
+                'content_type': content_type,
+                'size': len(content),
+                'last_modified': headers.get('last-modified', '')
+            }
+            
+            logger.info(f"[{len(self.visited_urls)}/{self.max_pages}] Fetched {url} - Status: {status}, Size: {len(content)}")
+            
+            # Handle rate limiting; the controller has already applied any
+            # Retry-After pause to this host, so just requeue the attempt
+            if status == 429:
+                if retry_count < 3:
+                    logger.warning(f"Rate limited on {url}, retrying (attempt {retry_count + 1}/3)")
+                    self.visited_urls.discard(url)  # Remove from visited to retry
+                    await self.fetch_url(url, retry_count + 1)
+                    return
+                else:
+                    logger.error(f"Max retries exceeded for {url} due to rate limiting")
+            
+            # Extract links from HTML pages
+            if status == 200 and 'text/html' in content_type:
+                try:
+                    soup = BeautifulSoup(content, 'html.parser')
+                    links_found = 0
+                    
+                    for link in soup.find_all('a', href=True):
+                        href = link['href']
+                        absolute_url = normalize_url(urljoin(url, href))
                         
-                        for link in soup.find_all('a', href=True):
-                            href = link['href']
-                            absolute_url = normalize_url(urljoin(url, href))
-                            
-                            if (self.is_same_domain(absolute_url) and 
-                                absolute_url not in self.visited_urls and
-                                len(self.visited_urls) < self.max_pages):
-                                await self.to_visit.put(absolute_url)
-                                links_found += 1
+                        if (self.is_same_domain(absolute_url) and 
+                            absolute_url not in self.visited_urls and
+                            len(self.visited_urls) < self.max_pages):
+                            await self.to_visit.put(absolute_url)
+                            links_found += 1
+                    
+                    if links_found > 0:
+                        logger.debug(f"Found {links_found} new links on {url}")
                         
-                        if links_found > 0:
-                            logger.debug(f"Found {links_found} new links on {url}")
-                            
-                    except Exception as e:
-                        logger.warning(f"Error parsing HTML for {url}: {e}")
+                except Exception as e:
+                    logger.warning(f"Error parsing HTML for {url}: {e}")
                         
         except asyncio.TimeoutError:
             logger.error(f"Timeout fetching {url}")
+            self.rate_controller.record(url, 0)
             self.url_metadata[url] = {
                 'url': url,
                 'status_code': 0,
@@ -107,6 +116,7 @@ class ConcurrentCrawler:
             }
         except Exception as e:
             logger.error(f"Error fetching {url}: {e}")
+            self.rate_controller.record(url, 0)
             self.url_metadata[url] = {
                 'url': url,
                 'status_code': 0,
@@ -122,8 +132,6 @@ class ConcurrentCrawler:
                 # Get URL from queue with timeout
                 url = await asyncio.wait_for(self.to_visit.get(), timeout=5.0)
                 await self.fetch_url(url)
-                # Small delay to be respectful
-                await asyncio.sleep(0.1)
             except asyncio.TimeoutError:
                 # No more URLs in queue
                 break
@@ -159,6 +167,8 @@ class ConcurrentCrawler:
         elapsed = time.time() - self.start_time
         logger.info(f"Crawl complete in {elapsed:.2f} seconds")
         logger.info(f"Crawled {len(self.visited_urls)} pages at {len(self.visited_urls)/elapsed:.2f} pages/second")
+        for host, host_stats in self.rate_controller.metrics().items():
+            logger.info(f"  {host}: settled at {host_stats['rate']:.2f} req/s, concurrency {host_stats['concurrency']}")
     
     def save_results(self):
         """Save crawl results to CSV file."""
@@ -6,16 +6,17 @@ Automatically tries curl when other methods fail, without site-specific logic.
 
 import csv
 import sys
-import xml.etree.ElementTree as ET
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Optional
 import requests
-from datetime import datetime
-import time
-import random
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
+from orchestration.rate_control import RateController
+from sitemap_stream import DumpWriter, open_sitemap_stream, iter_sitemap_entries, sniff, looks_like_html
 
 try:
     from orchestration.utils_minimal import setup_logging, normalize_url
@@ -60,8 +61,11 @@ except ImportError:
 class CurlCrawler:
     """Universal crawler that uses curl user agent when needed."""
     
-    def __init__(self, domain: str):
+    def __init__(self, domain: str, max_workers: int = 8):
         self.domain = domain
+        self.max_workers = max_workers
+        self.rate_controller = RateController()
+        self.bot_indicators = ['access denied', 'captcha', 'cf-browser-verification']
         self.logger = setup_logging('curl_crawler', Path(__file__).parent / 'curl_crawl.log')
         self.output_file = Path(__file__).parent / 'dump.csv'
         self.session = None
@@ -77,6 +81,7 @@ class CurlCrawler:
             'curl/8.0.1',
         ]
         self.current_ua_index = 0
+        self._ua_lock = threading.Lock()
         
     def _setup_session(self, user_agent: str) -> requests.Session:
         """Set up requests session with specified user agent."""
@@ -111,62 +116,60 @@ class CurlCrawler:
             backoff_factor=1,
             status_forcelist=[500, 502, 503, 504],
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(max_retries=retry_strategy,
+                              pool_connections=self.max_workers, pool_maxsize=self.max_workers)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         
         return session
     
-    def try_next_user_agent(self) -> bool:
-        """Try the next user agent in the list."""
-        if self.current_ua_index < len(self.user_agents) - 1:
-            self.current_ua_index += 1
-            user_agent = self.user_agents[self.current_ua_index]
-            self.logger.info(f"Switching to user agent: {user_agent}")
-            self.session = self._setup_session(user_agent)
-            return True
-        return False
+    def try_next_user_agent(self, failed_index: Optional[int] = None) -> bool:
+        """Try the next user agent in the list.
+        
+        With concurrent fetches several workers can be blocked by the same
+        user agent; ``failed_index`` makes sure it is only rotated once.
+        """
+        with self._ua_lock:
+            if failed_index is not None and failed_index != self.current_ua_index:
+                return True  # Another worker already switched
+            if self.current_ua_index < len(self.user_agents) - 1:
+                self.current_ua_index += 1
+                user_agent = self.user_agents[self.current_ua_index]
+                self.logger.info(f"Switching to user agent: {user_agent}")
+                self.session = self._setup_session(user_agent)
+                return True
+            return False
     
-    def fetch_content(self, url: str) -> Optional[str]:
-        """Fetch content, automatically trying different user agents if blocked."""
+    def fetch_response(self, url: str, stream: bool = False) -> Optional[requests.Response]:
+        """Fetch a URL, automatically trying different user agents if blocked."""
         # Initialize with first user agent if not set
-        if self.session is None:
-            self.session = self._setup_session(self.user_agents[0])
+        with self._ua_lock:
+            if self.session is None:
+                self.session = self._setup_session(self.user_agents[0])
         
         while True:
+            ua_index = self.current_ua_index
             try:
-                self.logger.info(f"Fetching: {url} with UA: {self.user_agents[self.current_ua_index]}")
+                self.logger.info(f"Fetching: {url} with UA: {self.user_agents[ua_index]}")
                 
-                # Add small delay to be polite
-                time.sleep(random.uniform(0.5, 1.0))
-                
-                response = self.session.get(url, timeout=30)
+                # Per-host pacing instead of a fixed polite delay
+                self.rate_controller.acquire(url)
+                start = time.time()
+                response = self.session.get(url, timeout=30, stream=stream)
+                self.rate_controller.record(url, response.status_code, time.time() - start, response.headers)
                 
                 # Check if we're blocked
                 if response.status_code == 403:
-                    self.logger.warning(f"Got 403 with {self.user_agents[self.current_ua_index]}")
-                    if self.try_next_user_agent():
+                    response.close()
+                    self.logger.warning(f"Got 403 with {self.user_agents[ua_index]}")
+                    if self.try_next_user_agent(ua_index):
                         continue  # Try again with new UA
                     else:
                         self.logger.error("All user agents exhausted")
                         return None
                 
                 response.raise_for_status()
-                
-                # Check for bot detection patterns in content
-                content_lower = response.text.lower()
-                bot_indicators = ['access denied', 'captcha', 'cf-browser-verification']
-                
-                if any(indicator in content_lower for indicator in bot_indicators):
-                    self.logger.warning(f"Bot detection suspected with {self.user_agents[self.current_ua_index]}")
-                    if self.try_next_user_agent():
-                        continue
-                    else:
-                        return None
-                
-                # Success!
-                self.logger.info(f"Successfully fetched with {self.user_agents[self.current_ua_index]}")
-                return response.text
+                return response
                 
             except requests.exceptions.HTTPError as e:
                 if e.response.status_code == 404:
@@ -174,59 +177,90 @@ class CurlCrawler:
                     return None
                 else:
                     self.logger.error(f"HTTP Error {e.response.status_code}: {url}")
-                    if self.try_next_user_agent():
+                    if self.try_next_user_agent(ua_index):
                         continue
                     return None
                     
             except Exception as e:
+                self.rate_controller.record(url, 0)
                 self.logger.error(f"Error fetching {url}: {e}")
                 return None
     
-    def parse_sitemap_index(self, content: str) -> List[str]:
-        """Parse sitemap index to get individual sitemap URLs."""
-        sitemaps = []
-        try:
-            root = ET.fromstring(content)
+    def is_bot_wall(self, text: str) -> bool:
+        """Check for bot detection patterns in content."""
+        content_lower = text.lower()
+        return any(indicator in content_lower for indicator in self.bot_indicators)
+    
+    def fetch_content(self, url: str) -> Optional[str]:
+        """Fetch content, automatically trying different user agents if blocked."""
+        while True:
+            ua_index = self.current_ua_index
+            response = self.fetch_response(url)
+            if response is None:
+                return None
             
-            # Handle sitemap index
-            for sitemap in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}sitemap'):
-                loc = sitemap.find('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')
-                if loc is not None and loc.text:
-                    sitemaps.append(loc.text.strip())
-                    
-        except Exception as e:
-            self.logger.error(f"Error parsing sitemap index: {e}")
+            if self.is_bot_wall(response.text):
+                self.logger.warning(f"Bot detection suspected with {self.user_agents[ua_index]}")
+                if self.try_next_user_agent(ua_index):
+                    continue
+                return None
             
-        return sitemaps
+            # Success!
+            self.logger.info(f"Successfully fetched with {self.user_agents[ua_index]}")
+            return response.text
     
-    def parse_sitemap(self, content: str) -> List[Dict[str, str]]:
-        """Parse sitemap to get URLs."""
-        urls = []
-        try:
-            root = ET.fromstring(content)
+    def process_sitemap(self, sitemap_url: str, writer: DumpWriter,
+                        all_urls: Dict[str, Dict]) -> List[str]:
+        """Stream one sitemap into dump.csv, returning any child sitemaps."""
+        while True:
+            ua_index = self.current_ua_index
+            response = self.fetch_response(sitemap_url, stream=True)
+            if response is None:
+                return []
             
-            # Handle regular sitemap
-            for url in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}url'):
-                loc = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')
-                lastmod = url.find('{http://www.sitemaps.org/schemas/sitemap/0.9}lastmod')
+            with response:
+                stream = open_sitemap_stream(response)
+                head = sniff(stream)
+                if looks_like_html(head) or self.is_bot_wall(head):
+                    self.logger.warning(f"Bot detection suspected with {self.user_agents[ua_index]}")
+                    if self.try_next_user_agent(ua_index):
+                        continue
+                    return []
                 
-                if loc is not None and loc.text:
-                    url_data = {
-                        'url': normalize_url(loc.text.strip()),
-                        'last_modified': lastmod.text.strip() if lastmod is not None and lastmod.text else '',
-                        'status_code': 200,  # Assumed from sitemap
-                        'content_type': 'text/html',  # Assumed
-                        'size': 0,  # Unknown from sitemap
-                    }
-                    urls.append(url_data)
-                    
-        except Exception as e:
-            self.logger.error(f"Error parsing sitemap: {e}")
+                sub_sitemaps = []
+                found = 0
+                try:
+                    for kind, entry in iter_sitemap_entries(stream, sitemap_url):
+                        if kind == 'sitemap':
+                            sub_sitemaps.append(entry['url'])
+                            continue
+                        
+                        url_data = {
+                            'url': normalize_url(entry['url']),
+                            'last_modified': entry['last_modified'],
+                            'status_code': 200,  # Assumed from sitemap
+                            'content_type': 'text/html',  # Assumed
+                            'size': 0,  # Unknown from sitemap
+                        }
+                        if writer.write(url_data):
+                            all_urls[url_data['url']] = url_data
+                            found += 1
+                except Exception as e:
+                    self.logger.error(f"Error parsing sitemap {sitemap_url}: {e}")
             
-        return urls
+            if sub_sitemaps:
+                self.logger.info(f"Found sitemap index with {len(sub_sitemaps)} sitemaps")
+            else:
+                self.logger.info(f"Found {found} URLs in {sitemap_url}")
+            return sub_sitemaps
     
     def crawl(self, max_sitemaps: int = 50) -> Dict[str, Dict]:
-        """Crawl using sitemap with automatic user agent adaptation."""
+        """Crawl using sitemap with automatic user agent adaptation.
+        
+        The sitemaps listed in an index are fetched concurrently and every
+        sitemap is parsed as it streams in, with URLs appended to dump.csv
+        immediately.
+        """
         self.logger.info(f"Starting curl-based crawl for {self.domain}")
         
         # Try to find sitemap
@@ -253,40 +287,22 @@ class CurlCrawler:
                             sitemap_urls.insert(0, sitemap_url)  # Prioritize
                             self.logger.info(f"Found sitemap URL in robots.txt: {sitemap_url}")
         
-        all_urls = {}
+        all_urls: Dict[str, Dict] = {}
         
-        # Try to fetch sitemaps
-        for sitemap_url in sitemap_urls:
-            sitemap_content = self.fetch_content(sitemap_url)
-            
-            if not sitemap_content:
-                continue
-                
-            self.logger.info(f"Successfully fetched sitemap from {sitemap_url}")
-            
-            # Check if it's a sitemap index
-            if '<sitemapindex' in sitemap_content:
-                self.logger.info("Found sitemap index")
-                sub_sitemaps = self.parse_sitemap_index(sitemap_content)
+        with DumpWriter(self.output_file) as writer:
+            # Try to fetch sitemaps
+            for sitemap_url in sitemap_urls:
+                sub_sitemaps = self.process_sitemap(sitemap_url, writer, all_urls)
                 
-                for i, sub_sitemap in enumerate(sub_sitemaps[:max_sitemaps]):
-                    sub_content = self.fetch_content(sub_sitemap)
-                    if sub_content:
-                        urls = self.parse_sitemap(sub_content)
-                        self.logger.info(f"Found {len(urls)} URLs in {sub_sitemap}")
-                        
-                        for url_data in urls:
-                            all_urls[url_data['url']] = url_data
-            else:
-                # Regular sitemap
-                urls = self.parse_sitemap(sitemap_content)
-                self.logger.info(f"Found {len(urls)} URLs in {sitemap_url}")
+                if sub_sitemaps:
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        futures = [executor.submit(self.process_sitemap, sub_sitemap, writer, all_urls)
+                                   for sub_sitemap in sub_sitemaps[:max_sitemaps]]
+                        for future in as_completed(futures):
+                            future.result()
                 
-                for url_data in urls:
-                    all_urls[url_data['url']] = url_data
-                    
-            if all_urls:
-                break  # Found URLs, stop trying
+                if all_urls:
+                    break  # Found URLs, stop trying
         
         self.logger.info(f"Total unique URLs found: {len(all_urls)}")
         self.logger.info(f"Final successful user agent: {self.user_agents[self.current_ua_index]}")
@@ -326,7 +342,6 @@ def main():
     url_metadata = crawler.crawl()
     
     if url_metadata:
-        crawler.save_dump_csv(url_metadata)
         print(f"\nCrawl complete! Found {len(url_metadata)} URLs")
         print(f"Results saved to: {crawler.output_file}")
     else:
@@ -2,15 +2,16 @@
 """
 Enhanced sitemap crawler with support for various sitemap formats and protected sites.
 Handles compressed sitemaps, RSS feeds, and dynamic sitemap discovery.
+Sitemaps are fetched concurrently and parsed as streams (see sitemap_stream).
 """
 
 import csv
 import gzip
-import io
 import sys
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import List, Dict, Optional, Set
+from typing import List, Dict, Optional
 from urllib.parse import urlparse, urljoin
 import requests
 from datetime import datetime
@@ -20,20 +21,23 @@ import re
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
 
 from utils_minimal import setup_logging, normalize_url, is_valid_url
+from orchestration.rate_control import RateController
+from sitemap_stream import DumpWriter, open_sitemap_stream, iter_sitemap_entries, sniff, looks_like_html
 
 
 class EnhancedSitemapCrawler:
     """Advanced sitemap crawler with comprehensive format support."""
     
-    def __init__(self, domain: str):
+    def __init__(self, domain: str, max_workers: int = 8):
         self.domain = domain
         self.logger = setup_logging('enhanced_sitemap', Path(__file__).parent / 'enhanced_sitemap.log')
         self.output_file = Path(__file__).parent / 'dump.csv'
+        self.max_workers = max_workers
         self.session = self._setup_session()
-        self.discovered_urls: Set[str] = set()
-        self.sitemap_urls: Set[str] = set()
+        self.rate_controller = RateController()
         
     def _setup_session(self) -> requests.Session:
         """Set up requests session with proper headers."""
@@ -67,7 +71,8 @@ class EnhancedSitemapCrawler:
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504],
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(max_retries=retry_strategy,
+                              pool_connections=self.max_workers, pool_maxsize=self.max_workers)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         
@@ -78,10 +83,11 @@ class EnhancedSitemapCrawler:
         try:
             self.logger.info(f"Fetching: {url}")
             
-            # Add delay to be polite
-            time.sleep(random.uniform(0.5, 1.5))
-            
-            response = self.session.get(url, timeout=30, stream=True)
+            # Per-host pacing instead of a fixed polite delay
+            self.rate_controller.acquire(url)
+            start = time.time()
+            response = self.session.get(url, timeout=30)
+            self.rate_controller.record(url, response.status_code, time.time() - start, response.headers)
             response.raise_for_status()
             
             # Handle gzipped content
@@ -175,110 +181,75 @@ class EnhancedSitemapCrawler:
                 
         return unique_urls
     
-    def parse_sitemap_index(self, content: str, base_url: str) -> List[str]:
-        """Parse sitemap index to get individual sitemap URLs."""
-        sitemaps = []
+    def process_sitemap(self, sitemap_url: str, writer: DumpWriter,
+                        all_urls: Dict[str, Dict]) -> List[str]:
+        """Stream one sitemap document into dump.csv.
+        
+        Returns the child sitemaps listed if the document is an index.
+        """
+        self.rate_controller.acquire(sitemap_url)
+        start = time.time()
         try:
-            # Remove byte order mark if present
-            content = content.strip()
-            if content.startswith('\ufeff'):
-                content = content[1:]
-                
-            root = ET.fromstring(content)
-            
-            # Handle different namespace variations
-            namespaces = [
-                {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'},
-                {'sm': 'https://www.sitemaps.org/schemas/sitemap/0.9'},
-                {},  # No namespace
-            ]
-            
-            for ns in namespaces:
-                # Try with namespace
-                if ns:
-                    locs = root.findall('.//sm:sitemap/sm:loc', ns)
-                else:
-                    locs = root.findall('.//sitemap/loc')
-                
-                for loc in locs:
-                    if loc.text:
-                        sitemap_url = loc.text.strip()
-                        # Handle relative URLs
-                        if not sitemap_url.startswith('http'):
-                            sitemap_url = urljoin(base_url, sitemap_url)
-                        sitemaps.append(sitemap_url)
-                        
-                if sitemaps:
-                    break
-                    
+            response = self.session.get(sitemap_url, timeout=30, stream=True)
         except Exception as e:
-            self.logger.error(f"Error parsing sitemap index: {e}")
-            
-        return sitemaps
-    
-    def parse_sitemap(self, content: str, base_url: str) -> List[Dict[str, str]]:
-        """Parse sitemap to get URLs with enhanced error handling."""
-        urls = []
-        try:
-            # Clean content
-            content = content.strip()
-            if content.startswith('\ufeff'):
-                content = content[1:]
-            
-            # Try to parse as XML
-            root = ET.fromstring(content)
-            
-            # Handle different namespace variations
-            namespaces = [
-                {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'},
-                {'sm': 'https://www.sitemaps.org/schemas/sitemap/0.9'},
-                {},  # No namespace
-            ]
-            
-            for ns in namespaces:
-                if ns:
-                    url_elements = root.findall('.//sm:url', ns)
-                else:
-                    url_elements = root.findall('.//url')
-                
-                for url_elem in url_elements:
-                    if ns:
-                        loc = url_elem.find('sm:loc', ns)
-                        lastmod = url_elem.find('sm:lastmod', ns)
-                        changefreq = url_elem.find('sm:changefreq', ns)
-                        priority = url_elem.find('sm:priority', ns)
-                    else:
-                        loc = url_elem.find('loc')
-                        lastmod = url_elem.find('lastmod')
-                        changefreq = url_elem.find('changefreq')
-                        priority = url_elem.find('priority')
-                    
-                    if loc is not None and loc.text:
-                        url = loc.text.strip()
-                        # Handle relative URLs
-                        if not url.startswith('http'):
-                            url = urljoin(base_url, url)
-                            
-                        url_data = {
-                            'url': normalize_url(url),
-                            'last_modified': lastmod.text.strip() if lastmod is not None and lastmod.text else '',
-                            'changefreq': changefreq.text.strip() if changefreq is not None and changefreq.text else '',
-                            'priority': priority.text.strip() if priority is not None and priority.text else ''
-                        }
-                        urls.append(url_data)
-                
-                if urls:
-                    break
-                    
-        except ET.ParseError as e:
-            self.logger.error(f"XML parse error: {e}")
-            # Try to extract URLs with regex as fallback
-            urls = self._extract_urls_fallback(content, base_url)
+            self.rate_controller.record(sitemap_url, 0)
+            self.logger.error(f"Error fetching {sitemap_url}: {e}")
+            return []
+        
+        with response:
+            self.rate_controller.record(sitemap_url, response.status_code,
+                                        time.time() - start, response.headers)
+            if response.status_code != 200:
+                return []
             
-        except Exception as e:
-            self.logger.error(f"Error parsing sitemap: {e}")
+            stream = open_sitemap_stream(response)
+            if looks_like_html(sniff(stream)):
+                return []
             
-        return urls
+            self.logger.info(f"Processing sitemap: {sitemap_url}")
+            sub_sitemaps = []
+            found = 0
+            try:
+                for kind, entry in iter_sitemap_entries(stream, sitemap_url):
+                    if kind == 'sitemap':
+                        sub_sitemaps.append(entry['url'])
+                    elif self._add_url(entry, writer, all_urls):
+                        found += 1
+            except ET.ParseError as e:
+                self.logger.error(f"XML parse error in {sitemap_url}: {e}")
+                # Try to extract URLs with regex as fallback
+                content = self.fetch_content(sitemap_url)
+                if content:
+                    for entry in self._extract_urls_fallback(content, sitemap_url):
+                        if self._add_url(entry, writer, all_urls):
+                            found += 1
+            except Exception as e:
+                self.logger.error(f"Error parsing sitemap {sitemap_url}: {e}")
+        
+        if sub_sitemaps:
+            self.logger.info(f"Found sitemap index at {sitemap_url} with {len(sub_sitemaps)} sub-sitemaps")
+        else:
+            self.logger.info(f"Found {found} new URLs in {sitemap_url}")
+        return sub_sitemaps
+    
+    def _add_url(self, url_data: Dict[str, str], writer: DumpWriter,
+                 all_urls: Dict[str, Dict]) -> bool:
+        """Record a URL from the target domain; returns True if it was new."""
+        url = normalize_url(url_data['url'])
+        netloc = urlparse(url).netloc
+        if not (netloc == self.domain or netloc == f'www.{self.domain}' or netloc.endswith(f'.{self.domain}')):
+            return False
+        
+        url_data.update({
+            'url': url,
+            'status_code': 200,  # Assumed from sitemap
+            'content_type': 'text/html',  # Assumed
+            'size': 0,  # Unknown from sitemap
+        })
+        if not writer.write(url_data):
+            return False
+        all_urls[url] = url_data
+        return True
     
     def _extract_urls_fallback(self, content: str, base_url: str) -> List[Dict[str, str]]:
         """Extract URLs using regex when XML parsing fails."""
@@ -309,133 +280,44 @@ class EnhancedSitemapCrawler:
             
         return urls
     
-    def parse_rss_feed(self, content: str, base_url: str) -> List[Dict[str, str]]:
-        """Parse RSS feed format (some sites use this instead of sitemaps)."""
-        urls = []
-        try:
-            root = ET.fromstring(content)
-            
-            # Check for RSS feed
-            if root.tag == 'rss' or 'rss' in root.tag:
-                items = root.findall('.//item')
-                for item in items:
-                    link = item.find('link')
-                    if link is not None and link.text:
-                        url_data = {
-                            'url': normalize_url(link.text.strip()),
-                            'last_modified': '',
-                            'changefreq': '',
-                            'priority': ''
-                        }
-                        
-                        # Try to get publication date
-                        pubdate = item.find('pubDate')
-                        if pubdate is not None and pubdate.text:
-                            url_data['last_modified'] = pubdate.text.strip()
-                            
-                        urls.append(url_data)
-                        
-                self.logger.info(f"Found {len(urls)} URLs in RSS feed")
-                
-        except Exception as e:
-            self.logger.error(f"Error parsing RSS feed: {e}")
-            
-        return urls
-    
     def crawl(self, max_sitemaps: int = 50) -> Dict[str, Dict]:
-        """Crawl website using sitemaps with enhanced discovery."""
+        """Crawl website using sitemaps with enhanced discovery.
+        
+        Candidate locations and the children of every sitemap index are
+        fetched concurrently by up to ``max_workers`` threads (paced per
+        host by the rate controller). URLs are written to dump.csv as each
+        sitemap streams in. ``max_sitemaps`` caps the number of child
+        sitemaps followed from indexes.
+        """
         self.logger.info(f"Starting enhanced sitemap crawl for {self.domain}")
         
         # Discover sitemap URLs
         sitemap_urls = self.discover_sitemaps()
         self.logger.info(f"Checking {len(sitemap_urls)} potential sitemap locations")
         
-        all_urls = {}
-        processed_sitemaps = set()
-        sitemap_queue = sitemap_urls.copy()
+        all_urls: Dict[str, Dict] = {}
+        processed_sitemaps = set(sitemap_urls)
+        children_queued = 0
         
-        while sitemap_queue and len(processed_sitemaps) < max_sitemaps:
-            sitemap_url = sitemap_queue.pop(0)
-            
-            # Skip if already processed
-            if sitemap_url in processed_sitemaps:
-                continue
-                
-            processed_sitemaps.add(sitemap_url)
-            
-            # Fetch sitemap content
-            content = self.fetch_content(sitemap_url)
-            if not content:
-                continue
-                
-            self.logger.info(f"Processing sitemap: {sitemap_url}")
+        with DumpWriter(self.output_file) as writer, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self.process_sitemap, url, writer, all_urls)
+                       for url in sitemap_urls}
             
-            # Detect sitemap type
-            content_lower = content[:1000].lower()
-            
-            if '<sitemapindex' in content_lower:
-                # Sitemap index
-                self.logger.info(f"Found sitemap index at {sitemap_url}")
-                sub_sitemaps = self.parse_sitemap_index(content, sitemap_url)
-                
-                # Add discovered sitemaps to queue
-                for sub_sitemap in sub_sitemaps:
-                    if sub_sitemap not in processed_sitemaps:
-                        sitemap_queue.append(sub_sitemap)
-                        
-                self.logger.info(f"Added {len(sub_sitemaps)} sub-sitemaps to queue")
-                
-            elif '<urlset' in content_lower:
-                # Regular sitemap
-                urls = self.parse_sitemap(content, sitemap_url)
-                self.logger.info(f"Found {len(urls)} URLs in {sitemap_url}")
-                
-                for url_data in urls:
-                    # Add metadata
-                    url_data.update({
-                        'status_code': 200,  # Assumed from sitemap
-                        'content_type': 'text/html',  # Assumed
-                        'size': 0,  # Unknown from sitemap
-                    })
-                    all_urls[url_data['url']] = url_data
-                    
-            elif '<rss' in content_lower:
-                # RSS feed
-                self.logger.info(f"Found RSS feed at {sitemap_url}")
-                urls = self.parse_rss_feed(content, sitemap_url)
-                
-                for url_data in urls:
-                    url_data.update({
-                        'status_code': 200,
-                        'content_type': 'text/html',
-                        'size': 0,
-                    })
-                    all_urls[url_data['url']] = url_data
-                    
-            else:
-                # Try parsing anyway
-                urls = self.parse_sitemap(content, sitemap_url)
-                if urls:
-                    self.logger.info(f"Found {len(urls)} URLs using fallback parsing")
-                    for url_data in urls:
-                        url_data.update({
-                            'status_code': 200,
-                            'content_type': 'text/html',
-                            'size': 0,
-                        })
-                        all_urls[url_data['url']] = url_data
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for sub_sitemap in future.result():
+                        if sub_sitemap in processed_sitemaps or children_queued >= max_sitemaps:
+                            continue
+                        processed_sitemaps.add(sub_sitemap)
+                        children_queued += 1
+                        pending.add(executor.submit(self.process_sitemap, sub_sitemap, writer, all_urls))
         
-        # Filter URLs to only include those from the target domain
-        filtered_urls = {}
-        for url, data in all_urls.items():
-            parsed = urlparse(url)
-            if parsed.netloc == self.domain or parsed.netloc == f'www.{self.domain}' or parsed.netloc.endswith(f'.{self.domain}'):
-                filtered_urls[url] = data
-                
-        self.logger.info(f"Total unique URLs found: {len(filtered_urls)} (from {len(all_urls)} total)")
+        self.logger.info(f"Total unique URLs found: {len(all_urls)}")
         self.logger.info(f"Processed {len(processed_sitemaps)} sitemaps")
         
-        return filtered_urls
+        return all_urls
     
     def save_dump_csv(self, url_metadata: Dict[str, Dict]) -> None:
         """Save URL metadata to dump.csv."""
@@ -505,7 +387,6 @@ def main():
     url_metadata = crawler.crawl(max_sitemaps=max_sitemaps)
     
     if url_metadata:
-        crawler.save_dump_csv(url_metadata)
         print(f"\nEnhanced sitemap crawl complete! Found {len(url_metadata)} URLs")
         print(f"Results saved to: {crawler.output_file}")
         crawler.get_url_stats(url_metadata)
@@ -0,0 +1,179 @@
+"""
+Per-domain memory of which fetch method gets through.
+
+The multi-method crawlers (universal, ultra stealth) have an ordered list
+of fetch methods, from plain HTTP to full browsers. Without memory every
+URL walks that list from the top, so a site that only answers a browser
+costs four blocked requests per page. ``StrategyCache`` records, per
+domain and URL template, each method's decayed success rate and latency,
+and plans each fetch from that:
+
+* the method with the lowest expected time per success goes first
+* the other methods follow as fallbacks in list order, with methods known
+  to fail at the very end
+* every ``reprobe_every`` fetches of a template, one method that comes
+  earlier in the list than the current winner is tried first instead, so
+  a site that drops its bot wall is noticed
+* templates with nothing known to work yet use the domain-wide record
+
+Records persist as one JSON file per domain, so the next crawl of a site
+starts with what the last one learned.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+# Statuses that mean the method reached the site (the page may still not exist)
+ANSWERED_STATUSES = {200, 404, 410}
+
+# Decay for success rate and latency; recent fetches count most
+EWMA_ALPHA = 0.3
+
+# A method "works" for a template at or above this success rate
+WORKING_RATE = 0.5
+
+DOMAIN_KEY = '*'
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / 'fetch_strategies'
+
+
+def url_template(url: str) -> str:
+    """Coarse template key: the first path segment, plus ``/*`` if anything follows.
+
+    Bot protection is usually configured per site section, so
+    ``/product/123`` and ``/product/456/reviews`` share ``/product/*``
+    records while ``/search/*`` keeps its own.
+    """
+    start = url.find('://')
+    start = url.find('/', start + 3) if start >= 0 else 0
+    if start < 0:
+        return '/'
+    path = url[start:].split('?', 1)[0].split('#', 1)[0]
+    segments = [s for s in path.split('/') if s]
+    if not segments:
+        return '/'
+    head = '{id}' if segments[0].isdigit() else segments[0]
+    return '/' + '/'.join([head] + ['*'] * min(len(segments) - 1, 1))
+
+
+class MethodRecord:
+    """Decayed success rate and latency of one method on one template."""
+
+    __slots__ = ('attempts', 'success_rate', 'latency')
+
+    def __init__(self, attempts: int = 0, success_rate: float = 0.0,
+                 latency: Optional[float] = None):
+        self.attempts = attempts
+        self.success_rate = success_rate
+        self.latency = latency
+
+    def update(self, ok: bool, latency: float) -> None:
+        if self.attempts == 0:
+            self.success_rate = 1.0 if ok else 0.0
+        else:
+            self.success_rate += EWMA_ALPHA * ((1.0 if ok else 0.0) - self.success_rate)
+        if ok:
+            # Failures are often fast timeouts or block pages; only time real answers
+            self.latency = latency if self.latency is None else \
+                self.latency + EWMA_ALPHA * (latency - self.latency)
+        self.attempts += 1
+
+    @property
+    def works(self) -> bool:
+        return self.attempts > 0 and self.success_rate >= WORKING_RATE
+
+    @property
+    def cost(self) -> float:
+        """Expected seconds per successful fetch."""
+        return (self.latency or 1.0) / max(self.success_rate, 0.05)
+
+    def to_dict(self) -> Dict:
+        return {'attempts': self.attempts, 'success_rate': round(self.success_rate, 4),
+                'latency': None if self.latency is None else round(self.latency, 3)}
+
+
+class StrategyCache:
+    """Which fetch method to try first, per domain and URL template."""
+
+    def __init__(self, domain: str, methods: Iterable[str],
+                 cache_dir: Path = DEFAULT_CACHE_DIR, reprobe_every: int = 25):
+        self.domain = domain
+        self.methods = list(methods)
+        self.path = Path(cache_dir) / f'{domain}.json'
+        self.reprobe_every = reprobe_every
+        self.records: Dict[str, Dict[str, MethodRecord]] = {}
+        self.fetches: Dict[str, int] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for template, methods in data.get('templates', {}).items():
+            self.records[template] = {
+                name: MethodRecord(**record) for name, record in methods.items()
+                if name in self.methods
+            }
+        self.fetches = data.get('fetches', {})
+
+    def save(self) -> None:
+        """Write the records atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'domain': self.domain,
+            'fetches': self.fetches,
+            'templates': {
+                template: {name: record.to_dict() for name, record in methods.items()}
+                for template, methods in sorted(self.records.items())
+            },
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def plan(self, url: str) -> List[str]:
+        """Methods to try for ``url``, in order."""
+        template = url_template(url)
+        records = self.records.get(template, {})
+        best = self._best(records)
+        if best is None:
+            records = self.records.get(DOMAIN_KEY, {})
+            best = self._best(records)
+        if best is None:
+            # Nothing known to work here yet: the crawler's own order
+            return list(self.methods)
+
+        known_bad = {name for name, record in records.items() if not record.works}
+        fallbacks = sorted((name for name in self.methods if name != best),
+                           key=lambda name: (name in known_bad, self.methods.index(name)))
+        order = [best] + fallbacks
+
+        count = self.fetches.get(template, 0) + 1
+        self.fetches[template] = count
+        earlier = self.methods[:self.methods.index(best)]
+        if earlier and count % self.reprobe_every == 0:
+            probe = earlier[(count // self.reprobe_every) % len(earlier)]
+            order.remove(probe)
+            order.insert(0, probe)
+        return order
+
+    def record(self, url: str, method: str, status: Optional[int], latency: float) -> None:
+        """Fold one attempt into the template's and the domain's records."""
+        ok = status in ANSWERED_STATUSES
+        for key in (url_template(url), DOMAIN_KEY):
+            self.records.setdefault(key, {}).setdefault(method, MethodRecord()).update(ok, latency)
+
+    def _best(self, records: Dict[str, MethodRecord]) -> Optional[str]:
+        working = [name for name in self.methods if name in records and records[name].works]
+        if not working:
+            return None
+        return min(working, key=lambda name: records[name].cost)
+
+    def summary(self) -> Dict[str, str]:
+        """Current first choice per template."""
+        return {template: self._best(records) or 'none'
+                for template, records in sorted(self.records.items())}
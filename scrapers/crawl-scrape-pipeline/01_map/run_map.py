@@ -14,8 +14,10 @@ import argparse
 import csv
 import subprocess
 import sys
+from contextlib import ExitStack
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from urllib.parse import urlparse, urljoin
 from datetime import datetime
 
@@ -33,6 +35,8 @@ except ImportError:
 sys.path.append(str(Path(__file__).parent.parent))
 
 from orchestration.config import CRAWLER_CONFIG, STEPS
+from orchestration.frontier import Frontier, FrontierResults
+from orchestration.rate_control import RateController
 from orchestration.utils_minimal import normalize_url, is_valid_url, logger
 
 
@@ -197,7 +201,9 @@ class SiteMapper:
         # Make domain safe for filename - replace dots and slashes
         safe_domain = domain.replace('.', '_').replace('/', '_')
         self.output_file = Path(__file__).parent / f'{safe_domain}_{timestamp}.csv'
+        self.frontier_dir = Path(__file__).parent / 'frontier' / safe_domain
         self.url_metadata: Dict[str, Dict] = {}
+        self.rate_controller = RateController()
     
     def try_screaming_frog(self) -> bool:
         """Try to use Screaming Frog if available."""
@@ -265,20 +271,30 @@ class SiteMapper:
         # Disable SSL warnings for test sites
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         
-        # Use a simple BFS approach instead of Scrapy
-        visited_urls = set()
-        # Use custom start URLs if provided, otherwise use default
-        if hasattr(self, 'start_urls'):
-            to_visit = self.start_urls.copy()
+        # BFS over a persistent, disk-backed frontier so large maps run in
+        # bounded memory and resume after a crash; page results are stored
+        # in the frontier too, committed with the queue at each checkpoint
+        resuming = Frontier.exists(self.frontier_dir)
+        frontier = Frontier(self.frontier_dir)
+        
+        if resuming:
+            self.logger.info(f"Resuming crawl: {frontier.record_count()} pages done, {len(frontier)} URLs queued")
         else:
-            to_visit = [f'https://{self.domain}/', f'https://www.{self.domain}/']
+            # Use custom start URLs if provided, otherwise use default
+            if hasattr(self, 'start_urls'):
+                start_urls = self.start_urls
+            else:
+                start_urls = [f'https://{self.domain}/', f'https://www.{self.domain}/']
+            for start_url in start_urls:
+                frontier.add(start_url)
+        
         max_pages = self.max_pages  # Use configurable limit
-        pages_crawled = 0
+        pages_crawled = frontier.record_count()
+        checkpoint_interval = 100
+        last_checkpoint = pages_crawled
         
-        # Rate limit tracking
+        # Rate limit tracking; pacing itself is handled by self.rate_controller
         rate_limit_count = 0
-        consecutive_success = 0
-        base_delay = 0.3  # Start with fast crawling
         
         # Track URL types for better crawling strategy
         url_types = {
@@ -341,19 +357,10 @@ class SiteMapper:
                     return False
             return True
         
-        while to_visit and pages_crawled < max_pages:
-            url = to_visit.pop(0)
-            
-            # Skip URLs with only anchor differences
-            url_without_anchor = url.split('#')[0]
-            if url_without_anchor in visited_urls:
-                continue
-            
-            if url in visited_urls:
-                continue
-                
-            visited_urls.add(url)
-            visited_urls.add(url_without_anchor)  # Also mark base URL as visited
+        while pages_crawled < max_pages:
+            url = frontier.pop()
+            if url is None:
+                break
             
             try:
                 self.logger.info(f"Fetching: {url}")
@@ -368,13 +375,16 @@ class SiteMapper:
                         import random
                         session.headers['User-Agent'] = random.choice(user_agents)
                         
+                        self.rate_controller.acquire(url)
                         response = session.get(url, timeout=30, allow_redirects=True, verify=False)
+                        self.rate_controller.record(url, response.status_code,
+                                                    response.elapsed.total_seconds(), response.headers)
                         
-                        # Handle rate limiting
+                        # Handle rate limiting; the controller backs off and
+                        # honours Retry-After before the next acquire()
                         if response.status_code == 429:
-                            retry_after = int(response.headers.get('Retry-After', 2 ** retry_count))
-                            self.logger.warning(f"Rate limited on {url}, waiting {retry_after} seconds (attempt {retry_count + 1}/{max_retries})")
-                            time.sleep(retry_after)
+                            rate_limit_count += 1
+                            self.logger.warning(f"Rate limited on {url}, now {self.rate_controller.current_rate(url):.2f} req/s (attempt {retry_count + 1}/{max_retries})")
                             retry_count += 1
                             continue
                         else:
@@ -383,6 +393,7 @@ class SiteMapper:
                             
                     except requests.exceptions.RequestException as e:
                         self.logger.error(f"Request error for {url}: {e}")
+                        self.rate_controller.record(url, 0)
                         if retry_count < max_retries - 1:
                             wait_time = 2 ** retry_count
                             self.logger.info(f"Retrying after {wait_time} seconds...")
@@ -447,7 +458,7 @@ class SiteMapper:
                     except Exception as e:
                         self.logger.warning(f"Error extracting page metadata: {e}")
                 
-                self.url_metadata[url] = metadata
+                frontier.record(url, metadata)
                 
                 self.logger.info(f"Parsed {url} - Status: {response.status_code}, Type: {content_type}, Size: {size}")
                 
@@ -540,27 +551,25 @@ class SiteMapper:
                                 self.logger.debug(f"Skipping JavaScript template URL: {discovered_url}")
                                 continue
                             
-                            # Only follow links on same domain
-                            if (is_same_domain(parsed.netloc) and 
-                                discovered_url not in visited_urls and 
-                                discovered_url not in to_visit):
-                                # Prioritize product pages by adding them to front of queue
-                                if '/product/' in discovered_url or '/motorcycle/' in discovered_url:
-                                    to_visit.insert(0, discovered_url)
-                                else:
-                                    to_visit.append(discovered_url)
-                                links_added += 1
+                            # Only follow links on same domain; the frontier
+                            # drops anything already seen (ignoring anchors)
+                            if is_same_domain(parsed.netloc):
+                                # Prioritize product pages
+                                priority = 0 if ('/product/' in discovered_url or '/motorcycle/' in discovered_url) else 1
+                                if frontier.add(discovered_url.split('#')[0], priority):
+                                    links_added += 1
                         
                         self.logger.info(f"Found {len(discovered_urls)} URLs on {url}, added {links_added} new URLs to queue")
-                        self.logger.info(f"Queue now has {len(to_visit)} URLs remaining")
+                        self.logger.info(f"Queue now has {len(frontier)} URLs remaining")
                         
                         # Progress tracking for large crawls
                         if pages_crawled % 100 == 0:
                             self.logger.info(f"\n📊 Progress: {pages_crawled}/{max_pages} pages crawled")
-                            self.logger.info(f"   URLs discovered: {len(visited_urls) + len(to_visit)}")
+                            self.logger.info(f"   URLs discovered: {frontier.seen_count}")
                             self.logger.info(f"   Success rate: {(pages_crawled - rate_limit_count) / pages_crawled * 100:.1f}%")
                             self.logger.info(f"   Product pages: {len(set(url_types['product_pages']))}")
                             self.logger.info(f"   Category pages: {len(set(url_types['category_pages']))}")
+                            self.logger.info(f"   Crawl rate: {self.rate_controller.current_rate(url):.2f} req/s")
                         
                         # Log URL type discoveries
                         if url_types['product_pages']:
@@ -571,38 +580,32 @@ class SiteMapper:
                     except Exception as e:
                         self.logger.warning(f"Error parsing HTML for {url}: {e}")
                 
-                # Dynamic rate limiting based on response
-                if response.status_code == 429:
-                    # Track rate limits
-                    rate_limit_count += 1
-                    consecutive_success = 0
-                    base_delay = min(base_delay * 2, 5)  # Double delay up to 5 seconds
-                    self.logger.warning(f"Rate limit count: {rate_limit_count}, new base delay: {base_delay}s")
-                    time.sleep(base_delay)
-                elif 200 <= response.status_code < 300:
-                    # Success, track consecutive successes
-                    consecutive_success += 1
-                    if consecutive_success > 10 and base_delay > 0.3:
-                        # Gradually speed up after consistent success
-                        base_delay = max(base_delay * 0.8, 0.3)
-                        self.logger.info(f"Speeding up, new base delay: {base_delay}s")
-                    time.sleep(base_delay)
-                else:
-                    # Other errors, use standard delay
-                    time.sleep(base_delay)
-                
             except Exception as e:
                 self.logger.error(f"Error fetching {url}: {e}")
                 # Still record the failed URL
-                self.url_metadata[url] = {
+                frontier.record(url, {
                     'url': url,
                     'status_code': 0,
                     'content_type': 'error',
                     'size': 0,
                     'last_modified': ''
-                }
-        
-        self.logger.info(f"Crawl complete. Found {len(self.url_metadata)} URLs with metadata")
+                })
+            
+            # Checkpoint only once the page's outlinks are queued; the read
+            # offset moves past it, so anything it found must be committed too
+            if pages_crawled - last_checkpoint >= checkpoint_interval:
+                frontier.checkpoint()
+                last_checkpoint = pages_crawled
+        
+        # Crawl finished; the queue is dropped but results stay on disk and
+        # are read back through a mapping view instead of a dict
+        frontier.finish()
+        if frontier.record_count():
+            self.url_metadata = frontier.results()
+        
+        self.logger.info(f"Crawl complete. Found {frontier.record_count()} URLs with metadata")
+        for host, host_stats in self.rate_controller.metrics().items():
+            self.logger.info(f"  {host}: {host_stats['rate']:.2f} req/s after {host_stats['requests']} requests, {host_stats['throttled']} throttled")
     
     def crawl_with_scrapy(self) -> None:
         """Crawl website using Scrapy framework."""
@@ -638,44 +641,50 @@ class SiteMapper:
             else:
                 self.logger.error("Spider did not collect any metadata")
     
+    def sorted_metadata(self) -> Iterator[Dict]:
+        """URL metadata in URL order."""
+        if isinstance(self.url_metadata, FrontierResults):
+            # Disk-backed results come out of their index already sorted
+            return self.url_metadata.values()
+        return (self.url_metadata[url] for url in sorted(self.url_metadata))
+    
     def save_dump_csv(self) -> None:
-        """Save URL metadata to dump.csv."""
-        if not self.url_metadata:
+        """Save URL metadata to dump.csv, streaming it in URL order."""
+        records = self.sorted_metadata()
+        sample_metadata = next(records, None)
+        if sample_metadata is None:
             self.logger.error("No URLs found!")
             return
         
-        # Sort URLs
-        sorted_urls = sorted(self.url_metadata.keys())
-        
         # Determine which fields to include based on available data
         basic_fields = ['url', 'status_code', 'content_type', 'size', 'last_modified']
         
-        # Check if we have enhanced metadata
-        sample_metadata = next(iter(self.url_metadata.values()))
-        if 'page_title' in sample_metadata:
-            # Save enhanced metadata CSV
-            enhanced_file = self.output_file.parent / f'{self.output_file.stem}_enhanced.csv'
-            with open(enhanced_file, 'w', newline='', encoding='utf-8') as f:
-                all_fields = list(sample_metadata.keys())
-                writer = csv.DictWriter(f, fieldnames=all_fields, extrasaction='ignore')
-                writer.writeheader()
-                
-                for url in sorted_urls:
-                    writer.writerow(self.url_metadata[url])
-            
-            self.logger.info(f"Saved enhanced metadata to {enhanced_file}")
-        
-        # Always save basic dump.csv for compatibility
-        with open(self.output_file, 'w', newline='', encoding='utf-8') as f:
+        with ExitStack() as stack:
+            # Always save basic dump.csv for compatibility; missing fields are left blank
+            f = stack.enter_context(open(self.output_file, 'w', newline='', encoding='utf-8'))
             writer = csv.DictWriter(f, fieldnames=basic_fields, extrasaction='ignore')
             writer.writeheader()
             
-            for url in sorted_urls:
-                # Extract only basic fields
-                basic_data = {k: self.url_metadata[url].get(k, '') for k in basic_fields}
-                writer.writerow(basic_data)
-        
-        self.logger.info(f"Saved {len(sorted_urls)} URLs to {self.output_file}")
+            # Check if we have enhanced metadata
+            enhanced_writer = None
+            if 'page_title' in sample_metadata:
+                # Save enhanced metadata CSV in the same pass
+                enhanced_file = self.output_file.parent / f'{self.output_file.stem}_enhanced.csv'
+                ef = stack.enter_context(open(enhanced_file, 'w', newline='', encoding='utf-8'))
+                all_fields = list(sample_metadata.keys())
+                enhanced_writer = csv.DictWriter(ef, fieldnames=all_fields, extrasaction='ignore')
+                enhanced_writer.writeheader()
+            
+            saved = 0
+            for metadata in chain([sample_metadata], records):
+                writer.writerow(metadata)
+                if enhanced_writer is not None:
+                    enhanced_writer.writerow(metadata)
+                saved += 1
+        
+        if enhanced_writer is not None:
+            self.logger.info(f"Saved enhanced metadata to {enhanced_file}")
+        self.logger.info(f"Saved {saved} URLs to {self.output_file}")
     
     def run(self, methods: List[str] = None) -> Dict[str, Dict]:
         """Run site mapping using specified methods."""
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Streaming sitemap parsing shared by the sitemap-based mappers.
+
+Sitemaps are read straight off the HTTP response: transfer encoding and
+``.gz`` payloads are decompressed on the fly and the XML is consumed with
+``iterparse``, so a 50k-URL (or 50 MB) sitemap never has to sit in memory
+as a string or a full element tree. Parsed URLs go to ``DumpWriter``,
+which appends them to dump.csv as they arrive.
+"""
+
+import csv
+import gzip
+import io
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+from urllib.parse import urljoin
+
+
+DUMP_FIELDS = ['url', 'status_code', 'content_type', 'size', 'last_modified']
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_sitemap_stream(response) -> io.BufferedReader:
+    """Return a buffered, decompressing reader over a streamed response.
+
+    ``response`` is a requests response fetched with ``stream=True``.
+    """
+    raw = response.raw
+    # Let urllib3 undo Content-Encoding: gzip/deflate while reading
+    raw.decode_content = True
+    stream = io.BufferedReader(raw)
+
+    # .gz sitemaps are gzip files served as-is; go by the magic bytes
+    # rather than the extension, which some servers drop or add wrongly
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+
+    return stream
+
+
+def sniff(stream: io.BufferedReader, size: int = 1024) -> str:
+    """Peek at the start of a stream without consuming it."""
+    return stream.peek(size)[:size].decode('utf-8', errors='ignore').lstrip('\ufeff \t\r\n').lower()
+
+
+def looks_like_html(head: str) -> bool:
+    """Soft-404 pages and bot walls come back as HTML with status 200."""
+    return head.startswith('<!doctype html') or head.startswith('<html')
+
+
+def _local(tag: str) -> str:
+    """Strip the XML namespace from a tag name."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _absolute(loc: str, base_url: str) -> str:
+    # urljoin is comparatively slow; sitemap locations are almost always absolute
+    return loc if loc.startswith(('http://', 'https://')) else urljoin(base_url, loc)
+
+
+def _child_text(elem: ET.Element, name: str) -> str:
+    for child in elem:
+        if _local(child.tag) == name and child.text:
+            return child.text.strip()
+    return ''
+
+
+def iter_sitemap_entries(stream, base_url: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Incrementally parse a sitemap, sitemap index or RSS feed.
+
+    Yields ``('sitemap', {'url': ...})`` for sitemap index entries and
+    ``('url', {...})`` for page URLs. Namespace variants (http/https
+    sitemaps.org, none) are handled by matching local tag names. Elements
+    are cleared as soon as they are consumed so memory stays flat.
+
+    Raises:
+        ET.ParseError: if the document is not well-formed XML
+    """
+    context = ET.iterparse(stream, events=('start', 'end'))
+    root = None
+
+    for event, elem in context:
+        if root is None:
+            root = elem
+            continue
+        if event != 'end':
+            continue
+
+        tag = _local(elem.tag)
+        if tag == 'sitemap':
+            loc = _child_text(elem, 'loc')
+            if loc:
+                yield 'sitemap', {'url': _absolute(loc, base_url)}
+        elif tag == 'url':
+            loc = _child_text(elem, 'loc')
+            if loc:
+                yield 'url', {
+                    'url': _absolute(loc, base_url),
+                    'last_modified': _child_text(elem, 'lastmod'),
+                    'changefreq': _child_text(elem, 'changefreq'),
+                    'priority': _child_text(elem, 'priority'),
+                }
+        elif tag == 'item':
+            # RSS feed entry
+            link = _child_text(elem, 'link')
+            if link:
+                yield 'url', {
+                    'url': _absolute(link, base_url),
+                    'last_modified': _child_text(elem, 'pubDate'),
+                    'changefreq': '',
+                    'priority': '',
+                }
+        else:
+            continue
+
+        # Drop the processed entry (and anything accumulated under the root)
+        elem.clear()
+        root.clear()
+
+
+class DumpWriter:
+    """Thread-safe, deduplicating incremental writer for dump.csv."""
+
+    def __init__(self, output_file: Path, fieldnames=DUMP_FIELDS):
+        self.output_file = output_file
+        self.seen = set()
+        self._lock = threading.Lock()
+        self._fh = open(output_file, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._fh, fieldnames=fieldnames, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, url_data: Dict[str, Any]) -> bool:
+        """Write a row unless its URL was already written; returns True if new."""
+        with self._lock:
+            if url_data['url'] in self.seen:
+                return False
+            self.seen.add(url_data['url'])
+            self._writer.writerow(url_data)
+            return True
+
+    def __len__(self) -> int:
+        return len(self.seen)
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+    def __enter__(self) -> 'DumpWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
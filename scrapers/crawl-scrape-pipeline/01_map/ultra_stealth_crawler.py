@@ -22,6 +22,8 @@ import base64
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 from orchestration.utils_minimal import normalize_url, is_valid_url, logger
+from orchestration.browser_pool import BrowserPool, PLAYWRIGHT_AVAILABLE
+from fetch_strategy import StrategyCache, ANSWERED_STATUSES
 
 # Advanced HTTP libraries
 try:
@@ -42,12 +44,13 @@ except ImportError:
     HAS_UNDETECTED = False
     logger.warning("undetected-chromedriver not installed - install with: pip install undetected-chromedriver")
 
+# Playwright itself is driven by the browser pool; stealth patches its pages
 try:
-    from playwright.async_api import async_playwright
     from playwright_stealth import stealth_async
-    HAS_PLAYWRIGHT = True
+    HAS_PLAYWRIGHT = PLAYWRIGHT_AVAILABLE
 except ImportError:
     HAS_PLAYWRIGHT = False
+if not HAS_PLAYWRIGHT:
     logger.warning("playwright not installed - install with: pip install playwright playwright-stealth && playwright install")
 
 try:
@@ -65,12 +68,181 @@ except ImportError:
     logger.warning("httpx not installed - install with: pip install httpx[http2]")
 
 # Standard imports
-import requests
 from bs4 import BeautifulSoup
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+# Chromium flags for the ultra-stealth browser
+ULTRA_STEALTH_LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-features=IsolateOrigins,site-per-process',
+    '--disable-site-isolation-trials',
+    '--disable-web-security',
+    '--disable-features=CrossSiteDocumentBlockingAlways,CrossSiteDocumentBlockingIfIsolating',
+    '--disable-features=ImprovedCookieControls,LazyFrameLoading,GlobalMediaControls,DestroyProfileOnBrowserClose',
+    '--disable-features=AudioServiceOutOfProcess,AudioServiceSandbox',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--single-process',
+    '--disable-gpu',
+    '--window-size=1920,1080',
+    '--start-maximized',
+]
+
+# Injected once into every browser context
+ULTRA_STEALTH_SCRIPT = """
+    // Advanced webdriver detection bypass
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+    
+    // Chrome object with all properties
+    window.chrome = {
+        runtime: {
+            connect: () => {},
+            sendMessage: () => {},
+            onMessage: { addListener: () => {} }
+        },
+        loadTimes: function() {
+            return {
+                commitLoadTime: Date.now() / 1000 - Math.random() * 10,
+                connectionInfo: 'http/1.1',
+                finishDocumentLoadTime: Date.now() / 1000,
+                finishLoadTime: Date.now() / 1000,
+                firstPaintAfterLoadTime: 0,
+                firstPaintTime: Date.now() / 1000 - Math.random() * 0.5,
+                navigationType: 'Other',
+                npnNegotiatedProtocol: 'http/1.1',
+                requestTime: Date.now() / 1000 - Math.random() * 20,
+                startLoadTime: Date.now() / 1000 - Math.random() * 15,
+                wasAlternateProtocolAvailable: false,
+                wasFetchedViaSpdy: false,
+                wasNpnNegotiated: true
+            };
+        },
+        csi: function() { return { onloadT: Date.now(), pageT: Date.now() - 500, startE: Date.now() - 1000, tran: 15 }; },
+        app: {
+            isInstalled: false,
+            getDetails: () => null,
+            getIsInstalled: () => false,
+            runningState: () => 'running'
+        }
+    };
+    
+    // Perfect plugins array
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => {
+            return [
+                {
+                    0: {type: "application/x-google-chrome-pdf", suffixes: "pdf", description: "Portable Document Format", enabledPlugin: Plugin},
+                    description: "Portable Document Format",
+                    filename: "internal-pdf-viewer",
+                    length: 1,
+                    name: "Chrome PDF Plugin"
+                },
+                {
+                    0: {type: "application/pdf", suffixes: "pdf", description: "", enabledPlugin: Plugin},
+                    description: "",
+                    filename: "mhjfbmdgcfjbbpaeojofohoefgiehjai",
+                    length: 1,
+                    name: "Chrome PDF Viewer"
+                },
+                {
+                    0: {type: "application/x-nacl", suffixes: "", description: "Native Client Executable", enabledPlugin: Plugin},
+                    1: {type: "application/x-pnacl", suffixes: "", description: "Portable Native Client Executable", enabledPlugin: Plugin},
+                    description: "",
+                    filename: "internal-nacl-plugin",
+                    length: 2,
+                    name: "Native Client"
+                }
+            ];
+        }
+    });
+    
+    // Canvas fingerprinting protection
+    const originalGetContext = HTMLCanvasElement.prototype.getContext;
+    HTMLCanvasElement.prototype.getContext = function(type, attributes) {
+        if (type === '2d') {
+            const context = originalGetContext.call(this, type, attributes);
+            const originalGetImageData = context.getImageData;
+            context.getImageData = function(x, y, width, height) {
+                const imageData = originalGetImageData.call(this, x, y, width, height);
+                for (let i = 0; i < imageData.data.length; i += 4) {
+                    imageData.data[i] = imageData.data[i] ^ (Math.random() * 0.1);
+                    imageData.data[i + 1] = imageData.data[i + 1] ^ (Math.random() * 0.1);
+                    imageData.data[i + 2] = imageData.data[i + 2] ^ (Math.random() * 0.1);
+                }
+                return imageData;
+            };
+            return context;
+        }
+        return originalGetContext.call(this, type, attributes);
+    };
+    
+    // WebGL fingerprinting protection
+    const getParameter = WebGLRenderingContext.prototype.getParameter;
+    WebGLRenderingContext.prototype.getParameter = function(parameter) {
+        if (parameter === 37445) {
+            return 'Intel Inc.';
+        }
+        if (parameter === 37446) {
+            return 'Intel Iris OpenGL Engine';
+        }
+        return getParameter.call(this, parameter);
+    };
+    
+    // Battery API protection
+    if (navigator.getBattery) {
+        navigator.getBattery = () => Promise.resolve({
+            charging: true,
+            chargingTime: 0,
+            dischargingTime: Infinity,
+            level: 1
+        });
+    }
+    
+    // Remove automation indicators
+    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Array;
+    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Promise;
+    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Symbol;
+    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Object;
+    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Proxy;
+    
+    // Notification permission
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: 'prompt' }) :
+            originalQuery(parameters)
+    );
+    
+    // Languages perfect match
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['en-US', 'en']
+    });
+    
+    // Hardware concurrency
+    Object.defineProperty(navigator, 'hardwareConcurrency', {
+        get: () => 8
+    });
+    
+    // Device memory
+    Object.defineProperty(navigator, 'deviceMemory', {
+        get: () => 8
+    });
+    
+    // Platform
+    Object.defineProperty(navigator, 'platform', {
+        get: () => 'Win32'
+    });
+"""
+
+
 class UltraStealthCrawler:
     """The most advanced crawler that bypasses any anti-bot system."""
     
@@ -85,12 +257,29 @@ class UltraStealthCrawler:
         # Statistics
         self.stats = {
             'total_attempts': 0,
+            'requests_sent': 0,
             'success_200': 0,
             'failed_attempts': 0,
             'methods_used': {},
             'status_codes': {}
         }
         
+        # Installed methods, ordered by effectiveness against anti-bot systems;
+        # the strategy cache learns which one each section of the site needs
+        self.methods = {}
+        if HAS_CURL_CFFI:
+            self.methods['curl_cffi'] = self.method_1_curl_cffi
+        if HAS_PLAYWRIGHT:
+            self.methods['playwright_ultra_stealth'] = self.method_2_playwright_ultra_stealth
+        if HAS_CLOUDSCRAPER:
+            self.methods['cloudscraper_advanced'] = self.method_4_cloudscraper_advanced
+        if HAS_HTTPX:
+            self.methods['httpx_http2_advanced'] = self.method_5_httpx_http2_advanced
+        if HAS_UNDETECTED:
+            self.methods['undetected_chrome_advanced'] = self.method_3_undetected_chrome_advanced
+        self.strategy = StrategyCache(domain, self.methods)
+        self.browser_pool: Optional[BrowserPool] = None
+        
         # Browser profiles for curl-cffi
         self.browser_profiles = [
             "chrome110", "chrome107", "chrome104", "chrome101", "chrome100",
@@ -202,216 +391,50 @@ class UltraStealthCrawler:
                 'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                 'size': len(response.content),
                 'last_modified': response.headers.get('last-modified', ''),
-                'method': f'curl_cffi_{impersonate}'
+                'method': f'curl_cffi_{impersonate}',
+                'html': response.text,
             }
         except Exception as e:
             logger.debug(f"curl-cffi failed for {url}: {e}")
             return None
     
+    async def get_browser_pool(self) -> BrowserPool:
+        """Browser pool for the Playwright method, launched on first use."""
+        if self.browser_pool is None:
+            self.browser_pool = BrowserPool(
+                size=1,
+                contexts_per_browser=1,
+                context_options=lambda: {
+                    'viewport': {'width': 1920, 'height': 1080},
+                    'screen': {'width': 1920, 'height': 1080},
+                    'user_agent': random.choice(self.user_agents),
+                    'locale': 'en-US',
+                    'timezone_id': 'America/New_York',
+                    'permissions': ['geolocation', 'notifications'],
+                    'geolocation': {'latitude': 40.7128, 'longitude': -74.0060},
+                    'color_scheme': 'light',
+                    'device_scale_factor': 1,
+                    'has_touch': False,
+                    'java_script_enabled': True,
+                    'bypass_csp': True,
+                    'ignore_https_errors': True,
+                },
+                init_scripts=[ULTRA_STEALTH_SCRIPT],
+                # Stealth patches once per page, which the pool then reuses
+                page_setup=stealth_async if HAS_PLAYWRIGHT else None,
+                launch_args=ULTRA_STEALTH_LAUNCH_ARGS,
+            )
+            await self.browser_pool.start()
+        return self.browser_pool
+    
     async def method_2_playwright_ultra_stealth(self, url: str) -> Optional[Dict]:
-        """Method 2: Playwright with ultra stealth patches."""
+        """Method 2: Playwright with ultra stealth patches (pooled browser and contexts)."""
         if not HAS_PLAYWRIGHT:
             return None
             
         try:
-            async with async_playwright() as p:
-                # Launch with advanced anti-detection
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--disable-blink-features=AutomationControlled',
-                        '--disable-features=IsolateOrigins,site-per-process',
-                        '--disable-site-isolation-trials',
-                        '--disable-web-security',
-                        '--disable-features=CrossSiteDocumentBlockingAlways,CrossSiteDocumentBlockingIfIsolating',
-                        '--disable-features=ImprovedCookieControls,LazyFrameLoading,GlobalMediaControls,DestroyProfileOnBrowserClose',
-                        '--disable-features=AudioServiceOutOfProcess,AudioServiceSandbox',
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-accelerated-2d-canvas',
-                        '--no-first-run',
-                        '--no-zygote',
-                        '--single-process',
-                        '--disable-gpu',
-                        '--window-size=1920,1080',
-                        '--start-maximized',
-                    ],
-                )
-                
-                # Create context with perfect fingerprinting
-                context = await browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    screen={'width': 1920, 'height': 1080},
-                    user_agent=random.choice(self.user_agents),
-                    locale='en-US',
-                    timezone_id='America/New_York',
-                    permissions=['geolocation', 'notifications'],
-                    geolocation={'latitude': 40.7128, 'longitude': -74.0060},
-                    color_scheme='light',
-                    device_scale_factor=1,
-                    has_touch=False,
-                    java_script_enabled=True,
-                    bypass_csp=True,
-                    ignore_https_errors=True,
-                )
-                
-                # Add advanced stealth scripts
-                await context.add_init_script("""
-                    // Advanced webdriver detection bypass
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    });
-                    
-                    // Chrome object with all properties
-                    window.chrome = {
-                        runtime: {
-                            connect: () => {},
-                            sendMessage: () => {},
-                            onMessage: { addListener: () => {} }
-                        },
-                        loadTimes: function() {
-                            return {
-                                commitLoadTime: Date.now() / 1000 - Math.random() * 10,
-                                connectionInfo: 'http/1.1',
-                                finishDocumentLoadTime: Date.now() / 1000,
-                                finishLoadTime: Date.now() / 1000,
-                                firstPaintAfterLoadTime: 0,
-                                firstPaintTime: Date.now() / 1000 - Math.random() * 0.5,
-                                navigationType: 'Other',
-                                npnNegotiatedProtocol: 'http/1.1',
-                                requestTime: Date.now() / 1000 - Math.random() * 20,
-                                startLoadTime: Date.now() / 1000 - Math.random() * 15,
-                                wasAlternateProtocolAvailable: false,
-                                wasFetchedViaSpdy: false,
-                                wasNpnNegotiated: true
-                            };
-                        },
-                        csi: function() { return { onloadT: Date.now(), pageT: Date.now() - 500, startE: Date.now() - 1000, tran: 15 }; },
-                        app: {
-                            isInstalled: false,
-                            getDetails: () => null,
-                            getIsInstalled: () => false,
-                            runningState: () => 'running'
-                        }
-                    };
-                    
-                    // Perfect plugins array
-                    Object.defineProperty(navigator, 'plugins', {
-                        get: () => {
-                            return [
-                                {
-                                    0: {type: "application/x-google-chrome-pdf", suffixes: "pdf", description: "Portable Document Format", enabledPlugin: Plugin},
-                                    description: "Portable Document Format",
-                                    filename: "internal-pdf-viewer",
-                                    length: 1,
-                                    name: "Chrome PDF Plugin"
-                                },
-                                {
-                                    0: {type: "application/pdf", suffixes: "pdf", description: "", enabledPlugin: Plugin},
-                                    description: "",
-                                    filename: "mhjfbmdgcfjbbpaeojofohoefgiehjai",
-                                    length: 1,
-                                    name: "Chrome PDF Viewer"
-                                },
-                                {
-                                    0: {type: "application/x-nacl", suffixes: "", description: "Native Client Executable", enabledPlugin: Plugin},
-                                    1: {type: "application/x-pnacl", suffixes: "", description: "Portable Native Client Executable", enabledPlugin: Plugin},
-                                    description: "",
-                                    filename: "internal-nacl-plugin",
-                                    length: 2,
-                                    name: "Native Client"
-                                }
-                            ];
-                        }
-                    });
-                    
-                    // Canvas fingerprinting protection
-                    const originalGetContext = HTMLCanvasElement.prototype.getContext;
-                    HTMLCanvasElement.prototype.getContext = function(type, attributes) {
-                        if (type === '2d') {
-                            const context = originalGetContext.call(this, type, attributes);
-                            const originalGetImageData = context.getImageData;
-                            context.getImageData = function(x, y, width, height) {
-                                const imageData = originalGetImageData.call(this, x, y, width, height);
-                                for (let i = 0; i < imageData.data.length; i += 4) {
-                                    imageData.data[i] = imageData.data[i] ^ (Math.random() * 0.1);
-                                    imageData.data[i + 1] = imageData.data[i + 1] ^ (Math.random() * 0.1);
-                                    imageData.data[i + 2] = imageData.data[i + 2] ^ (Math.random() * 0.1);
-                                }
-                                return imageData;
-                            };
-                            return context;
-                        }
-                        return originalGetContext.call(this, type, attributes);
-                    };
-                    
-                    // WebGL fingerprinting protection
-                    const getParameter = WebGLRenderingContext.prototype.getParameter;
-                    WebGLRenderingContext.prototype.getParameter = function(parameter) {
-                        if (parameter === 37445) {
-                            return 'Intel Inc.';
-                        }
-                        if (parameter === 37446) {
-                            return 'Intel Iris OpenGL Engine';
-                        }
-                        return getParameter.call(this, parameter);
-                    };
-                    
-                    // Battery API protection
-                    if (navigator.getBattery) {
-                        navigator.getBattery = () => Promise.resolve({
-                            charging: true,
-                            chargingTime: 0,
-                            dischargingTime: Infinity,
-                            level: 1
-                        });
-                    }
-                    
-                    // Remove automation indicators
-                    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Array;
-                    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Promise;
-                    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Symbol;
-                    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Object;
-                    delete window.cdc_adoQpoasnfa76pfcZLmcfl_Proxy;
-                    
-                    // Notification permission
-                    const originalQuery = window.navigator.permissions.query;
-                    window.navigator.permissions.query = (parameters) => (
-                        parameters.name === 'notifications' ?
-                            Promise.resolve({ state: 'prompt' }) :
-                            originalQuery(parameters)
-                    );
-                    
-                    // Languages perfect match
-                    Object.defineProperty(navigator, 'languages', {
-                        get: () => ['en-US', 'en']
-                    });
-                    
-                    // Hardware concurrency
-                    Object.defineProperty(navigator, 'hardwareConcurrency', {
-                        get: () => 8
-                    });
-                    
-                    // Device memory
-                    Object.defineProperty(navigator, 'deviceMemory', {
-                        get: () => 8
-                    });
-                    
-                    // Platform
-                    Object.defineProperty(navigator, 'platform', {
-                        get: () => 'Win32'
-                    });
-                """)
-                
-                # Apply stealth patches if available
-                try:
-                    page = await context.new_page()
-                    if 'stealth_async' in globals():
-                        await stealth_async(page)
-                except:
-                    page = await context.new_page()
-                
+            pool = await self.get_browser_pool()
+            async with pool.page() as page:
                 # Human-like behavior before navigation
                 await page.mouse.move(random.randint(100, 800), random.randint(100, 600))
                 await asyncio.sleep(random.uniform(0.1, 0.3))
@@ -450,19 +473,18 @@ class UltraStealthCrawler:
                 content = await page.content()
                 
                 # Extract cookies for session persistence
-                cookies = await context.cookies()
+                cookies = await page.context.cookies()
                 for cookie in cookies:
                     self.session_cookies[cookie['name']] = cookie['value']
                 
-                await browser.close()
-                
                 return {
                     'url': url,
                     'status_code': response.status if response else 0,
                     'content_type': 'text/html',
                     'size': len(content),
                     'last_modified': '',
-                    'method': 'playwright_ultra_stealth'
+                    'method': 'playwright_ultra_stealth',
+                    'html': content,
                 }
         except Exception as e:
             logger.debug(f"Playwright ultra stealth failed for {url}: {e}")
@@ -576,7 +598,8 @@ class UltraStealthCrawler:
                 'content_type': 'text/html',
                 'size': len(content),
                 'last_modified': '',
-                'method': 'undetected_chrome_advanced'
+                'method': 'undetected_chrome_advanced',
+                'html': content,
             }
         except Exception as e:
             logger.debug(f"Undetected Chrome advanced failed for {url}: {e}")
@@ -627,7 +650,8 @@ class UltraStealthCrawler:
                 'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                 'size': len(response.content),
                 'last_modified': response.headers.get('last-modified', ''),
-                'method': 'cloudscraper_advanced'
+                'method': 'cloudscraper_advanced',
+                'html': response.text,
             }
         except Exception as e:
             logger.debug(f"CloudScraper advanced failed for {url}: {e}")
@@ -666,50 +690,39 @@ class UltraStealthCrawler:
                     'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                     'size': len(response.content),
                     'last_modified': response.headers.get('last-modified', ''),
-                    'method': 'httpx_http2_advanced'
+                    'method': 'httpx_http2_advanced',
+                    'html': response.text,
                 }
         except Exception as e:
             logger.debug(f"HTTPX HTTP/2 advanced failed for {url}: {e}")
             return None
     
     async def fetch_url_ultra_stealth(self, url: str) -> Dict:
-        """Try all ultra-stealth methods until one succeeds."""
+        """Try ultra-stealth methods in the strategy cache's order until one gets an answer."""
         self.stats['total_attempts'] += 1
         
-        # Ordered by effectiveness against anti-bot systems
-        methods = [
-            ('curl_cffi', self.method_1_curl_cffi),
-            ('playwright_ultra_stealth', self.method_2_playwright_ultra_stealth),
-            ('cloudscraper_advanced', self.method_4_cloudscraper_advanced),
-            ('httpx_http2_advanced', self.method_5_httpx_http2_advanced),
-        ]
-        
-        # Try async methods first
-        for method_name, method_func in methods:
+        for method_name in self.strategy.plan(url):
             logger.info(f"Trying {method_name} for {url}")
             
-            result = await method_func(url)
+            start = time.time()
+            result = await self.methods[method_name](url)
+            status = result['status_code'] if result else None
+            self.strategy.record(url, method_name, status, time.time() - start)
+            self.stats['requests_sent'] += 1
             
-            if result and result['status_code'] == 200:
+            if status == 200:
                 self.stats['success_200'] += 1
                 self.stats['methods_used'][method_name] = self.stats['methods_used'].get(method_name, 0) + 1
                 logger.info(f"✓ SUCCESS: {method_name} got 200 for {url}")
                 return result
             elif result:
-                status = result['status_code']
                 self.stats['status_codes'][status] = self.stats['status_codes'].get(status, 0) + 1
+                if status in ANSWERED_STATUSES:
+                    # The page is gone; other methods would only confirm it
+                    logger.info(f"{method_name} got {status} for {url}")
+                    return result
                 logger.warning(f"✗ {method_name} got {status} for {url}")
         
-        # Last resort: undetected chrome (synchronous)
-        if HAS_UNDETECTED:
-            logger.info(f"Trying undetected_chrome_advanced for {url}")
-            result = await self.method_3_undetected_chrome_advanced(url)
-            if result and result['status_code'] == 200:
-                self.stats['success_200'] += 1
-                self.stats['methods_used']['undetected_chrome_advanced'] = self.stats['methods_used'].get('undetected_chrome_advanced', 0) + 1
-                logger.info(f"✓ SUCCESS: undetected_chrome_advanced got 200 for {url}")
-                return result
-        
         # All methods failed
         self.stats['failed_attempts'] += 1
         logger.error(f"✗✗ ALL METHODS FAILED for {url}")
@@ -754,33 +767,27 @@ class UltraStealthCrawler:
             
             # Fetch with ultra stealth methods
             metadata = await self.fetch_url_ultra_stealth(url)
+            html = metadata.pop('html', None)
             self.url_metadata[url] = metadata
             pages_crawled += 1
             
-            # Extract links if successful (only for simple methods)
-            if metadata['status_code'] == 200 and pages_crawled < max_pages:
-                # For methods that return content, extract links
-                if metadata.get('method') in ['curl_cffi', 'cloudscraper_advanced', 'httpx_http2_advanced']:
-                    try:
-                        # Use appropriate session for content fetch
-                        if 'curl_cffi' in metadata.get('method', ''):
-                            response = curl_requests.get(url, impersonate="chrome110")
-                            content = response.content
-                        else:
-                            response = requests.get(url, headers=self.get_advanced_headers())
-                            content = response.content
-                        
-                        soup = BeautifulSoup(content, 'html.parser')
+            # Extract links from the HTML the winning method already returned
+            if metadata['status_code'] == 200 and html and pages_crawled < max_pages:
+                try:
+                    soup = BeautifulSoup(html, 'html.parser')
+                    
+                    for link in soup.find_all('a', href=True):
+                        absolute_url = normalize_url(urljoin(url, link['href']))
+                        parsed = urlparse(absolute_url)
                         
-                        for link in soup.find_all('a', href=True):
-                            absolute_url = normalize_url(urljoin(url, link['href']))
-                            parsed = urlparse(absolute_url)
+                        if self.is_same_domain(parsed.netloc) and absolute_url not in self.visited_urls:
+                            self.to_visit.append(absolute_url)
                             
-                            if self.is_same_domain(parsed.netloc) and absolute_url not in self.visited_urls:
-                                self.to_visit.append(absolute_url)
-                                
-                    except Exception as e:
-                        logger.warning(f"Error extracting links from {url}: {e}")
+                except Exception as e:
+                    logger.warning(f"Error extracting links from {url}: {e}")
+            
+            if pages_crawled % 50 == 0:
+                self.strategy.save()
             
             # Ultra-respectful delay with randomization
             delay = random.uniform(1.5, 3.5)
@@ -789,6 +796,9 @@ class UltraStealthCrawler:
         
         # Save results
         self.save_results()
+        self.strategy.save()
+        if self.browser_pool is not None:
+            await self.browser_pool.close()
         
         # Print comprehensive statistics
         elapsed = time.time() - start_time
@@ -801,6 +811,7 @@ class UltraStealthCrawler:
         logger.info(f"Total attempts: {self.stats['total_attempts']}")
         logger.info(f"Successful 200s: {self.stats['success_200']}")
         logger.info(f"Failed attempts: {self.stats['failed_attempts']}")
+        logger.info(f"Requests per page: {self.stats['requests_sent']/max(self.stats['total_attempts'], 1):.2f}")
         logger.info(f"Success rate: {success_rate:.1f}%")
         logger.info(f"Time elapsed: {elapsed:.1f} seconds")
         logger.info(f"Pages/second: {pages_crawled/elapsed:.2f}")
@@ -809,6 +820,10 @@ class UltraStealthCrawler:
         for method, count in sorted(self.stats['methods_used'].items(), key=lambda x: x[1], reverse=True):
             logger.info(f"  {method}: {count} successes")
         
+        logger.info(f"\nFirst choice per section ({self.strategy.path}):")
+        for template, method in self.strategy.summary().items():
+            logger.info(f"  {template}: {method}")
+        
         if self.stats['status_codes']:
             logger.info(f"\nStatus codes encountered:")
             for status, count in sorted(self.stats['status_codes'].items()):
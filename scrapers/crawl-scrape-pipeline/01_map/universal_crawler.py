@@ -19,6 +19,8 @@ from datetime import datetime
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 from orchestration.utils_minimal import normalize_url, is_valid_url, logger
+from orchestration.browser_pool import BrowserPool, PLAYWRIGHT_AVAILABLE
+from fetch_strategy import StrategyCache, ANSWERED_STATUSES
 
 # Try importing advanced libraries
 try:
@@ -38,11 +40,9 @@ except ImportError:
     HAS_UNDETECTED = False
     logger.warning("undetected-chromedriver not installed - install with: pip install undetected-chromedriver")
 
-try:
-    from playwright.async_api import async_playwright
-    HAS_PLAYWRIGHT = True
-except ImportError:
-    HAS_PLAYWRIGHT = False
+# Playwright is driven by the browser pool
+HAS_PLAYWRIGHT = PLAYWRIGHT_AVAILABLE
+if not HAS_PLAYWRIGHT:
     logger.warning("playwright not installed - install with: pip install playwright && playwright install")
 
 try:
@@ -69,11 +69,25 @@ class UniversalCrawler:
         # Statistics
         self.stats = {
             'total_attempts': 0,
+            'requests_sent': 0,
             'success_200': 0,
             'failed_attempts': 0,
             'methods_used': {}
         }
         
+        # Installed methods, cheapest first; the strategy cache learns which one each section needs
+        self.methods = {'requests_basic': self.method_1_requests_basic}
+        if HAS_CLOUDSCRAPER:
+            self.methods['cloudscraper'] = self.method_2_cloudscraper
+        if HAS_HTTPX:
+            self.methods['httpx_http2'] = self.method_3_httpx_http2
+        if HAS_PLAYWRIGHT:
+            self.methods['playwright_stealth'] = self.method_4_playwright_stealth
+        if HAS_UNDETECTED:
+            self.methods['undetected_chrome'] = self.method_5_undetected_chrome
+        self.strategy = StrategyCache(domain, self.methods)
+        self.browser_pool: Optional[BrowserPool] = None
+        
         # Advanced user agents
         self.user_agents = [
             # Chrome on Windows
@@ -137,7 +151,8 @@ class UniversalCrawler:
                 'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                 'size': len(response.content),
                 'last_modified': response.headers.get('last-modified', ''),
-                'method': 'requests_basic'
+                'method': 'requests_basic',
+                'html': response.text,
             }
         except Exception as e:
             logger.debug(f"Method 1 failed for {url}: {e}")
@@ -165,7 +180,8 @@ class UniversalCrawler:
                 'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                 'size': len(response.content),
                 'last_modified': response.headers.get('last-modified', ''),
-                'method': 'cloudscraper'
+                'method': 'cloudscraper',
+                'html': response.text,
             }
         except Exception as e:
             logger.debug(f"Method 2 failed for {url}: {e}")
@@ -187,74 +203,56 @@ class UniversalCrawler:
                     'content_type': response.headers.get('content-type', '').split(';')[0].strip(),
                     'size': len(response.content),
                     'last_modified': response.headers.get('last-modified', ''),
-                    'method': 'httpx_http2'
+                    'method': 'httpx_http2',
+                    'html': response.text,
                 }
         except Exception as e:
             logger.debug(f"Method 3 failed for {url}: {e}")
             return None
     
+    async def get_browser_pool(self) -> BrowserPool:
+        """Browser pool for the Playwright method, launched on first use."""
+        if self.browser_pool is None:
+            self.browser_pool = BrowserPool(
+                size=1,
+                contexts_per_browser=1,
+                context_options=lambda: {
+                    'viewport': {'width': 1920, 'height': 1080},
+                    'user_agent': random.choice(self.user_agents),
+                    'locale': 'en-US',
+                    'timezone_id': 'America/New_York',
+                },
+                launch_args=[
+                    '--disable-blink-features=AutomationControlled',
+                    '--disable-features=IsolateOrigins,site-per-process',
+                    '--no-sandbox',
+                ],
+            )
+            await self.browser_pool.start()
+        return self.browser_pool
+    
     async def method_4_playwright_stealth(self, url: str) -> Optional[Dict]:
-        """Method 4: Playwright with stealth mode."""
+        """Method 4: Playwright with stealth mode (pooled browser, stealth scripts per context)."""
         if not HAS_PLAYWRIGHT:
             return None
             
         try:
-            async with async_playwright() as p:
-                # Use Chromium with stealth settings
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--disable-blink-features=AutomationControlled',
-                        '--disable-features=IsolateOrigins,site-per-process',
-                        '--no-sandbox',
-                    ]
-                )
-                
-                context = await browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    user_agent=random.choice(self.user_agents),
-                    locale='en-US',
-                    timezone_id='America/New_York',
-                )
-                
-                # Add stealth scripts
-                await context.add_init_script("""
-                    // Override navigator properties
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    });
-                    
-                    // Override chrome property
-                    window.chrome = {
-                        runtime: {}
-                    };
-                    
-                    // Override permissions
-                    const originalQuery = window.navigator.permissions.query;
-                    window.navigator.permissions.query = (parameters) => (
-                        parameters.name === 'notifications' ?
-                            Promise.resolve({ state: Notification.permission }) :
-                            originalQuery(parameters)
-                    );
-                """)
-                
-                page = await context.new_page()
-                
+            pool = await self.get_browser_pool()
+            async with pool.page() as page:
                 # Random mouse movements for realism
                 await page.mouse.move(random.randint(100, 500), random.randint(100, 500))
                 
                 response = await page.goto(url, wait_until='networkidle', timeout=30000)
                 content = await page.content()
                 
-                await browser.close()
-                
                 return {
                     'url': url,
                     'status_code': response.status if response else 0,
                     'content_type': 'text/html',
                     'size': len(content),
                     'last_modified': '',
-                    'method': 'playwright_stealth'
+                    'method': 'playwright_stealth',
+                    'html': content,
                 }
         except Exception as e:
             logger.debug(f"Method 4 failed for {url}: {e}")
@@ -294,49 +292,41 @@ class UniversalCrawler:
                 'content_type': 'text/html',
                 'size': len(content),
                 'last_modified': '',
-                'method': 'undetected_chrome'
+                'method': 'undetected_chrome',
+                'html': content,
             }
         except Exception as e:
             logger.debug(f"Method 5 failed for {url}: {e}")
             return None
     
     async def fetch_url_universal(self, url: str) -> Dict:
-        """Try all methods until one succeeds with 200 status."""
+        """Try methods in the strategy cache's order until one gets an answer."""
         self.stats['total_attempts'] += 1
         
-        # Try methods in order of speed/resource usage
-        methods = [
-            ('requests_basic', self.method_1_requests_basic),
-            ('cloudscraper', self.method_2_cloudscraper),
-            ('httpx_http2', self.method_3_httpx_http2),
-            ('playwright_stealth', self.method_4_playwright_stealth),
-        ]
-        
-        for method_name, method_func in methods:
+        for method_name in self.strategy.plan(url):
+            method_func = self.methods[method_name]
             logger.info(f"Trying {method_name} for {url}")
             
+            start = time.time()
             if asyncio.iscoroutinefunction(method_func):
                 result = await method_func(url)
             else:
                 result = method_func(url)
+            status = result['status_code'] if result else None
+            self.strategy.record(url, method_name, status, time.time() - start)
+            self.stats['requests_sent'] += 1
             
-            if result and result['status_code'] == 200:
+            if status == 200:
                 self.stats['success_200'] += 1
                 self.stats['methods_used'][method_name] = self.stats['methods_used'].get(method_name, 0) + 1
                 logger.info(f"SUCCESS: {method_name} got 200 for {url}")
                 return result
-            elif result:
-                logger.warning(f"{method_name} got {result['status_code']} for {url}")
-        
-        # Last resort: undetected chrome (synchronous)
-        if HAS_UNDETECTED:
-            logger.info(f"Trying undetected_chrome for {url}")
-            result = self.method_5_undetected_chrome(url)
-            if result:
-                self.stats['success_200'] += 1
-                self.stats['methods_used']['undetected_chrome'] = self.stats['methods_used'].get('undetected_chrome', 0) + 1
-                logger.info(f"SUCCESS: undetected_chrome got 200 for {url}")
+            elif status in ANSWERED_STATUSES:
+                # The page is gone; other methods would only confirm it
+                logger.info(f"{method_name} got {status} for {url}")
                 return result
+            elif result:
+                logger.warning(f"{method_name} got {status} for {url}")
         
         # If all methods failed, record the failure
         self.stats['failed_attempts'] += 1
@@ -370,19 +360,14 @@ class UniversalCrawler:
             
             # Fetch with universal methods
             metadata = await self.fetch_url_universal(url)
+            html = metadata.pop('html', None)
             self.url_metadata[url] = metadata
             pages_crawled += 1
             
-            # Extract links if successful
-            if metadata['status_code'] == 200 and metadata.get('method') in ['requests_basic', 'cloudscraper', 'httpx_http2']:
-                # For methods that return actual content, extract links
+            # Extract links from the HTML the winning method already returned
+            if metadata['status_code'] == 200 and html:
                 try:
-                    if metadata['method'] == 'requests_basic':
-                        response = requests.get(url, headers=self.get_random_headers())
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                    else:
-                        # Skip link extraction for browser methods
-                        continue
+                    soup = BeautifulSoup(html, 'html.parser')
                     
                     for link in soup.find_all('a', href=True):
                         absolute_url = normalize_url(urljoin(url, link['href']))
@@ -394,11 +379,17 @@ class UniversalCrawler:
                 except Exception as e:
                     logger.warning(f"Error extracting links from {url}: {e}")
             
+            if pages_crawled % 50 == 0:
+                self.strategy.save()
+            
             # Respectful delay
             await asyncio.sleep(random.uniform(0.5, 1.5))
         
         # Save results
         self.save_results()
+        self.strategy.save()
+        if self.browser_pool is not None:
+            await self.browser_pool.close()
         
         # Print statistics
         elapsed = time.time() - start_time
@@ -406,12 +397,16 @@ class UniversalCrawler:
         logger.info(f"Total attempts: {self.stats['total_attempts']}")
         logger.info(f"Successful 200s: {self.stats['success_200']}")
         logger.info(f"Failed attempts: {self.stats['failed_attempts']}")
+        logger.info(f"Requests per page: {self.stats['requests_sent']/max(self.stats['total_attempts'], 1):.2f}")
         logger.info(f"Success rate: {self.stats['success_200']/self.stats['total_attempts']*100:.1f}%")
         logger.info(f"Time elapsed: {elapsed:.1f} seconds")
         logger.info(f"Pages/second: {pages_crawled/elapsed:.2f}")
         logger.info(f"\nMethods used:")
         for method, count in self.stats['methods_used'].items():
             logger.info(f"  {method}: {count} successes")
+        logger.info(f"\nFirst choice per section ({self.strategy.path}):")
+        for template, method in self.strategy.summary().items():
+            logger.info(f"  {template}: {method}")
     
     def is_same_domain(self, netloc: str) -> bool:
         """Check if URL belongs to same domain."""
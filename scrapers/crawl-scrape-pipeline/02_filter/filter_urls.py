@@ -1,19 +1,29 @@
 #!/usr/bin/env python3
 """
 Step 02: URL Filtering
-Filters URLs from dump.csv keeping only those with status_code == 200 and content_type starting with text/html.
+Streams dump.csv (optionally .gz/.bz2/.xz/.zst compressed) through compiled
+filter rules: status codes, content types, size range, include/exclude
+patterns, robots rules and canonical-URL collapse. Defaults come from
+get_step_config('02_filter') and keep status_code == 200 text/html pages.
 Inputs: 01_map/dump.csv
-Outputs: all_urls.txt (one URL per line)
+Outputs: {input}_filtered.txt (one URL per line), {input}_filter_stats.json (per-rule drop counts)
 """
 
 import argparse
 import csv
+import json
 import sys
+from itertools import dropwhile
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Optional
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent))
+
+from config import get_step_config
+from record_stream import open_text
+from filter_rules import FilterRules
 
 # Simple logging setup to avoid pandas dependency
 import logging
@@ -40,7 +50,7 @@ def setup_logging(name: str, log_file=None):
 class URLFilter:
     """Filters URLs based on HTTP metadata from dump.csv."""
     
-    def __init__(self, input_file=None):
+    def __init__(self, input_file=None, rules: Optional[FilterRules] = None):
         """Initialize URL filter."""
         self.logger = setup_logging('url_filter', Path(__file__).parent / 'filter.log')
         if input_file:
@@ -49,102 +59,124 @@ class URLFilter:
             self.input_file = Path(__file__).parent.parent / '01_map' / 'dump.csv'
         
         # Generate output filename based on input filename
-        input_stem = self.input_file.stem  # filename without extension
+        input_stem = self.input_file.name.split('.')[0]  # dump.csv.gz -> dump
         self.output_file = Path(__file__).parent / f'{input_stem}_filtered.txt'
+        self.stats_file = Path(__file__).parent / f'{input_stem}_filter_stats.json'
+        
+        self.rules = rules or FilterRules.from_config(get_step_config('02_filter'))
     
-    def filter_urls(self) -> List[str]:
-        """Filter URLs based on status code and content type."""
+    def filter_urls(self) -> Dict:
+        """Stream dump rows through the rules straight into the output file."""
         if not self.input_file.exists():
             self.logger.error(f"Input file not found: {self.input_file}")
             raise FileNotFoundError(f"Missing required file: {self.input_file}")
         
-        filtered_urls = []
-        total_count = 0
-        status_200_count = 0
-        html_count = 0
-        
         self.logger.info(f"Reading URLs from {self.input_file}")
+        self.logger.info(f"Rules: {self.rules.summary()}")
         
-        with open(self.input_file, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            # Verify required columns exist
-            if not all(col in reader.fieldnames for col in ['url', 'status_code', 'content_type']):
-                self.logger.error(f"Missing required columns. Found: {reader.fieldnames}")
-                raise ValueError("dump.csv missing required columns: url, status_code, content_type")
+        total_count = 0
+        kept_count = 0
+        check = self.rules.check
+        tmp_file = self.output_file.with_suffix('.tmp')
+        
+        with open_text(self.input_file) as f, \
+                open(tmp_file, 'w', encoding='utf-8', buffering=1 << 20) as out:
+            # Enhanced dumps start with '#' comment lines before the header
+            reader = csv.reader(dropwhile(lambda line: line.startswith('#'), f))
+            header = next(reader, None)
+            if header is None:
+                raise ValueError(f"{self.input_file} is empty")
+            try:
+                columns = self.rules.columns(header)
+            except ValueError:
+                self.logger.error(f"Missing required columns. Found: {header}")
+                raise
+            url_col = columns[0]
             
             for row in reader:
                 total_count += 1
-                
-                # Check status code
-                try:
-                    status_code = int(row.get('status_code', 0))
-                except ValueError:
-                    self.logger.warning(f"Invalid status code for {row.get('url')}: {row.get('status_code')}")
-                    continue
-                
-                if status_code == 200:
-                    status_200_count += 1
-                    
-                    # Check content type
-                    content_type = row.get('content_type', '').lower()
-                    if content_type.startswith('text/html'):
-                        html_count += 1
-                        filtered_urls.append(row['url'])
-                        self.logger.debug(f"Included: {row['url']}")
-                    else:
-                        self.logger.debug(f"Excluded (content-type: {content_type}): {row['url']}")
-                else:
-                    self.logger.debug(f"Excluded (status: {status_code}): {row['url']}")
+                if check(row, columns):
+                    out.write(row[url_col] + '\n')
+                    kept_count += 1
+        
+        tmp_file.replace(self.output_file)
+        
+        stats = {
+            'input_file': str(self.input_file),
+            'output_file': str(self.output_file),
+            'total': total_count,
+            'kept': kept_count,
+            'dropped': dict(self.rules.drops.most_common()),
+            'rules': self.rules.summary(),
+        }
         
         self.logger.info(f"Filtering complete:")
         self.logger.info(f"  Total URLs: {total_count}")
-        self.logger.info(f"  Status 200: {status_200_count}")
-        self.logger.info(f"  HTML pages: {html_count}")
-        self.logger.info(f"  Filtered URLs: {len(filtered_urls)}")
+        for rule, count in self.rules.drops.most_common():
+            self.logger.info(f"  Dropped by {rule}: {count}")
+        self.logger.info(f"  Filtered URLs: {kept_count}")
         
-        return filtered_urls
+        return stats
     
-    def save_results(self, urls: List[str]) -> None:
-        """Save filtered URLs to all_urls.txt."""
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            for url in urls:
-                f.write(url + '\n')
+    def save_stats(self, stats: Dict) -> None:
+        """Save per-rule drop counts next to the filtered URLs."""
+        with open(self.stats_file, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
         
-        self.logger.info(f"Saved {len(urls)} URLs to {self.output_file}")
+        self.logger.info(f"Saved {stats['kept']} URLs to {self.output_file}")
     
-    def run(self) -> List[str]:
+    def run(self) -> Dict:
         """Run the filtering process."""
         self.logger.info("Starting URL filtering")
         
-        # Filter URLs
-        filtered_urls = self.filter_urls()
+        stats = self.filter_urls()
+        self.save_stats(stats)
         
-        # Save results
-        if filtered_urls:
-            self.save_results(filtered_urls)
-        else:
+        if not stats['kept']:
             self.logger.warning("No URLs passed filtering criteria!")
         
-        return filtered_urls
+        return stats
 
 
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
-        description='Filter URLs keeping only status_code==200 and content_type starts with text/html',
-        epilog='Input: ../01_map/dump.csv or specified CSV file\nOutput: all_urls.txt'
+        description='Filter URLs from a crawl dump with compiled status/type/size/pattern/robots rules',
+        epilog='Input: ../01_map/dump.csv or specified CSV file (may be compressed)\n'
+               'Output: {input}_filtered.txt and {input}_filter_stats.json'
     )
     
     parser.add_argument('--input', help='Input CSV file (default: ../01_map/dump.csv)')
+    parser.add_argument('--status', type=int, nargs='+', dest='status_codes',
+                        help='Status codes to keep (default: 200)')
+    parser.add_argument('--content-type', nargs='+', dest='content_types',
+                        help='Content-type prefixes to keep (default: text/html)')
+    parser.add_argument('--min-size', type=int, help='Drop pages smaller than this many bytes')
+    parser.add_argument('--max-size', type=int, help='Drop pages larger than this many bytes')
+    parser.add_argument('--include', nargs='+', dest='include_patterns',
+                        help='Keep only URLs matching one of these patterns')
+    parser.add_argument('--exclude', nargs='+', dest='exclude_patterns',
+                        help='Drop URLs matching any of these patterns (replaces the config list)')
+    parser.add_argument('--robots', dest='robots_file', help='robots.txt file to honour')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='Skip canonical-URL collapse')
     args = parser.parse_args()
     
+    overrides = {key: getattr(args, key) for key in (
+        'status_codes', 'content_types', 'min_size', 'max_size',
+        'include_patterns', 'exclude_patterns', 'robots_file')}
+    if args.keep_duplicates:
+        overrides['canonicalize'] = False
+    rules = FilterRules.from_config(get_step_config('02_filter'), **overrides)
+    
     # Run filter
-    filter = URLFilter(input_file=args.input)
-    filtered_urls = filter.run()
+    filter = URLFilter(input_file=args.input, rules=rules)
+    stats = filter.run()
     
-    if filtered_urls:
-        print(f"\nFiltering complete! {len(filtered_urls)} URLs passed criteria")
+    if stats['kept']:
+        print(f"\nFiltering complete! {stats['kept']} of {stats['total']} URLs passed criteria")
+        for rule, count in stats['dropped'].items():
+            print(f"  dropped by {rule}: {count}")
         print(f"Results saved to: {filter.output_file}")
     else:
         print("\nNo URLs passed filtering criteria!")
@@ -152,4 +184,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -2,67 +2,56 @@
 """
 Step 03: URL Grouping
 Groups URLs by template/pattern to identify common page types.
+
+Templates are inferred by template_trie.TemplateTrie: one streaming pass
+builds a path-segment trie, high-cardinality positions collapse into typed
+placeholders, and a second pass writes each URL to its template's file.
 """
 
 import argparse
 import json
-import re
 import sys
 from collections import defaultdict, Counter
 from pathlib import Path
-from typing import List, Dict, Set, Tuple, Optional
+from typing import Callable, Iterable, List, Dict, Set, Tuple, Optional
 from urllib.parse import urlparse
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
 
 from orchestration.config import get_step_config
-from orchestration.utils_minimal import logger, read_lines, write_lines, get_url_pattern
+from orchestration.utils_minimal import logger, write_lines, get_url_pattern
+from template_trie import TemplateTrie, DistinctCounter, placeholder_values
+
+
+# URLs buffered across all templates before appending them to their files
+FLUSH_EVERY = 100000
+
+
+def iter_url_file(path: Path) -> Iterable[str]:
+    """Stream non-empty lines from a URL file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
 
 
 class URLGrouper:
     """Groups URLs by patterns and templates."""
     
-    def __init__(self, domain: str):
+    def __init__(self, domain: str, min_distinct: int = 5, max_children: int = 1000):
         """Initialize URL grouper."""
         self.domain = domain
         self.logger = logger
         self.groups: Dict[str, List[str]] = defaultdict(list)
         self.templates: Dict[str, str] = {}
+        self.trie = TemplateTrie(min_distinct=min_distinct, max_children=max_children)
     
     def extract_url_pattern(self, url: str) -> str:
-        """Extract a pattern from URL by replacing dynamic parts."""
-        parsed = urlparse(url)
-        path = parsed.path
-        
-        # Replace common dynamic patterns
-        patterns = [
-            (r'/\d+', '/{id}'),  # Numeric IDs
-            (r'/[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}', '/{uuid}'),  # UUIDs
-            (r'/[a-f0-9]{24,}', '/{hash}'),  # Long hashes
-            (r'/\d{4}/\d{1,2}/\d{1,2}', '/{date}'),  # Date patterns
-            (r'/\d{4}/\d{1,2}', '/{year}/{month}'),  # Year/month
-            (r'/page/\d+', '/page/{n}'),  # Pagination
-            (r'-\d+\.html?$', '-{id}.html'),  # ID in filename
-            (r'[?&]id=\d+', '?id={id}'),  # Query param IDs
-            (r'[?&]page=\d+', '?page={n}'),  # Query param pagination
-        ]
-        
-        template = path
-        for pattern, replacement in patterns:
-            template = re.sub(pattern, replacement, template)
-        
-        # Handle slugs (keep first part, replace rest with {slug})
-        # e.g., /products/awesome-bike-model -> /products/{slug}
-        parts = template.split('/')
-        if len(parts) > 2:
-            # Check if last part looks like a slug
-            last_part = parts[-1]
-            if re.match(r'^[a-z0-9-]+$', last_part) and '-' in last_part:
-                parts[-1] = '{slug}'
-                template = '/'.join(parts)
-        
-        return template
+        """Template of a URL, once the trie has been built and finalized."""
+        return self.trie.template(url)
     
     def identify_url_components(self, url: str) -> Dict[str, str]:
         """Identify components of a URL."""
@@ -95,8 +84,20 @@ class URLGrouper:
         
         return components
     
+    def build_templates(self, urls: Iterable[str]) -> int:
+        """Insert every URL into the trie (one pass), then collapse it."""
+        total = 0
+        for url in urls:
+            self.trie.add(url)
+            total += 1
+        self.trie.finalize()
+        return total
+    
     def group_by_pattern(self, urls: List[str]) -> Dict[str, List[str]]:
         """Group URLs by their patterns."""
+        if not self.trie.finalized:
+            self.build_templates(urls)
+        
         pattern_groups = defaultdict(list)
         
         for url in urls:
@@ -106,6 +107,66 @@ class URLGrouper:
         
         return dict(pattern_groups)
     
+    def write_template_files(self, urls: Iterable[str]) -> Dict[str, Dict]:
+        """Stream URLs into by_template/ files, tracking per-template stats.
+        
+        Returns ``{template: {'count', 'examples', 'cardinality'}}`` where
+        cardinality is the estimated distinct values per placeholder.
+        """
+        output_dir = Path(__file__).parent / 'by_template'
+        output_dir.mkdir(exist_ok=True)
+        for old_file in output_dir.glob('*.txt'):
+            old_file.unlink()
+        
+        stats: Dict[str, Dict] = {}
+        distinct: Dict[str, Dict[str, DistinctCounter]] = defaultdict(dict)
+        pending: Dict[str, List[str]] = defaultdict(list)
+        buffered = 0
+        
+        def flush():
+            for template, lines in pending.items():
+                with open(output_dir / f"{self.template_filename(template)}.txt", 'a',
+                          encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+            pending.clear()
+        
+        for url in urls:
+            template = self.extract_url_pattern(url)
+            info = stats.get(template)
+            if info is None:
+                info = stats[template] = {'count': 0, 'examples': []}
+            info['count'] += 1
+            if len(info['examples']) < 5:
+                info['examples'].append(url)
+            
+            for position, value in placeholder_values(template, url):
+                counter = distinct[template].get(position)
+                if counter is None:
+                    counter = distinct[template][position] = DistinctCounter()
+                counter.add(value)
+            
+            pending[template].append(url)
+            buffered += 1
+            if buffered >= FLUSH_EVERY:
+                flush()
+                buffered = 0
+        flush()
+        
+        for template, info in stats.items():
+            info['cardinality'] = {position: counter.estimate()
+                                   for position, counter in distinct[template].items()}
+        return stats
+    
+    @staticmethod
+    def template_filename(pattern: str) -> str:
+        """Create safe filename for a template."""
+        safe_pattern = pattern.replace('/', '_').replace('{', '').replace('}', '')
+        # Query keys: /list?page={n}&sort={value} -> list_page-n_sort-value
+        safe_pattern = safe_pattern.replace('?', '_').replace('&', '_').replace('=', '-')
+        if safe_pattern.startswith('_'):
+            safe_pattern = safe_pattern[1:]
+        return safe_pattern or 'root'
+    
     def group_by_structure(self, urls: List[str]) -> Dict[str, List[str]]:
         """Group URLs by their structural characteristics."""
         structure_groups = defaultdict(list)
@@ -127,9 +188,15 @@ class URLGrouper:
         analysis = {}
         
         for pattern, urls in pattern_groups.items():
+            values = defaultdict(set)
+            for url in urls:
+                for position, value in placeholder_values(pattern, url):
+                    values[position].add(value)
+            
             analysis[pattern] = {
                 'count': len(urls),
                 'examples': urls[:5],  # First 5 examples
+                'cardinality': {position: len(v) for position, v in values.items()},
                 'likely_type': self.guess_page_type(pattern),
                 'priority': self.calculate_priority(pattern, len(urls)),
             }
@@ -140,6 +207,10 @@ class URLGrouper:
         """Guess the type of page based on pattern."""
         pattern_lower = pattern.lower()
         
+        # Pagination first: /products?page={n} is a listing, not a product
+        if 'page/{n}' in pattern or 'page={n}' in pattern or 'page/{id}' in pattern:
+            return 'paginated_listing'
+        
         # Product patterns
         if any(x in pattern_lower for x in ['/product', '/item', '/p/', '/{slug}']):
             return 'product_detail'
@@ -152,10 +223,6 @@ class URLGrouper:
         if any(x in pattern_lower for x in ['/search', '/s/', 'query=', 'q=']):
             return 'search_results'
         
-        # Pagination
-        if 'page/{n}' in pattern or 'page={n}' in pattern:
-            return 'paginated_listing'
-        
         return 'unknown'
     
     def calculate_priority(self, pattern: str, count: int) -> int:
@@ -182,19 +249,17 @@ class URLGrouper:
         
         # Save individual group files
         for pattern, urls in pattern_groups.items():
-            # Create safe filename
-            safe_pattern = pattern.replace('/', '_').replace('{', '').replace('}', '')
-            if safe_pattern.startswith('_'):
-                safe_pattern = safe_pattern[1:]
-            
-            group_file = output_dir / f"{safe_pattern}.txt"
+            group_file = output_dir / f"{self.template_filename(pattern)}.txt"
             write_lines(urls, group_file)
         
-        # Save summary
+        self.save_summary(analysis)
+    
+    def save_summary(self, analysis: Dict[str, Dict]) -> None:
+        """Write grouping_summary.json and patterns_to_probe.json."""
         summary = {
             'domain': self.domain,
-            'total_urls': sum(len(urls) for urls in pattern_groups.values()),
-            'total_patterns': len(pattern_groups),
+            'total_urls': sum(info['count'] for info in analysis.values()),
+            'total_patterns': len(analysis),
             'patterns': analysis,
         }
         
@@ -224,6 +289,34 @@ class URLGrouper:
             json.dump(probe_input, f, indent=2)
         self.logger.info(f"Saved top patterns to {patterns_file}")
     
+    def run_stream(self, open_urls: Callable[[], Iterable[str]]) -> Dict[str, Dict]:
+        """Group a URL source too large to hold in memory.
+        
+        ``open_urls`` is called twice: once to build the trie and once to
+        write the template files.
+        """
+        total = self.build_templates(open_urls())
+        self.logger.info(f"Built template trie from {total} URLs")
+        
+        template_stats = self.write_template_files(open_urls())
+        self.logger.info(f"Found {len(template_stats)} unique patterns")
+        
+        analysis = {}
+        for pattern, info in template_stats.items():
+            analysis[pattern] = {
+                **info,
+                'likely_type': self.guess_page_type(pattern),
+                'priority': self.calculate_priority(pattern, info['count']),
+            }
+        
+        self.logger.info("Top 10 patterns by count:")
+        for pattern, info in sorted(analysis.items(), key=lambda x: x[1]['count'],
+                                    reverse=True)[:10]:
+            self.logger.info(f"  {pattern}: {info['count']} URLs ({info['likely_type']})")
+        
+        self.save_summary(analysis)
+        return analysis
+    
     def run(self, urls: List[str]) -> Tuple[Dict[str, List[str]], Dict[str, Dict]]:
         """Run the grouping process."""
         self.logger.info(f"Grouping {len(urls)} URLs")
@@ -278,6 +371,8 @@ Examples:
     parser.add_argument('--input', help='Input file with URLs (default: ../02_filter/all_urls.txt)')
     parser.add_argument('--max-patterns', type=int, default=50,
                        help='Maximum number of patterns to keep')
+    parser.add_argument('--min-distinct', type=int, default=5,
+                       help='Distinct names at a path position before it becomes {slug}')
     
     args = parser.parse_args()
     
@@ -288,15 +383,13 @@ Examples:
         print("Make sure to run 02_filter/filter_urls.py first")
         sys.exit(1)
     
-    urls = read_lines(input_file)
-    print(f"Loaded {len(urls)} URLs from {input_file}")
-    
-    # Run grouping
-    grouper = URLGrouper(args.domain)
-    pattern_groups, analysis = grouper.run(urls)
+    # Run grouping, streaming the input file
+    grouper = URLGrouper(args.domain, min_distinct=args.min_distinct)
+    analysis = grouper.run_stream(lambda: iter_url_file(input_file))
     
     print(f"\nGrouping complete!")
-    print(f"Found {len(pattern_groups)} unique URL patterns")
+    print(f"Grouped {sum(info['count'] for info in analysis.values())} URLs from {input_file}")
+    print(f"Found {len(analysis)} unique URL patterns")
     print(f"Results saved to {Path(__file__).parent}")
 
 
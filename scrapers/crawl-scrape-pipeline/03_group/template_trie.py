@@ -0,0 +1,338 @@
+"""
+URL template inference over a path-segment trie.
+
+Every URL path is inserted into a trie of its segments in a single pass.
+Nodes count the URLs through and ending at them; segments are classified
+(numeric, hex, date, slug, word) from their characters alone, which is
+all the inference needs. The trie is then collapsed bottom-up:
+
+* numeric, hex and date children are always values, never names, so each
+  class collapses into one ``{id}`` / ``{hex}`` / ``{date}`` child
+* slug and word children collapse into ``{slug}`` when at least
+  ``min_distinct`` of them look alike: each carries a small share of the
+  parent's URLs, and they have the same placeholders below them. Literal
+  sub-pages don't count, so products that alone have ``/reviews`` still
+  share the product template. A name holding a large share of the
+  parent's URLs (``/motorcycle`` above every product) is a section, and
+  siblings shaped differently from the largest alike group (categories
+  with brand pages beside plain pages) stay literal rather than merge
+* a node that sees more than ``max_children`` distinct children folds them
+  into one wildcard while inserting, so memory stays bounded however many
+  URLs stream through
+
+Collapsing merges the children's subtrees, so ``/p/123/reviews`` and
+``/p/456/reviews`` become one ``/p/{id}/reviews`` branch. Matching a URL
+against the finished trie then gives its template without any regexes.
+A query string adds its sorted keys with typed values to the template
+(``/products?page={n}``), so listings and their later pages stay apart.
+"""
+import hashlib
+import heapq
+from collections import Counter
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+
+HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+DATE_SEPARATORS = frozenset('-_.')
+MONTHS = frozenset([
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+    'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september',
+    'october', 'november', 'december',
+])
+
+PLACEHOLDERS = {
+    'numeric': '{id}',
+    'hex': '{hex}',
+    'date': '{date}',
+    'slug': '{slug}',
+    'word': '{slug}',
+}
+
+# Value-like classes collapse regardless of how many siblings they have
+VALUE_CLASSES = ('numeric', 'hex', 'date')
+
+WILDCARD = '*'
+
+
+
+def classify(segment: str) -> str:
+    """Character class of one path segment."""
+    if segment.isdigit():
+        return 'numeric'
+
+    # 2024-06-15, 2024_06, 15.06.2024, september-2024
+    parts = ''.join(' ' if c in DATE_SEPARATORS else c for c in segment).lower().split()
+    if 2 <= len(parts) <= 3 and all(p.isdigit() or p in MONTHS for p in parts) \
+            and any(len(p) == 4 and p[:2] in ('19', '20') for p in parts):
+        return 'date'
+
+    compact = segment.replace('-', '')
+    if len(compact) >= 8 and set(compact) <= HEX_DIGITS \
+            and any(c.isdigit() for c in compact) and any(c.isalpha() for c in compact):
+        return 'hex'
+
+    if '-' in segment or '_' in segment or any(c.isdigit() for c in segment):
+        return 'slug'
+    return 'word'
+
+
+def path_segments(url: str) -> List[str]:
+    """Non-empty path segments of a URL (query and fragment dropped)."""
+    # Hand-rolled split; urlparse dominates the run time on large inputs
+    start = url.find('://')
+    start = url.find('/', start + 3) if start >= 0 else 0
+    if start < 0:
+        return []
+    end = len(url)
+    for stop in ('?', '#'):
+        i = url.find(stop, start)
+        if 0 <= i < end:
+            end = i
+    return [s for s in url[start:end].split('/') if s]
+
+
+def query_segment(url: str) -> Optional[str]:
+    """``?key={n}&other={value}`` for a URL's query string, or None.
+
+    Keys are sorted and deduplicated; numeric values become ``{n}`` and
+    any other value ``{value}``.
+    """
+    start = url.find('?')
+    if start < 0:
+        return None
+    fragment = url.find('#')
+    if 0 <= fragment < start:
+        return None
+    query = url[start + 1:fragment if fragment > start else len(url)]
+    params = {}
+    for param in query.split('&'):
+        key, eq, value = param.partition('=')
+        if key:
+            params[key] = (eq + ('{n}' if value.isdigit() else '{value}')) if eq else ''
+    if not params:
+        return None
+    return '?' + '&'.join(key + params[key] for key in sorted(params))
+
+
+class TrieNode:
+    __slots__ = ('count', 'ends', 'children', 'classes')
+
+    def __init__(self):
+        self.count = 0
+        self.ends = 0
+        self.children: Dict[str, 'TrieNode'] = {}
+        self.classes: Counter = Counter()
+
+    def shape(self) -> FrozenSet[str]:
+        """Placeholders below this node; literal sub-pages are left out."""
+        return frozenset(key for key in self.children if key.startswith('{'))
+
+    def merge(self, other: 'TrieNode') -> None:
+        """Fold another subtree into this one."""
+        self.count += other.count
+        self.ends += other.ends
+        self.classes.update(other.classes)
+        for key, child in other.children.items():
+            mine = self.children.get(key)
+            if mine is None:
+                self.children[key] = child
+            else:
+                mine.merge(child)
+
+    def route(self, segment: str) -> Optional[Tuple[str, 'TrieNode']]:
+        """The (key, child) a segment follows in a collapsed trie."""
+        child = self.children.get(segment)
+        if child is not None:
+            return segment, child
+        key = PLACEHOLDERS[classify(segment)]
+        child = self.children.get(key)
+        if child is not None:
+            return key, child
+        for key, child in self.children.items():
+            if key.startswith('{'):
+                return key, child
+        return None
+
+
+class TemplateTrie:
+    """Streaming path-segment trie that infers URL templates."""
+
+    def __init__(self, min_distinct: int = 5, max_children: int = 1000):
+        self.min_distinct = min_distinct
+        self.max_children = max_children
+        self.root = TrieNode()
+        self.finalized = False
+
+    def add(self, url: str) -> None:
+        node = self.root
+        node.count += 1
+        for segment in path_segments(url):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children.get(WILDCARD)
+                if child is not None:
+                    node.classes[classify(segment)] += 1
+                elif len(node.children) >= self.max_children:
+                    child = self._fold(node)
+                    node.classes[classify(segment)] += 1
+                else:
+                    child = node.children[segment] = TrieNode()
+            child.count += 1
+            node = child
+        node.ends += 1
+
+    def _fold(self, node: TrieNode) -> TrieNode:
+        """Replace every child with one wildcard holding their merged subtrees.
+
+        ``node.classes`` starts counting here: it is only needed to label
+        the wildcard, so literal children don't pay for classification.
+        """
+        wildcard = TrieNode()
+        for key, child in node.children.items():
+            node.classes[classify(key)] += child.count
+            wildcard.merge(child)
+        node.children = {WILDCARD: wildcard}
+        return wildcard
+
+    def finalize(self) -> None:
+        """Collapse high-cardinality and value-like positions into placeholders."""
+        self._finalize(self.root)
+        self.finalized = True
+
+    def _finalize(self, node: TrieNode) -> None:
+        # Children first, so their own positions are collapsed before they merge
+        for child in node.children.values():
+            self._finalize(child)
+        for label in self._collapse(node):
+            # Merged subtrees may now clear thresholds neither half did
+            self._finalize(node.children[label])
+
+    def _collapse(self, node: TrieNode) -> List[str]:
+        """Collapse this node's children; returns the placeholders created."""
+        if not node.children:
+            return []
+
+        wildcard = node.children.pop(WILDCARD, None)
+        if wildcard is not None:
+            # Overflowed while streaming; label it by the dominant class
+            label = PLACEHOLDERS[node.classes.most_common(1)[0][0]]
+            node.children[label] = wildcard
+
+        by_class: Dict[str, List[str]] = {}
+        for key in node.children:
+            if not key.startswith('{'):
+                by_class.setdefault(classify(key), []).append(key)
+
+        collapse = [keys for cls, keys in by_class.items() if cls in VALUE_CLASSES]
+
+        # Slugs and words share {slug}
+        names = self._value_names(node, by_class.get('slug', []) + by_class.get('word', []))
+        if names:
+            collapse.append(names)
+
+        created = []
+        for keys in collapse:
+            label = PLACEHOLDERS[classify(keys[0])]
+            merged = node.children.pop(label, None) or TrieNode()
+            for key in keys:
+                merged.merge(node.children.pop(key))
+            node.children[label] = merged
+            created.append(label)
+        return created
+
+    def _value_names(self, node: TrieNode, names: List[str]) -> List[str]:
+        """The name children of ``node`` that are values of one position."""
+        # A name carrying a large share of the parent's URLs is a section
+        share_limit = node.count / self.min_distinct
+        by_shape: Dict[FrozenSet[str], List[str]] = {}
+        for key in names:
+            child = node.children[key]
+            if child.count <= share_limit:
+                by_shape.setdefault(child.shape(), []).append(key)
+
+        existing = node.children.get('{slug}')
+        if existing is not None:
+            # Overflowed while streaming; names shaped like the wildcard join it
+            shape = existing.shape()
+        else:
+            groups = [keys for keys in by_shape.values() if len(keys) >= self.min_distinct]
+            if not groups:
+                return []
+            keys = max(groups, key=lambda keys: sum(node.children[k].count for k in keys))
+            shape = node.children[keys[0]].shape()
+
+        # Names with fewer placeholders below (a product without variants
+        # next to ones with them) fit the group as long as they are no
+        # bigger than its members; anything shaped otherwise stays literal
+        members = by_shape.get(shape, [])
+        largest = max((node.children[k].count for k in members), default=0)
+        for other, keys in by_shape.items():
+            if other < shape:
+                members += [k for k in keys if node.children[k].count <= largest]
+        return members
+
+    def template(self, url: str) -> str:
+        """Template of a URL in the finalized trie."""
+        node = self.root
+        parts = []
+        segments = path_segments(url)
+        for i, segment in enumerate(segments):
+            routed = node.route(segment)
+            if routed is None:
+                # Not seen while building; the rest has no node to match against
+                parts.extend(segments[i:])
+                break
+            key, node = routed
+            parts.append(key)
+        # Query keys are part of the template; their values never are
+        return '/' + '/'.join(parts) + (query_segment(url) or '')
+
+
+class DistinctCounter:
+    """Bounded-memory distinct count (k minimum values sketch).
+
+    Exact up to ``k`` distinct values, an estimate within a few percent above.
+    """
+
+    __slots__ = ('k', 'heap', 'members')
+
+    def __init__(self, k: int = 1024):
+        self.k = k
+        self.heap: List[float] = []  # negated, so heap[0] is the largest kept
+        self.members = set()
+
+    def add(self, value: str) -> None:
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+        h = int.from_bytes(digest, 'big') / 2 ** 64
+        if h in self.members:
+            return
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, -h)
+            self.members.add(h)
+        elif h < -self.heap[0]:
+            self.members.discard(-heapq.heapreplace(self.heap, -h))
+            self.members.add(h)
+
+    def estimate(self) -> int:
+        if len(self.heap) < self.k:
+            return len(self.heap)
+        return int((self.k - 1) / -self.heap[0])
+
+
+def placeholder_values(template: str, url: str) -> Iterator[Tuple[str, str]]:
+    """(position label, value) for each placeholder a URL filled."""
+    path, _, query = template.partition('?')
+    for position, (key, segment) in enumerate(zip(path.strip('/').split('/'),
+                                                  path_segments(url))):
+        if key.startswith('{'):
+            yield f'{position}:{key}', segment
+
+    if query:
+        start = url.find('?')
+        fragment = url.find('#', start)
+        values = dict(param.partition('=')[::2]
+                      for param in url[start + 1:fragment if fragment >= 0 else len(url)].split('&'))
+        for param in query.split('&'):
+            key, _, placeholder = param.partition('=')
+            if placeholder.startswith('{'):
+                yield f'?{key}:{placeholder}', values.get(key, '')
@@ -2,37 +2,62 @@
 """
 Step 04: Template Probing
 Probes URL patterns to understand page structure and data availability.
+Examples of all patterns are probed concurrently by a bounded worker pool,
+politely per host, and each pattern's findings are appended to
+findings.yaml as soon as its last example is done.
 """
 
 import argparse
 import asyncio
 import json
 import sys
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Set, Tuple, Any
 from urllib.parse import urlparse
 
-from playwright.async_api import async_playwright, Page, Response
+from playwright.async_api import Page, Response
 import requests
+import yaml
 from bs4 import BeautifulSoup
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
 
 from config import config
+from orchestration.browser_pool import BrowserPool
+from orchestration.config import BROWSER_POOL_CONFIG
+from orchestration.rate_control import RateController
 from utils_minimal import setup_logging, load_json, save_json, save_yaml, ensure_dir, create_timestamp
 
 
 class TemplateProber:
     """Probes URL templates to understand their structure."""
     
-    def __init__(self, domain: str):
+    def __init__(self, domain: str, max_examples: int = 3, concurrency: Optional[int] = None):
         """Initialize template prober."""
         self.domain = domain
         self.logger = setup_logging('template_prober', Path(__file__).parent / 'probe.log')
         self.findings: Dict[str, Dict] = {}
         self.netlogs_dir = ensure_dir(Path(__file__).parent / 'netlogs')
         self.pages_dir = ensure_dir(Path(__file__).parent / 'pages')
+        self.findings_stream = Path(__file__).parent / 'findings.yaml'
+        self.max_examples = max_examples
+        # Default: one worker per pooled page
+        self.concurrency = concurrency or (BROWSER_POOL_CONFIG['browsers'] *
+                                           BROWSER_POOL_CONFIG['contexts_per_browser'])
+        self.browser_pool: Optional[BrowserPool] = None
+        self.rate_controller = RateController()
+    
+    async def get_browser_pool(self) -> BrowserPool:
+        """Shared browser pool, launched on first use and closed at the end of run()."""
+        if self.browser_pool is None:
+            # Blocked images still fire 'request', so the network log keeps them.
+            # Assigned before the first await: concurrent workers must share
+            # one pool, whose start() launches a single driver for them all.
+            self.browser_pool = BrowserPool()
+        return await self.browser_pool.start()
     
     async def probe_with_playwright(self, url: str) -> Dict[str, Any]:
         """Probe a URL using Playwright for JavaScript-rendered content."""
@@ -44,11 +69,8 @@ class TemplateProber:
         }
         
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(**config.get_playwright_context())
-                page = await context.new_page()
-                
+            pool = await self.get_browser_pool()
+            async with pool.page() as page:
                 # Track network requests
                 api_calls = []
                 resources = {'scripts': [], 'stylesheets': [], 'images': [], 'xhr': []}
@@ -69,39 +91,40 @@ class TemplateProber:
                     elif request.resource_type == 'image':
                         resources['images'].append(request.url)
                 
+                # The pool reuses this page, so the listener must not outlive the probe
                 page.on('request', handle_request)
-                
-                # Navigate to page
-                response = await page.goto(url, wait_until='networkidle', timeout=30000)
-                
-                if response:
-                    findings['status_code'] = response.status
-                    findings['success'] = response.status == 200
-                
-                # Wait for dynamic content
-                await page.wait_for_timeout(2000)
-                
-                # Get page content
-                content = await page.content()
-                findings['content_length'] = len(content)
-                
-                # Analyze page structure
-                findings['structure'] = await self.analyze_page_structure(page)
-                
-                # Detect frameworks
-                findings['frameworks'] = await self.detect_frameworks(page)
-                
-                # Save page content
-                page_file = self.pages_dir / f"{urlparse(url).path.replace('/', '_')}.html"
-                with open(page_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                # Add network findings
-                findings['api_calls'] = api_calls
-                findings['resources'] = resources
-                findings['has_spa'] = len(api_calls) > 0
-                
-                await browser.close()
+                try:
+                    # Navigate to page
+                    response = await page.goto(url, wait_until='networkidle', timeout=30000)
+                    
+                    if response:
+                        findings['status_code'] = response.status
+                        findings['success'] = response.status == 200
+                    
+                    # Wait for dynamic content
+                    await page.wait_for_timeout(2000)
+                    
+                    # Get page content
+                    content = await page.content()
+                    findings['content_length'] = len(content)
+                    
+                    # Analyze page structure
+                    findings['structure'] = await self.analyze_page_structure(page)
+                    
+                    # Detect frameworks
+                    findings['frameworks'] = await self.detect_frameworks(page)
+                    
+                    # Save page content
+                    page_file = self.pages_dir / f"{urlparse(url).path.replace('/', '_')}.html"
+                    with open(page_file, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                    
+                    # Add network findings
+                    findings['api_calls'] = api_calls
+                    findings['resources'] = resources
+                    findings['has_spa'] = len(api_calls) > 0
+                finally:
+                    page.remove_listener('request', handle_request)
                 
         except Exception as e:
             self.logger.error(f"Error probing {url} with Playwright: {e}")
@@ -277,36 +300,98 @@ class TemplateProber:
         
         return structure
     
-    async def probe_pattern(self, pattern: str, examples: List[str]) -> Dict[str, Any]:
-        """Probe a URL pattern using multiple examples."""
+    async def probe_example(self, url: str) -> Dict[str, Any]:
+        """Probe one example: Playwright first, then requests in a worker thread."""
+        self.logger.info(f"Probing {url}")
+        
+        # Try Playwright first for better JavaScript support
+        async with self.rate_controller.slot(url):
+            findings = await self.probe_with_playwright(url)
+            # Render time includes fixed waits, so only the status informs the limiter
+            self.rate_controller.record(url, findings.get('status_code', 0))
+        
+        # Fallback to requests if needed, off the event loop
+        if not findings['success']:
+            async with self.rate_controller.slot(url):
+                start = time.time()
+                fallback = await asyncio.to_thread(self.probe_with_requests, url)
+                self.rate_controller.record(url, fallback.get('status_code', 0),
+                                            time.time() - start, fallback.get('headers'))
+            findings.update(fallback)
+        
+        return findings
+    
+    def finish_pattern(self, pattern: str, examples_probed: List[Dict]) -> Dict[str, Any]:
+        """Summarize a pattern's examples and append the result to findings.yaml."""
         pattern_findings = {
             'pattern': pattern,
-            'examples_probed': [],
+            'examples_probed': examples_probed,
             'common_structure': {},
             'recommendations': [],
         }
         
-        # Probe up to 3 examples
-        for url in examples[:3]:
-            self.logger.info(f"Probing {url}")
-            
-            # Try Playwright first for better JavaScript support
-            findings = await self.probe_with_playwright(url)
-            
-            # Fallback to requests if needed
-            if not findings['success']:
-                findings.update(self.probe_with_requests(url))
-            
-            pattern_findings['examples_probed'].append(findings)
-        
         # Analyze common patterns
         pattern_findings['common_structure'] = self.find_common_structure(pattern_findings['examples_probed'])
         
         # Generate recommendations
         pattern_findings['recommendations'] = self.generate_recommendations(pattern_findings)
         
+        self.findings[pattern] = pattern_findings
+        self.append_findings(pattern, pattern_findings)
+        
         return pattern_findings
     
+    def append_findings(self, pattern: str, pattern_findings: Dict[str, Any]) -> None:
+        """One YAML document per pattern, so an interrupted run keeps what it finished."""
+        with open(self.findings_stream, 'a', encoding='utf-8') as f:
+            yaml.safe_dump({pattern: pattern_findings}, f, explicit_start=True,
+                           sort_keys=False, default_flow_style=False)
+    
+    async def probe_pattern(self, pattern: str, examples: List[str]) -> Dict[str, Any]:
+        """Probe a URL pattern using multiple examples."""
+        examples_probed = await asyncio.gather(
+            *(self.probe_example(url) for url in examples[:self.max_examples]))
+        return self.finish_pattern(pattern, list(examples_probed))
+    
+    async def _probe_worker(self, queue: asyncio.Queue, pending: Dict[str, List]) -> None:
+        while True:
+            job = await queue.get()
+            try:
+                if job is None:
+                    return
+                pattern, index, url = job
+                try:
+                    findings = await self.probe_example(url)
+                except Exception as e:
+                    self.logger.error(f"Error probing {url}: {e}")
+                    findings = {'url': url, 'success': False, 'error': str(e)}
+                
+                # pending[pattern] = [results by example index, examples still running]
+                state = pending[pattern]
+                state[0][index] = findings
+                state[1] -= 1
+                if state[1] == 0:
+                    del pending[pattern]
+                    self.finish_pattern(pattern, state[0])
+                    self.logger.info(f"Finished pattern {pattern} ({len(self.findings)} done)")
+            finally:
+                queue.task_done()
+    
+    def load_finished(self) -> Dict[str, Dict]:
+        """Patterns already in findings.yaml from an earlier, interrupted run."""
+        if not self.findings_stream.exists():
+            return {}
+        finished = {}
+        with open(self.findings_stream, 'r', encoding='utf-8') as f:
+            try:
+                for document in yaml.safe_load_all(f):
+                    if document:
+                        finished.update(document)
+            except yaml.YAMLError:
+                # A run killed mid-write leaves a truncated last document
+                self.logger.warning(f"Ignoring truncated tail of {self.findings_stream}")
+        return finished
+    
     def find_common_structure(self, examples: List[Dict]) -> Dict[str, Any]:
         """Find common structure across examples."""
         if not examples:
@@ -377,7 +462,7 @@ class TemplateProber:
         
         return recommendations
     
-    async def run(self, patterns_file: Optional[Path] = None) -> Dict[str, Dict]:
+    async def run(self, patterns_file: Optional[Path] = None, resume: bool = False) -> Dict[str, Dict]:
         """Run the probing process."""
         # Load patterns to probe
         if patterns_file is None:
@@ -391,17 +476,45 @@ class TemplateProber:
         patterns = load_json(patterns_file)
         self.logger.info(f"Loaded {len(patterns)} patterns to probe")
         
-        # Probe each pattern
-        for pattern, info in patterns.items():
-            self.logger.info(f"Probing pattern: {pattern}")
-            
-            examples = info.get('examples', [])
-            if not examples:
-                self.logger.warning(f"No examples for pattern: {pattern}")
-                continue
+        if resume:
+            self.findings.update(self.load_finished())
+            self.logger.info(f"Resuming: {len(self.findings)} patterns already probed")
+        # Rewritten rather than appended to, which also drops a truncated tail
+        self.findings_stream.write_text('', encoding='utf-8')
+        for pattern, pattern_findings in self.findings.items():
+            self.append_findings(pattern, pattern_findings)
+        
+        # Examples of every pattern go through one bounded queue of workers
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        pending: Dict[str, List] = {}
+        workers = [asyncio.create_task(self._probe_worker(queue, pending))
+                   for _ in range(self.concurrency)]
+        try:
+            for pattern, info in patterns.items():
+                if pattern in self.findings:
+                    continue
+                
+                examples = info.get('examples', [])[:self.max_examples]
+                if not examples:
+                    self.logger.warning(f"No examples for pattern: {pattern}")
+                    continue
+                
+                pending[pattern] = [[None] * len(examples), len(examples)]
+                for index, url in enumerate(examples):
+                    await queue.put((pattern, index, url))
             
-            findings = await self.probe_pattern(pattern, examples)
-            self.findings[pattern] = findings
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if self.browser_pool is not None:
+                self.logger.info(f"Browser pool: {self.browser_pool.metrics()}")
+                await self.browser_pool.close()
+                self.browser_pool = None
+        
+        self.logger.info(f"Host rates: {self.rate_controller.metrics()}")
         
         # Save findings
         self.save_findings()
@@ -445,6 +558,9 @@ Examples:
   
   # Probe with specific number of examples
   python probe_template.py --domain example.com --max-examples 5
+  
+  # Continue an interrupted run from findings.yaml
+  python probe_template.py --domain example.com --resume
         """
     )
     
@@ -452,16 +568,21 @@ Examples:
     parser.add_argument('--patterns', help='Patterns file (default: patterns_to_probe.json)')
     parser.add_argument('--max-examples', type=int, default=3,
                        help='Maximum examples to probe per pattern')
+    parser.add_argument('--concurrency', type=int,
+                       help='Examples probed at once (default: browser pool capacity)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip patterns already in findings.yaml from an interrupted run')
     
     args = parser.parse_args()
     
     # Run probing
-    prober = TemplateProber(args.domain)
+    prober = TemplateProber(args.domain, max_examples=args.max_examples,
+                            concurrency=args.concurrency)
     
     patterns_file = Path(args.patterns) if args.patterns else None
     
     # Run async probe
-    findings = asyncio.run(prober.run(patterns_file))
+    findings = asyncio.run(prober.run(patterns_file, resume=args.resume))
     
     print(f"\nProbing complete!")
     print(f"Probed {len(findings)} patterns")
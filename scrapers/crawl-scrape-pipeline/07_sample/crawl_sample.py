@@ -11,14 +11,16 @@ from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from urllib.parse import urlparse
 
-from playwright.async_api import async_playwright, Page
+from playwright.async_api import Page
 import scrapy
 from scrapy.crawler import CrawlerProcess
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
 
 from config import config
+from orchestration.browser_pool import BrowserPool
 from utils_minimal import (
     setup_logging, load_json, load_yaml, save_json, append_ndjson,
     ensure_dir, create_timestamp, normalize_url
@@ -114,19 +116,17 @@ class PlaywrightCrawler:
         
         return result
     
+    async def crawl_pooled(self, pool: BrowserPool, url: str) -> Dict[str, Any]:
+        """Crawl one URL on a page leased from the pool."""
+        async with pool.page() as page:
+            print(f"Crawling {url}")
+            return await self.crawl_url(page, url)
+    
     async def crawl_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
-        """Crawl multiple URLs."""
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(**config.get_playwright_context())
-            page = await context.new_page()
-            
-            for url in urls:
-                print(f"Crawling {url}")
-                result = await self.crawl_url(page, url)
-                self.results.append(result)
-            
-            await browser.close()
+        """Crawl multiple URLs concurrently on pooled browsers."""
+        async with BrowserPool() as pool:
+            # The pool's capacity bounds how many pages render at once
+            self.results.extend(await asyncio.gather(*(self.crawl_pooled(pool, url) for url in urls)))
         
         return self.results
 
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Streaming fetch engine for step 08.
+
+Keeps a single aiohttp session (and therefore a single connection pool,
+DNS cache and TLS session cache) alive for the whole URL list and feeds it
+through a bounded pool of in-flight requests. Results are appended to
+crawl_metadata.ndjson as they complete instead of at batch boundaries.
+Per-host pacing is delegated to the shared adaptive RateController and
+page bodies go to the content-addressed PageStore under ``pages/``.
+
+In conditional mode each request carries the URL's stored ETag and
+Last-Modified validators; a 304 answer is recorded as ``unchanged`` and
+no body is stored, so downstream steps never see the page.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import aiohttp
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+from orchestration.page_store import PageStore
+from orchestration.rate_control import RateController
+from orchestration.utils_minimal import format_timestamp, logger as default_logger
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+RETRY_HTTP_CODES = {500, 502, 503, 504, 408, 429}
+
+
+class FetchEngine:
+    """Long-lived asyncio fetcher with bounded in-flight requests."""
+
+    def __init__(self, output_dir: Path, metadata_file: Path,
+                 max_in_flight: int = 32, per_host: int = 16,
+                 timeout: int = 30, retries: int = 2,
+                 headers: Optional[Dict[str, str]] = None,
+                 rate_controller: Optional[RateController] = None,
+                 conditional: bool = False,
+                 logger: Optional[logging.Logger] = None):
+        """Initialize fetch engine.
+
+        Args:
+            output_dir: Step directory; pages are stored below ``pages/``
+            metadata_file: NDJSON file that receives one record per URL
+            max_in_flight: Upper bound on concurrently running requests
+            per_host: Keep-alive connection limit per host
+            timeout: Total timeout per request in seconds
+            retries: Retries for RETRY_HTTP_CODES and network errors
+            headers: Default request headers
+            rate_controller: Shared per-host rate controller
+            conditional: Send If-None-Match / If-Modified-Since from stored validators
+            logger: Logger to report progress to
+        """
+        self.output_dir = output_dir
+        self.metadata_file = metadata_file
+        self.max_in_flight = max_in_flight
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.headers = headers or DEFAULT_HEADERS
+        self.rate_controller = rate_controller or RateController(
+            max_concurrency=per_host)
+        self.conditional = conditional
+        self.logger = logger or default_logger
+
+        self.stats = {
+            'total': 0,
+            'success': 0,
+            'failed': 0,
+            'unchanged': 0,
+            'bytes': 0,
+        }
+        self.page_store_dir = output_dir / 'pages'
+        self._page_store: Optional[PageStore] = None
+        self._metadata_fh = None
+
+    def _write_metadata(self, record: Dict[str, Any]) -> None:
+        """Append a single result record to the metadata file."""
+        self._metadata_fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    async def fetch_one(self, session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+        """Fetch a single URL, retrying transient failures.
+
+        Each attempt waits for a slot from the rate controller, which also
+        enforces any Retry-After pause reported by a previous attempt.
+        """
+        delay = 1.0
+        headers = self.conditional_headers(url) if self.conditional else None
+
+        for attempt in range(self.retries + 1):
+            async with self.rate_controller.slot(url):
+                start = time.time()
+                try:
+                    async with session.get(url, headers=headers, allow_redirects=True) as response:
+                        body = await response.read()
+                        latency = time.time() - start
+                        self.rate_controller.record(url, response.status, latency, response.headers)
+
+                        if response.status in RETRY_HTTP_CODES and attempt < self.retries:
+                            self.logger.warning(f"{url} returned {response.status}, retrying")
+                        else:
+                            return {
+                                'url': str(response.url),
+                                'requested_url': url,
+                                'status': response.status,
+                                'timestamp': format_timestamp(),
+                                'headers': dict(response.headers),
+                                # Read before the dict copy drops case-insensitive
+                                # lookup (HTTP/2 header names are lower case)
+                                'validators': {
+                                    'etag': response.headers.get('ETag'),
+                                    'last_modified': response.headers.get('Last-Modified'),
+                                    'cache_control': response.headers.get('Cache-Control'),
+                                },
+                                'meta': {
+                                    'download_latency': latency,
+                                    'redirect_urls': [str(r.url) for r in response.history],
+                                    'attempts': attempt + 1,
+                                },
+                                'body': body,
+                            }
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.rate_controller.record(url, 0, time.time() - start)
+                    if attempt >= self.retries:
+                        return {
+                            'url': url,
+                            'requested_url': url,
+                            'status': 0,
+                            'timestamp': format_timestamp(),
+                            'error': str(e) or type(e).__name__,
+                            'meta': {'attempts': attempt + 1},
+                        }
+
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    def conditional_headers(self, url: str) -> Optional[Dict[str, str]]:
+        """Build If-None-Match / If-Modified-Since headers for a URL."""
+        validators = self._page_store.validators(url)
+        if not validators:
+            return None
+
+        headers = {}
+        if validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers or None
+
+    def handle_result(self, result: Dict[str, Any]) -> None:
+        """Persist a fetched page and record its metadata."""
+        body = result.pop('body', None)
+        validators = result.pop('validators', None)
+
+        if result['status'] == 304:
+            result['unchanged'] = True
+            self.stats['unchanged'] += 1
+        elif result['status'] == 200 and body is not None:
+            previous = self._page_store.lookup(result['url']) if self.conditional else None
+            digest = PageStore.content_hash(body)
+            result['content_hash'] = digest
+            result['content_length'] = len(body)
+
+            if previous and previous[1] == digest:
+                # Server ignored the validators but the body is identical
+                result['unchanged'] = True
+                self.stats['unchanged'] += 1
+            else:
+                self._page_store.put(result['url'], body, result['timestamp'], result['status'])
+                self.stats['success'] += 1
+                self.stats['bytes'] += len(body)
+
+            self._page_store.set_validators(result['requested_url'], **validators)
+        else:
+            self.stats['failed'] += 1
+
+        self._write_metadata(result)
+
+    async def worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue) -> None:
+        """Worker coroutine that drains URLs from the shared queue."""
+        while True:
+            url = await queue.get()
+            try:
+                if url is None:
+                    return
+                result = await self.fetch_one(session, url)
+                self.handle_result(result)
+
+                done = self.stats['success'] + self.stats['failed'] + self.stats['unchanged']
+                if done % 1000 == 0:
+                    self.logger.info(f"Fetched {done} URLs ({self.stats['success']} ok, "
+                                     f"{self.stats['unchanged']} unchanged, {self.stats['failed']} failed)")
+            except Exception as e:
+                self.logger.error(f"Worker error on {url}: {e}")
+            finally:
+                queue.task_done()
+
+    async def fetch_all(self, urls: Iterable[str]) -> Dict[str, Any]:
+        """Stream every URL through the worker pool."""
+        start_time = time.time()
+
+        # The queue only holds a small window ahead of the workers so memory
+        # stays flat no matter how long the URL iterable is.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_in_flight * 2)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        self.metadata_file.parent.mkdir(parents=True, exist_ok=True)
+        with PageStore(self.page_store_dir) as self._page_store, \
+                open(self.metadata_file, 'a', encoding='utf-8', buffering=1) as self._metadata_fh:
+            async with aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                             timeout=client_timeout) as session:
+                workers = [asyncio.create_task(self.worker(session, queue))
+                           for _ in range(self.max_in_flight)]
+
+                for url in urls:
+                    await queue.put(url)
+                    self.stats['total'] += 1
+
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+
+            self.stats['page_store'] = self._page_store.stats()
+
+        duration = time.time() - start_time
+        self.stats['duration'] = duration
+        self.stats['rate'] = self.stats['success'] / duration if duration > 0 else 0
+
+        self.logger.info(f"Fetched {self.stats['total']} URLs in {duration:.1f}s")
+        self.logger.info(f"  Success: {self.stats['success']}/{self.stats['total']}")
+        if self.conditional:
+            self.logger.info(f"  Unchanged (304): {self.stats['unchanged']}/{self.stats['total']}")
+        self.logger.info(f"  Rate: {self.stats['rate']:.1f} pages/sec")
+
+        self.stats['host_rates'] = self.rate_controller.metrics()
+        for host, host_stats in self.stats['host_rates'].items():
+            self.logger.info(f"  {host}: {host_stats['rate']:.2f} req/s, "
+                             f"concurrency {host_stats['concurrency']}, "
+                             f"{host_stats['throttled']} throttled")
+
+        return self.stats
+
+    def run(self, urls: Iterable[str]) -> Dict[str, Any]:
+        """Synchronous entry point."""
+        return asyncio.run(self.fetch_all(urls))
@@ -5,24 +5,80 @@ Extracts structured data from crawled HTML pages using configured selectors.
 """
 
 import argparse
+import codecs
+import re
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import json
 
-from bs4 import BeautifulSoup
 from lxml import html
-import extruct
+from lxml.cssselect import CSSSelector
+from extruct.jsonld import JsonLdExtractor
+from extruct.opengraph import OpenGraphExtractor
+from extruct.rdfa import RDFaExtractor
+from extruct.w3cmicrodata import MicrodataExtractor
+from extruct.xmldom import XmlDomHTMLParser
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
 
 from config import config
 from utils_minimal import (
-    setup_logging, load_json, load_yaml, save_json, append_ndjson,
-    load_ndjson, ensure_dir, create_timestamp, clean_text, extract_price
+    setup_logging, load_json, load_yaml, save_json,
+    load_ndjson, ensure_dir, create_timestamp
 )
+from orchestration.page_store import PageStore
+from selector_plan import SelectorPlan
+
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+# Browsers read these labels as windows-1252, and so do retail sites' pages
+WINDOWS_1252_LABELS = frozenset(['iso-8859-1', 'latin1', 'latin-1', 'ascii', 'us-ascii'])
+
+PRODUCT_DETAIL_MARKERS = CSSSelector('div.product-detail, [itemtype="http://schema.org/Product"]')
+PRODUCT_LISTING_MARKERS = CSSSelector('div.product-item, article.product')
+
+
+def html_parser() -> XmlDomHTMLParser:
+    """Parser for one page.
+    
+    Pages are decoded to str before parsing; re-encoding to UTF-8 and pinning
+    the parser encoding avoids lxml rejecting str input that carries an XML
+    encoding declaration. Its elements are ordinary HtmlElements that also
+    speak xml.dom, which RDFa extraction needs. The parser caches element
+    classes per document, so it must not be shared between pages.
+    """
+    return XmlDomHTMLParser(encoding='utf-8')
+
+
+def page_encoding(body: bytes, headers: Optional[Dict[str, str]] = None) -> str:
+    """Charset of a stored page: Content-Type header, then <meta>, then a UTF-8 check."""
+    candidates = []
+    for name, value in (headers or {}).items():
+        if name.lower() == 'content-type' and 'charset=' in value.lower():
+            candidates.append(value.lower().split('charset=', 1)[1].split(';')[0].strip(' "\''))
+    match = META_CHARSET.search(body[:4096])
+    if match:
+        candidates.append(match.group(1).decode('ascii', 'ignore').lower())
+    
+    for label in candidates:
+        if label in WINDOWS_1252_LABELS:
+            return 'cp1252'
+        try:
+            return codecs.lookup(label).name
+        except LookupError:
+            continue
+    
+    try:
+        body.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
 
 
 class DOMParser:
@@ -34,6 +90,14 @@ class DOMParser:
         self.logger = setup_logging('dom_parser', Path(__file__).parent / 'scrape.log')
         self.output_file = Path(__file__).parent / 'parsed.ndjson'
         self.selectors = self.load_selectors()
+        # Compiled once per process; pages only execute the plan
+        self.plan = SelectorPlan(self.selectors, Path(__file__).parent / 'selector_plan.cache.json')
+        self.structured_extractors = [
+            ('json_ld', JsonLdExtractor().extract_items),
+            ('microdata', MicrodataExtractor().extract_items),
+            ('opengraph', OpenGraphExtractor().extract_items),
+            ('rdfa', RDFaExtractor().extract_items),
+        ]
     
     def load_selectors(self) -> Dict[str, Dict[str, Any]]:
         """Load CSS selectors configuration."""
@@ -63,125 +127,21 @@ class DOMParser:
             },
         }
     
-    def extract_structured_data(self, html_content: str, url: str) -> Dict[str, Any]:
-        """Extract structured data (JSON-LD, microdata, etc.)."""
+    def extract_structured_data(self, tree: html.HtmlElement, url: str) -> Dict[str, Any]:
+        """Extract structured data (JSON-LD, microdata, Open Graph, RDFa) from the parsed tree."""
         structured = {}
         
-        try:
-            # Extract all structured data formats
-            data = extruct.extract(html_content, url)
-            
-            # JSON-LD
-            if data.get('json-ld'):
-                structured['json_ld'] = data['json-ld']
-            
-            # Microdata
-            if data.get('microdata'):
-                structured['microdata'] = data['microdata']
-            
-            # Open Graph
-            if data.get('opengraph'):
-                structured['opengraph'] = data['opengraph']
-            
-            # RDFa
-            if data.get('rdfa'):
-                structured['rdfa'] = data['rdfa']
-                
-        except Exception as e:
-            self.logger.debug(f"Error extracting structured data: {e}")
-        
-        return structured
-    
-    def extract_with_css(self, soup: BeautifulSoup, selectors: Dict[str, Any]) -> Dict[str, Any]:
-        """Extract data using CSS selectors."""
-        extracted = {}
-        
-        for field, selector_list in selectors.items():
-            if not isinstance(selector_list, list):
-                selector_list = [selector_list]
-            
-            for selector in selector_list:
-                try:
-                    if field == 'images':
-                        # Special handling for images
-                        elements = soup.select(selector)
-                        values = []
-                        for elem in elements:
-                            src = elem.get('src', '') or elem.get('data-src', '')
-                            if src:
-                                values.append(src)
-                        if values:
-                            extracted[field] = values
-                            break
-                    elif field == 'price':
-                        # Special handling for price
-                        elements = soup.select(selector)
-                        for elem in elements:
-                            text = elem.get_text(strip=True)
-                            price = extract_price(text)
-                            if price:
-                                extracted[field] = price
-                                extracted[f'{field}_text'] = text
-                                break
-                        if field in extracted:
-                            break
-                    else:
-                        # Regular text extraction
-                        elements = soup.select(selector)
-                        if elements:
-                            if len(elements) == 1:
-                                text = clean_text(elements[0].get_text())
-                                if text:
-                                    extracted[field] = text
-                            else:
-                                texts = [clean_text(e.get_text()) for e in elements]
-                                texts = [t for t in texts if t]
-                                if texts:
-                                    extracted[field] = texts
-                            break
-                            
-                except Exception as e:
-                    self.logger.debug(f"Error with selector {selector}: {e}")
-        
-        return extracted
-    
-    def extract_with_xpath(self, tree: html.HtmlElement, selectors: Dict[str, str]) -> Dict[str, Any]:
-        """Extract data using XPath selectors."""
-        extracted = {}
-        
-        for field, xpath in selectors.items():
+        for key, extract in self.structured_extractors:
             try:
-                if field == 'images':
-                    elements = tree.xpath(xpath)
-                    values = []
-                    for elem in elements:
-                        if hasattr(elem, 'get'):
-                            src = elem.get('src', '') or elem.get('data-src', '')
-                        else:
-                            src = str(elem)
-                        if src:
-                            values.append(src)
-                    if values:
-                        extracted[field] = values
-                else:
-                    values = tree.xpath(xpath)
-                    if values:
-                        if len(values) == 1:
-                            text = clean_text(str(values[0]))
-                            if text:
-                                extracted[field] = text
-                        else:
-                            texts = [clean_text(str(v)) for v in values]
-                            texts = [t for t in texts if t]
-                            if texts:
-                                extracted[field] = texts
-                                
+                items = list(extract(tree, url))
+                if items:
+                    structured[key] = items
             except Exception as e:
-                self.logger.debug(f"Error with XPath {xpath}: {e}")
+                self.logger.debug(f"Error extracting {key}: {e}")
         
-        return extracted
+        return structured
     
-    def guess_page_type(self, url: str, soup: BeautifulSoup) -> str:
+    def guess_page_type(self, url: str, tree: html.HtmlElement) -> str:
         """Guess the type of page based on URL and content."""
         url_lower = url.lower()
         
@@ -192,9 +152,9 @@ class DOMParser:
             return 'product_listing'
         
         # Check page content
-        if soup.find('div', class_='product-detail') or soup.find(attrs={'itemtype': 'http://schema.org/Product'}):
+        if PRODUCT_DETAIL_MARKERS(tree):
             return 'product_detail'
-        if soup.find_all('div', class_='product-item') or soup.find_all('article', class_='product'):
+        if PRODUCT_LISTING_MARKERS(tree):
             return 'product_listing'
         
         return 'unknown'
@@ -205,67 +165,140 @@ class DOMParser:
             # Read HTML content
             with open(html_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
-            
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Also parse with lxml for XPath support
-            tree = html.fromstring(html_content)
+        except Exception as e:
+            self.logger.error(f"Error reading {html_path}: {e}")
+            return None
+        
+        return self.parse_html(html_content, metadata, {'file_path': str(html_path)})
+    
+    def parse_html(self, html_content: str, metadata: Dict[str, Any],
+                   source: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Parse one page's HTML; ``source`` records where it was read from."""
+        try:
+            # Parse exactly once; CSS, XPath and structured data all read this tree
+            tree = html.document_fromstring(html_content.encode('utf-8'), parser=html_parser())
             
             # Start with metadata
             result = {
                 'url': metadata.get('url'),
                 'timestamp_crawled': metadata.get('timestamp'),
                 'timestamp_parsed': create_timestamp(),
-                'file_path': str(html_path),
+                **source,
             }
             
             # Extract structured data
-            structured = self.extract_structured_data(html_content, result['url'])
+            structured = self.extract_structured_data(tree, result['url'])
             if structured:
                 result['structured_data'] = structured
             
             # Guess page type
-            page_type = self.guess_page_type(result['url'], soup)
+            page_type = self.guess_page_type(result['url'], tree)
             result['page_type'] = page_type
             
-            # Get appropriate selectors
-            if page_type in self.selectors:
-                selectors = self.selectors[page_type]
-            else:
+            # Pick the compiled plan for this page
+            plan_name = page_type
+            if plan_name not in self.plan:
                 # Try to match pattern from grouping
                 pattern = metadata.get('pattern')
-                if pattern and pattern in self.selectors:
-                    selectors = self.selectors[pattern]
-                else:
-                    selectors = self.selectors.get('product_detail', {})
-            
-            # Extract with CSS selectors
-            css_data = self.extract_with_css(soup, selectors)
-            if css_data:
-                result['extracted_data'] = css_data
+                plan_name = pattern if pattern and pattern in self.plan else 'product_detail'
             
-            # Try XPath if we have XPath selectors
-            xpath_selectors = {}
-            for field, selector in selectors.items():
-                if isinstance(selector, str) and selector.startswith('//'):
-                    xpath_selectors[field] = selector
-            
-            if xpath_selectors:
-                xpath_data = self.extract_with_xpath(tree, xpath_selectors)
-                if xpath_data:
-                    result['extracted_data'].update(xpath_data)
+            # CSS and XPath selectors run from the same compiled plan
+            extracted = self.plan.execute(tree, plan_name)
+            if extracted:
+                result['extracted_data'] = extracted
             
             return result
             
         except Exception as e:
-            self.logger.error(f"Error parsing {html_path}: {e}")
+            self.logger.error(f"Error parsing {source}: {e}")
             return None
     
-    def process_batch(self, batch_dir: Path) -> List[Dict[str, Any]]:
-        """Process all HTML files in a batch directory."""
-        results = []
+    def parse_task(self, task: Tuple[str, Any, Dict[str, Any], Dict[str, Any]],
+                   store: Optional[PageStore] = None) -> Optional[Dict[str, Any]]:
+        """Parse one unit of work produced by ``batch_tasks`` or ``page_store_tasks``.
+        
+        A task is ``(kind, ref, metadata, source)`` where ``ref`` is an HTML
+        file path for ``'file'`` tasks or a content hash for ``'page'`` tasks.
+        """
+        kind, ref, metadata, source = task
+        if kind == 'file':
+            return self.parse_html_file(Path(ref), metadata)
+        
+        body = store.get_blob(ref)
+        if body is None:
+            self.logger.error(f"Missing page body {ref} for {metadata.get('url')}")
+            return None
+        encoding = page_encoding(body, metadata.get('headers'))
+        return self.parse_html(body.decode(encoding, errors='replace'), metadata, source)
+    
+    def iter_parsed(self, tasks: Iterable[Tuple], executor: Optional[ProcessPoolExecutor] = None,
+                    store: Optional[PageStore] = None, window: int = 64) -> Iterator[Optional[Dict[str, Any]]]:
+        """Parse tasks serially or across a process pool, yielding results.
+        
+        With a pool only ``window`` tasks are in flight at a time, so the
+        task iterable is consumed lazily and memory stays flat.
+        """
+        if executor is None:
+            for task in tasks:
+                yield self.parse_task(task, store)
+            return
+        
+        in_flight = set()
+        for task in tasks:
+            in_flight.add(executor.submit(_parse_in_worker, task))
+            if len(in_flight) >= window:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self.collect(future)
         
+        for future in as_completed(in_flight):
+            yield self.collect(future)
+    
+    def collect(self, future) -> Optional[Dict[str, Any]]:
+        """Unpack a worker result, folding its selector counters into ours."""
+        result, selector_stats = future.result()
+        self.plan.merge_stats(selector_stats)
+        return result
+    
+    def save_selector_stats(self) -> None:
+        """Write per-selector hit rates and timing for this run."""
+        report = self.plan.report()
+        save_json(report, config.dirs['scrape'] / 'selector_stats.json')
+        for dead in report['never_hit']:
+            self.logger.info(f"Selector never matched: {dead}")
+    
+    def iter_successful(self, results: Iterable[Optional[Dict[str, Any]]],
+                        stats: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Count parse results into ``stats`` and yield the ones that succeeded."""
+        for result in results:
+            stats['total_files'] += 1
+            if result:
+                stats['successful'] += 1
+                yield result
+            
+            if stats['total_files'] % 1000 == 0:
+                self.logger.info(f"Parsed {stats['total_files']} pages ({stats['successful']} successful)")
+    
+    def write_results(self, results: Iterable[Optional[Dict[str, Any]]], stats: Dict[str, Any],
+                      append: bool = False) -> None:
+        """Single writer: write parsed records to parsed.ndjson as they arrive.
+        
+        The file is replaced so dedupe, clean and load see only this run's
+        pages; ``append`` keeps earlier results (one batch at a time).
+        """
+        with open(self.output_file, 'a' if append else 'w', encoding='utf-8') as out:
+            for result in self.iter_successful(results, stats):
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    
+    def create_pool(self, max_workers: int, store_dir: Optional[Path] = None) -> Optional[ProcessPoolExecutor]:
+        """Start a process pool whose workers each hold their own parser."""
+        if max_workers <= 1:
+            return None
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                   initargs=(self.domain, store_dir))
+    
+    def batch_tasks(self, batch_dir: Path) -> Iterator[Tuple]:
+        """Yield parse tasks for all HTML files in a batch directory."""
         # Load metadata for this batch
         metadata_file = batch_dir.parent.parent / f"{batch_dir.name}.ndjson"
         metadata_map = {}
@@ -284,18 +317,84 @@ class DOMParser:
             # Find metadata
             relative_path = f"html/{batch_dir.name}/{html_file.name}"
             metadata = metadata_map.get(relative_path, {'url': 'unknown'})
-            
-            # Parse file
-            result = self.parse_html_file(html_file, metadata)
-            if result:
-                results.append(result)
+            yield ('file', str(html_file), metadata, {})
+    
+    def process_batch(self, batch_dir: Path) -> List[Dict[str, Any]]:
+        """Process all HTML files in a batch directory."""
+        return [result for result in self.iter_parsed(self.batch_tasks(batch_dir)) if result]
+    
+    def load_fetch_metadata(self) -> Dict[str, Dict[str, Any]]:
+        """Load the fetch engine's metadata records keyed by URL."""
+        metadata_file = Path(__file__).parent.parent / '08_fetch' / 'crawl_metadata.ndjson'
+        metadata_map = {}
+        
+        if metadata_file.exists():
+            for record in load_ndjson(metadata_file):
+                if record.get('content_hash'):
+                    metadata_map[record['url']] = record
+        
+        return metadata_map
+    
+    def page_store_tasks(self, store: PageStore, since: Optional[str] = None) -> Iterator[Tuple]:
+        """Yield parse tasks for the latest fetch of every URL in the page store.
         
-        return results
+        ``since`` restricts parsing to pages stored at or after that
+        timestamp, so a conditional refresh only parses changed pages.
+        """
+        metadata_map = self.load_fetch_metadata()
+        
+        for entry in store.iter_latest(since=since):
+            if entry['status'] != 200:
+                continue
+            metadata = metadata_map.get(entry['url'], {'url': entry['url'], 'timestamp': entry['fetched_at']})
+            source = {'content_hash': entry['hash'], 'fetched_at': entry['fetched_at']}
+            # Workers read the body from the store themselves, so only the
+            # hash crosses the process boundary
+            yield ('page', entry['hash'], metadata, source)
+    
+    def iter_page_store(self, store_dir: Path, since: Optional[str] = None,
+                        max_workers: int = 1) -> Iterator[Optional[Dict[str, Any]]]:
+        """Parse results for the latest fetch of every URL in the page store, as they finish."""
+        with PageStore(store_dir) as store:
+            executor = self.create_pool(max_workers, store_dir)
+            try:
+                tasks = self.page_store_tasks(store, since=since)
+                yield from self.iter_parsed(tasks, executor, store, window=max_workers * 4)
+            finally:
+                if executor:
+                    executor.shutdown()
+    
+    def process_page_store(self, store_dir: Path, since: Optional[str] = None,
+                           max_workers: int = 1) -> Dict[str, Any]:
+        """Parse the latest fetch of every URL in the page store."""
+        stats = {'total_files': 0, 'successful': 0}
+        self.write_results(self.iter_page_store(store_dir, since=since, max_workers=max_workers), stats)
+        return stats
     
-    def run(self, batch_id: Optional[str] = None, max_workers: int = 4) -> Dict[str, Any]:
-        """Run DOM parsing on crawled HTML files."""
+    def run(self, batch_id: Optional[str] = None, max_workers: int = 4,
+            since: Optional[str] = None) -> Dict[str, Any]:
+        """Run DOM parsing on crawled HTML files.
+        
+        With ``max_workers`` > 1 pages are sharded across a process pool;
+        results are still written by this process only.
+        """
         self.logger.info(f"Starting DOM parsing for domain: {self.domain}")
         
+        # Prefer the content-addressed page store written by the fetch engine
+        store_dir = Path(__file__).parent.parent / '08_fetch' / 'pages'
+        if not batch_id and (store_dir / 'index.sqlite').exists():
+            stats = {'source': 'page_store', 'workers': max_workers, 'start_time': create_timestamp()}
+            stats.update(self.process_page_store(store_dir, since=since, max_workers=max_workers))
+            stats['failed'] = stats['total_files'] - stats['successful']
+            stats['end_time'] = create_timestamp()
+            save_json(stats, config.dirs['scrape'] / 'parse_stats.json')
+            self.save_selector_stats()
+            
+            self.logger.info("Parsing complete!")
+            self.logger.info(f"Total pages: {stats['total_files']}")
+            self.logger.info(f"Successful: {stats['successful']}")
+            return stats
+        
         html_dir = Path(__file__).parent.parent / '08_fetch' / 'html'
         if not html_dir.exists():
             self.logger.error("No HTML directory found. Run fetch step first.")
@@ -314,27 +413,23 @@ class DOMParser:
         self.logger.info(f"Found {len(batch_dirs)} batches to process")
         
         # Process batches
-        all_results = []
         stats = {
             'total_batches': len(batch_dirs),
             'total_files': 0,
             'successful': 0,
             'failed': 0,
+            'workers': max_workers,
             'start_time': create_timestamp(),
         }
         
-        for batch_dir in batch_dirs:
-            batch_results = self.process_batch(batch_dir)
-            
-            # Save results incrementally
-            for result in batch_results:
-                append_ndjson(result, self.output_file)
-            
-            all_results.extend(batch_results)
-            stats['total_files'] += len(list(batch_dir.glob('*.html')))
-            stats['successful'] += len(batch_results)
-            
-            self.logger.info(f"Batch {batch_dir.name}: {len(batch_results)} parsed")
+        tasks = (task for batch_dir in batch_dirs for task in self.batch_tasks(batch_dir))
+        executor = self.create_pool(max_workers)
+        try:
+            self.write_results(self.iter_parsed(tasks, executor, window=max_workers * 4), stats,
+                               append=bool(batch_id))
+        finally:
+            if executor:
+                executor.shutdown()
         
         stats['failed'] = stats['total_files'] - stats['successful']
         stats['end_time'] = create_timestamp()
@@ -342,6 +437,7 @@ class DOMParser:
         # Save statistics
         stats_file = config.dirs['scrape'] / 'parse_stats.json'
         save_json(stats, stats_file)
+        self.save_selector_stats()
         
         # Log summary
         self.logger.info("Parsing complete!")
@@ -352,6 +448,29 @@ class DOMParser:
         return stats
 
 
+# Per-process state for pool workers. The initializer builds one parser
+# (and its selector configuration) per worker process instead of per page.
+_worker_parser: Optional[DOMParser] = None
+_worker_store: Optional[PageStore] = None
+
+
+def _init_worker(domain: str, store_dir: Optional[Path]) -> None:
+    """Process pool initializer."""
+    global _worker_parser, _worker_store
+    _worker_parser = DOMParser(domain)
+    _worker_store = PageStore(store_dir) if store_dir else None
+
+
+def _parse_in_worker(task: Tuple) -> Tuple[Optional[Dict[str, Any]], Dict]:
+    """Parse a task with the worker-local parser.
+    
+    Selector counters are drained alongside each result so the parent's
+    plan report covers every worker.
+    """
+    result = _worker_parser.parse_task(task, _worker_store)
+    return result, _worker_parser.plan.drain_stats()
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -365,21 +484,26 @@ Examples:
   # Parse specific batch
   python parse_dom.py --domain example.com --batch batch_0001
   
-  # Use more workers for parallel processing
-  python parse_dom.py --domain example.com --workers 8
+  # Only pages that changed since a refresh started
+  python parse_dom.py --domain example.com --since 2025-06-15T03:00:00
+  
+  # Shard pages across 16 worker processes
+  python parse_dom.py --domain example.com --workers 16
         """
     )
     
     parser.add_argument('--domain', required=True, help='Domain being parsed')
     parser.add_argument('--batch', help='Specific batch ID to parse')
     parser.add_argument('--workers', type=int, default=4,
-                       help='Number of parallel workers')
+                       help='Number of parser processes (1 parses in-process)')
+    parser.add_argument('--since',
+                       help='Only parse pages fetched at or after this ISO timestamp')
     
     args = parser.parse_args()
     
     # Run parser
     parser = DOMParser(args.domain)
-    stats = parser.run(batch_id=args.batch, max_workers=args.workers)
+    stats = parser.run(batch_id=args.batch, max_workers=args.workers, since=args.since)
     
     if stats:
         print(f"\nParsing complete!")
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Compiled selector plans for the DOM parser.
+
+The selector configuration (06_plan/css_selectors.yaml, or the parser's
+built-in defaults) is compiled once into a plan: every CSS selector is
+translated to XPath, every expression is compiled, and every field gets
+its extract/normalize function and fallback chain up front. Parsing a
+page is then just running the plan against the lxml tree.
+
+Two config shapes are understood:
+
+* flat fields - ``field: selector`` or ``field: [selector, fallback, ...]``
+* item blocks - ``name: {selector: ..., fields: {field: selector}}``, which
+  yield one record per matching container element
+
+Selectors starting with ``/`` or ``(`` are XPath, anything else is CSS.
+CSS may end in Scrapy-style ``::text`` or ``::attr(name)``.
+
+The CSS-to-XPath translation is cached on disk keyed by the config hash,
+and every selector records attempts, hits and time spent, so fallbacks
+that never fire show up in selector_stats.json.
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cssselect import HTMLTranslator, parse as parse_css
+from cssselect.parser import FunctionalPseudoElement
+from lxml import etree
+
+# Same helpers the parser uses; callers put orchestration/ on sys.path
+from utils_minimal import clean_text, extract_price
+
+
+# Bump when the serialized plan layout changes
+PLAN_VERSION = 1
+
+_translator = HTMLTranslator()
+
+
+def css_to_xpath(selector: str) -> str:
+    """Translate a CSS selector (with optional ::text / ::attr()) to XPath."""
+    branches = []
+    for parsed in parse_css(selector):
+        xpath = _translator.selector_to_xpath(parsed)
+        pseudo = parsed.pseudo_element
+        if pseudo == 'text':
+            xpath += '/text()'
+        elif isinstance(pseudo, FunctionalPseudoElement) and pseudo.name == 'attr':
+            xpath += '/@' + pseudo.arguments[0].value
+        elif pseudo:
+            raise ValueError(f"Unsupported pseudo-element in {selector!r}")
+        branches.append(xpath)
+    return ' | '.join(branches)
+
+
+def is_xpath(selector: str) -> bool:
+    return selector.startswith('/') or selector.startswith('(')
+
+
+def _node_text(node: Any) -> str:
+    """Text of an element, or the string value of a text/attribute result."""
+    if isinstance(node, etree._Element):
+        return node.text_content()
+    return str(node)
+
+
+def extract_images(nodes: List[Any], field: str) -> Dict[str, Any]:
+    values = []
+    for node in nodes:
+        if isinstance(node, etree._Element):
+            src = node.get('src', '') or node.get('data-src', '')
+        else:
+            src = str(node)
+        if src:
+            values.append(src)
+    return {field: values} if values else {}
+
+
+def extract_price_field(nodes: List[Any], field: str) -> Dict[str, Any]:
+    for node in nodes:
+        text = _node_text(node).strip()
+        price = extract_price(text)
+        if price:
+            return {field: price, f'{field}_text': text}
+    return {}
+
+
+def extract_text(nodes: List[Any], field: str) -> Dict[str, Any]:
+    texts = [clean_text(_node_text(node)) for node in nodes]
+    texts = [t for t in texts if t]
+    if not texts:
+        return {}
+    return {field: texts[0] if len(nodes) == 1 else texts}
+
+
+# Per-field extract/normalize functions; anything else is cleaned text
+FIELD_EXTRACTORS: Dict[str, Callable[[List[Any], str], Dict[str, Any]]] = {
+    'images': extract_images,
+    'image': extract_images,
+    'price': extract_price_field,
+}
+
+
+class SelectorStep:
+    """One compiled selector in a field's fallback chain."""
+
+    __slots__ = ('source', 'xpath', 'compiled', 'attempts', 'hits', 'seconds')
+
+    def __init__(self, source: str, xpath: str):
+        self.source = source
+        self.xpath = xpath
+        self.compiled = etree.XPath(xpath)
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def __call__(self, node: Any) -> List[Any]:
+        start = time.perf_counter()
+        try:
+            return self.compiled(node)
+        finally:
+            self.attempts += 1
+            self.seconds += time.perf_counter() - start
+
+
+class FieldPlan:
+    """A field's fallback chain plus its extract function.
+
+    Item blocks carry a ``container`` step and nested field plans instead.
+    """
+
+    def __init__(self, name: str, steps: List[SelectorStep],
+                 children: Optional[List['FieldPlan']] = None):
+        self.name = name
+        self.steps = steps
+        self.children = children
+        self.extract = FIELD_EXTRACTORS.get(name, extract_text)
+
+    def run(self, node: Any) -> Dict[str, Any]:
+        if self.children is not None:
+            return self.run_items(node)
+
+        for step in self.steps:
+            try:
+                nodes = step(node)
+            except etree.XPathError:
+                continue
+            if nodes:
+                values = self.extract(nodes, self.name)
+                if values:
+                    step.hits += 1
+                    return values
+        return {}
+
+    def run_items(self, node: Any) -> Dict[str, Any]:
+        container = self.steps[0]
+        records = []
+        for element in container(node):
+            record = {}
+            for child in self.children:
+                record.update(child.run(element))
+            if record:
+                records.append(record)
+        if records:
+            container.hits += 1
+            return {self.name: records}
+        return {}
+
+    def iter_steps(self, prefix: str):
+        for step in self.steps:
+            yield f'{prefix}.{self.name}', step
+        for child in self.children or []:
+            yield from child.iter_steps(f'{prefix}.{self.name}')
+
+
+def _compile_step(selector: str, translated: Dict[str, str]) -> SelectorStep:
+    xpath = translated.get(selector)
+    if xpath is None:
+        xpath = translated[selector] = selector if is_xpath(selector) else css_to_xpath(selector)
+    return SelectorStep(selector, xpath)
+
+
+def _compile_field(name: str, spec: Any, translated: Dict[str, str]) -> Optional[FieldPlan]:
+    if isinstance(spec, dict):
+        if 'selector' not in spec:
+            return None
+        children = [_compile_field(child, child_spec, translated)
+                    for child, child_spec in (spec.get('fields') or {}).items()]
+        return FieldPlan(name, [_compile_step(spec['selector'], translated)],
+                         [c for c in children if c is not None])
+
+    selectors = spec if isinstance(spec, list) else [spec]
+    steps = [_compile_step(s, translated) for s in selectors if isinstance(s, str) and s]
+    return FieldPlan(name, steps) if steps else None
+
+
+def config_hash(selectors: Dict[str, Any]) -> str:
+    """Stable hash of a selector configuration."""
+    canonical = json.dumps(selectors, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SelectorPlan:
+    """Selector configuration compiled into per-page-type field plans."""
+
+    def __init__(self, selectors: Dict[str, Dict[str, Any]], cache_file: Optional[Path] = None):
+        self.config_hash = config_hash(selectors)
+        self.cache_file = cache_file
+
+        # CSS -> XPath translation is the expensive part of compiling, and
+        # unlike compiled XPath objects it can be stored
+        translated = self._load_translations()
+        cached = len(translated)
+
+        self.plans: Dict[str, List[FieldPlan]] = {}
+        for page_type, fields in selectors.items():
+            if not isinstance(fields, dict):
+                continue
+            compiled = [_compile_field(field, spec, translated) for field, spec in fields.items()]
+            self.plans[page_type] = [plan for plan in compiled if plan is not None]
+
+        if len(translated) != cached:
+            self._save_translations(translated)
+
+    def _load_translations(self) -> Dict[str, str]:
+        if not self.cache_file or not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cached.get('version') != PLAN_VERSION or cached.get('config_hash') != self.config_hash:
+            return {}
+        return cached.get('xpath', {})
+
+    def _save_translations(self, translated: Dict[str, str]) -> None:
+        if not self.cache_file:
+            return
+        payload = {'version': PLAN_VERSION, 'config_hash': self.config_hash, 'xpath': translated}
+        tmp = self.cache_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        tmp.replace(self.cache_file)
+
+    def __contains__(self, page_type: str) -> bool:
+        return page_type in self.plans
+
+    def execute(self, tree: Any, page_type: str) -> Dict[str, Any]:
+        """Run the plan for ``page_type`` against a parsed document."""
+        extracted = {}
+        for field in self.plans.get(page_type, []):
+            extracted.update(field.run(tree))
+        return extracted
+
+    def iter_steps(self):
+        for page_type, fields in self.plans.items():
+            for field in fields:
+                yield from field.iter_steps(page_type)
+
+    def drain_stats(self) -> Dict[Tuple[str, str], Tuple[int, int, float]]:
+        """Return and reset counters as ``{(field, selector): (attempts, hits, seconds)}``.
+
+        Pool workers drain after each page and the parent merges, so the
+        counters stay exact without shared state.
+        """
+        drained = {}
+        for key, step in self.iter_steps():
+            if step.attempts:
+                drained[(key, step.source)] = (step.attempts, step.hits, step.seconds)
+                step.attempts = step.hits = 0
+                step.seconds = 0.0
+        return drained
+
+    def merge_stats(self, drained: Dict[Tuple[str, str], Tuple[int, int, float]]) -> None:
+        """Fold counters drained from a worker into this plan."""
+        if not drained:
+            return
+        for key, step in self.iter_steps():
+            counts = drained.get((key, step.source))
+            if counts:
+                step.attempts += counts[0]
+                step.hits += counts[1]
+                step.seconds += counts[2]
+
+    def report(self) -> Dict[str, Any]:
+        """Per-selector hit rates and timing, plus selectors that never matched."""
+        selectors = []
+        for key, step in self.iter_steps():
+            selectors.append({
+                'field': key,
+                'selector': step.source,
+                'attempts': step.attempts,
+                'hits': step.hits,
+                'hit_rate': round(step.hits / step.attempts, 4) if step.attempts else None,
+                'total_ms': round(step.seconds * 1000, 3),
+                'avg_us': round(step.seconds * 1e6 / step.attempts, 2) if step.attempts else None,
+            })
+
+        return {
+            'config_hash': self.config_hash,
+            'selectors': selectors,
+            'never_hit': [f"{s['field']}: {s['selector']}" for s in selectors
+                          if s['attempts'] and not s['hits']],
+            'never_tried': [f"{s['field']}: {s['selector']}" for s in selectors
+                            if not s['attempts']],
+        }
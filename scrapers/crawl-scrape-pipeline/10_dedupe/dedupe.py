@@ -7,17 +7,22 @@ Removes duplicate records based on configurable criteria.
 import argparse
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Set, Tuple
 import hashlib
+import json
+from urllib.parse import urlparse
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent))
 
 from config import config
 from utils_minimal import (
     setup_logging, load_ndjson, save_json, append_ndjson,
     create_hash, create_timestamp
 )
+from dedupe_index import DedupeIndex
+from near_dupes import NearDuplicateIndex
 
 
 class Deduplicator:
@@ -115,6 +120,7 @@ class Deduplicator:
                          strategy: str = 'auto') -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """Deduplicate a list of items."""
         seen = {}
+        positions = {}
         unique_items = []
         duplicate_items = []
         
@@ -142,45 +148,346 @@ class Deduplicator:
                 # Update kept item if needed
                 if not comparison['keep_first']:
                     # Replace with better item
-                    idx = unique_items.index(existing_item)
-                    unique_items[idx] = item
+                    unique_items[positions[key]] = item
                     seen[key] = item
             else:
                 # New unique item
                 seen[key] = item
+                positions[key] = len(unique_items)
                 unique_items.append(item)
         
         return unique_items, duplicate_items
     
-    def analyze_duplicates(self, duplicate_records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def iter_records(self, input_file: Path) -> Iterator[Tuple[int, bytes, Dict[str, Any]]]:
+        """Yield ``(offset, raw line, item)`` for each record in an NDJSON file."""
+        with open(input_file, 'rb') as f:
+            offset = 0
+            for line in f:
+                start = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    yield start, line, json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Skipping malformed record at byte {start}")
+    
+    def index_entry(self, item: Dict[str, Any], offset: int) -> Tuple[int, int, str, str]:
+        """Compact stand-in for an item holding just what ``compare_items`` looks at."""
+        data = item.get('data', {}) or item.get('extracted_data', {})
+        fields = sum(1 for v in data.values() if v)
+        timestamp = item.get('timestamp_parsed', item.get('timestamp', '')) or ''
+        return offset, fields, timestamp, create_hash(data)
+    
+    def iter_unique(self, items: Iterable[Dict[str, Any]], strategy: str = 'auto',
+                    stats: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Single-pass dedupe for chained stages: yield each item as soon as its key is new.
+        
+        Nothing downstream can take back an item already handed on, so the
+        first item per key wins, except that a later duplicate of the same
+        URL that ``compare_items`` would prefer is passed on too - the
+        loader's upsert replaces the earlier row. Only a compact entry per
+        key is kept, as in ``run_streaming``.
+        """
+        stats = stats if stats is not None else {}
+        for name in ('input_items', 'unique_items', 'duplicate_items', 'replaced_items', 'late_winners'):
+            stats.setdefault(name, 0)
+        kept: Dict[str, Tuple[int, str, str, Optional[str]]] = {}
+        
+        with open(self.duplicates_file, 'a', encoding='utf-8') as dups:
+            for item in items:
+                stats['input_items'] += 1
+                key = self.generate_item_key(item, strategy)
+                if not key:
+                    stats['unique_items'] += 1
+                    yield item
+                    continue
+                
+                _, fields, timestamp, digest = self.index_entry(item, 0)
+                url = item.get('url')
+                previous = kept.get(key)
+                if previous is None:
+                    kept[key] = (fields, timestamp, digest, url)
+                    stats['unique_items'] += 1
+                    yield item
+                    continue
+                
+                # Same order as compare_items: identical content, then more fields, then newer
+                better = digest != previous[2] and (fields, timestamp) > previous[:2]
+                if better and url == previous[3]:
+                    kept[key] = (fields, timestamp, digest, url)
+                    stats['replaced_items'] += 1
+                    yield item
+                    continue
+                
+                if better:
+                    stats['late_winners'] += 1
+                stats['duplicate_items'] += 1
+                dups.write(json.dumps({'key': key, 'duplicate_url': url, 'kept_url': previous[3]},
+                                      ensure_ascii=False) + '\n')
+    
+    def run_streaming(self, input_file: Optional[Path] = None, strategy: str = 'auto',
+                      memory_mb: int = 256) -> Dict[str, Any]:
+        """Two-pass deduplication that never holds the records in memory.
+        
+        Pass 1 streams the input and keeps only key -> (offset, score) in a
+        ``DedupeIndex``, spilling to disk above ``memory_mb``. Pass 2 streams
+        the input again and copies out the winning records byte for byte.
+        """
+        self.logger.info(f"Starting streaming deduplication for domain: {self.domain}")
+        self.logger.info(f"Strategy: {strategy}, memory budget: {memory_mb} MB")
+        
+        if input_file is None:
+            input_file = Path(__file__).parent.parent / '09_scrape' / 'parsed.ndjson'
+        
+        if not input_file.exists():
+            self.logger.error(f"Input file not found: {input_file}")
+            return {}
+        
+        index = DedupeIndex(Path(__file__).parent / 'dedupe_spill',
+                            memory_budget=memory_mb * 1024 * 1024)
+        input_items = 0
+        
+        try:
+            # Pass 1: pick a winner per key
+            for offset, _, item in self.iter_records(input_file):
+                input_items += 1
+                key = self.generate_item_key(item, strategy)
+                if key:
+                    index.offer(key, self.index_entry(item, offset))
+                
+                if input_items % 100000 == 0:
+                    self.logger.info(f"Indexed {input_items} items ({index.spills} spills)")
+            
+            if not input_items:
+                self.logger.error("No items to deduplicate")
+                return {}
+            
+            # Pass 2: emit winners (and unkeyed items) in input order
+            winners = index.winner_offsets()
+            spills = index.spills
+            next_winner = next(winners, None)
+            unique_items = 0
+            duplicate_items = 0
+            
+            with open(self.output_file, 'ab') as out, open(self.duplicates_file, 'a', encoding='utf-8') as dups:
+                for offset, line, item in self.iter_records(input_file):
+                    while next_winner is not None and next_winner < offset:
+                        next_winner = next(winners, None)
+                    
+                    key = self.generate_item_key(item, strategy)
+                    if not key or offset == next_winner:
+                        out.write(line if line.endswith(b'\n') else line + b'\n')
+                        unique_items += 1
+                    else:
+                        # The full kept item is not at hand here; record where
+                        # the duplicate came from instead
+                        dups.write(json.dumps({'key': key, 'duplicate_url': item.get('url'),
+                                               'duplicate_offset': offset}, ensure_ascii=False) + '\n')
+                        duplicate_items += 1
+        finally:
+            index.cleanup()
+        
+        stats = {
+            'timestamp': create_timestamp(),
+            'strategy': strategy,
+            'mode': 'streaming',
+            'memory_mb': memory_mb,
+            'spills': spills,
+            'input_items': input_items,
+            'unique_items': unique_items,
+            'duplicate_items': duplicate_items,
+            'deduplication_rate': duplicate_items / input_items if input_items else 0,
+            'analysis': {'total_duplicates': duplicate_items, 'duplicate_reasons': {}, 'duplicate_patterns': {}},
+        }
+        
+        save_json(stats, Path(__file__).parent / 'dedupe_stats.json')
+        
+        self.logger.info("Deduplication complete!")
+        self.logger.info(f"Input items: {input_items}")
+        self.logger.info(f"Unique items: {unique_items}")
+        self.logger.info(f"Duplicates removed: {duplicate_items}")
+        self.logger.info(f"Deduplication rate: {stats['deduplication_rate']:.1%}")
+        
+        return stats
+    
+    def item_text(self, item: Dict[str, Any]) -> str:
+        """Title and description, the text near-duplicate matching compares."""
+        data = item.get('data', {}) or item.get('extracted_data', {})
+        parts = [data.get('title') or data.get('name'), data.get('description')]
+        return ' '.join(p if isinstance(p, str) else ' '.join(map(str, p)) for p in parts if p)
+    
+    def read_record(self, f, offset: int) -> Dict[str, Any]:
+        f.seek(offset)
+        return json.loads(f.readline())
+    
+    def run_near_duplicates(self, input_file: Optional[Path] = None, strategy: str = 'auto',
+                            memory_mb: int = 256, threshold: float = 0.8,
+                            num_perm: int = 64) -> Dict[str, Any]:
+        """Exact-key dedupe followed by MinHash/LSH clustering of what remains.
+        
+        Pass 1 picks a winner per key as ``run_streaming`` does. Pass 2
+        reports the exact duplicates and feeds the survivors' text into a
+        ``NearDuplicateIndex``, keeping only byte offsets. Each cluster's
+        members are then re-read and folded with ``compare_items``, and pass
+        3 copies out the survivors that did not lose a cluster. Duplicates
+        are written to the report as they are found.
+        """
+        self.logger.info(f"Starting near-duplicate detection for domain: {self.domain}")
+        self.logger.info(f"Strategy: {strategy}, Jaccard threshold: {threshold}, permutations: {num_perm}")
+        
+        if input_file is None:
+            input_file = Path(__file__).parent.parent / '09_scrape' / 'parsed.ndjson'
+        
+        if not input_file.exists():
+            self.logger.error(f"Input file not found: {input_file}")
+            return {}
+        
+        exact = DedupeIndex(Path(__file__).parent / 'dedupe_spill',
+                            memory_budget=memory_mb * 1024 * 1024)
+        index = NearDuplicateIndex(threshold=threshold, num_perm=num_perm)
+        survivors: List[int] = []  # offsets that passed the exact-key dedupe
+        offsets: List[int] = []    # LSH ordinal -> offset
+        input_items = 0
+        exact_duplicates = 0
+        analysis = self.analyze_duplicates([])
+        
+        with open(self.duplicates_file, 'a', encoding='utf-8') as dups:
+            try:
+                # Pass 1: pick a winner per exact key
+                for offset, _, item in self.iter_records(input_file):
+                    input_items += 1
+                    key = self.generate_item_key(item, strategy)
+                    if key:
+                        exact.offer(key, self.index_entry(item, offset))
+                
+                if not input_items:
+                    self.logger.error("No items to deduplicate")
+                    return {}
+                
+                # Pass 2: report exact duplicates, index the survivors' text
+                winners = exact.winner_offsets()
+                next_winner = next(winners, None)
+                for offset, _, item in self.iter_records(input_file):
+                    while next_winner is not None and next_winner < offset:
+                        next_winner = next(winners, None)
+                    
+                    key = self.generate_item_key(item, strategy)
+                    if key and offset != next_winner:
+                        dups.write(json.dumps({'key': key, 'duplicate_url': item.get('url'),
+                                               'duplicate_offset': offset}, ensure_ascii=False) + '\n')
+                        exact_duplicates += 1
+                        continue
+                    
+                    survivors.append(offset)
+                    if index.add(self.item_text(item)) is not None:
+                        offsets.append(offset)
+                    
+                    if len(survivors) % 100000 == 0:
+                        self.logger.info(f"Indexed {len(survivors)} items ({index.comparisons} candidate checks)")
+            finally:
+                exact.cleanup()
+            
+            # Pick a winner per cluster with the usual comparison
+            clusters = index.clusters()
+            losers = set()
+            
+            with open(input_file, 'rb') as f:
+                for root, members in clusters.items():
+                    kept_offset = offsets[members[0]]
+                    kept = self.read_record(f, kept_offset)
+                    
+                    for member in members[1:]:
+                        item = self.read_record(f, offsets[member])
+                        comparison = self.compare_items(kept, item)
+                        
+                        duplicate_record = {
+                            'key': f"near_{root}",
+                            'kept_item': kept if comparison['keep_first'] else item,
+                            'duplicate_item': item if comparison['keep_first'] else kept,
+                            'comparison': comparison,
+                        }
+                        dups.write(json.dumps(duplicate_record, ensure_ascii=False) + '\n')
+                        self.tally_duplicate(analysis, duplicate_record)
+                        
+                        if comparison['keep_first']:
+                            losers.add(offsets[member])
+                        else:
+                            losers.add(kept_offset)
+                            kept, kept_offset = item, offsets[member]
+        
+        # Pass 3: copy out survivors that kept their cluster
+        unique_items = 0
+        survivor = iter(survivors)
+        next_survivor = next(survivor, None)
+        with open(self.output_file, 'ab') as out:
+            for offset, line, _ in self.iter_records(input_file):
+                if offset != next_survivor:
+                    continue
+                next_survivor = next(survivor, None)
+                if offset not in losers:
+                    out.write(line if line.endswith(b'\n') else line + b'\n')
+                    unique_items += 1
+        
+        duplicate_items = exact_duplicates + len(losers)
+        analysis['total_duplicates'] = duplicate_items
+        stats = {
+            'timestamp': create_timestamp(),
+            'strategy': f'{strategy}+near',
+            'threshold': threshold,
+            'lsh': {'num_perm': num_perm, 'bands': index.bands, 'rows': index.rows,
+                    'candidate_checks': index.comparisons},
+            'clusters': len(clusters),
+            'input_items': input_items,
+            'unique_items': unique_items,
+            'exact_duplicates': exact_duplicates,
+            'near_duplicates': len(losers),
+            'duplicate_items': duplicate_items,
+            'deduplication_rate': duplicate_items / input_items if input_items else 0,
+            'analysis': analysis,
+        }
+        
+        save_json(stats, Path(__file__).parent / 'dedupe_stats.json')
+        
+        self.logger.info("Deduplication complete!")
+        self.logger.info(f"Input items: {input_items}")
+        self.logger.info(f"Exact duplicates removed: {exact_duplicates}")
+        self.logger.info(f"Near-duplicate clusters: {len(clusters)}")
+        self.logger.info(f"Near duplicates removed: {len(losers)}")
+        self.logger.info(f"Deduplication rate: {stats['deduplication_rate']:.1%}")
+        
+        return stats
+    
+    def analyze_duplicates(self, duplicate_records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze duplicate patterns."""
         analysis = {
-            'total_duplicates': len(duplicate_records),
+            'total_duplicates': 0,
             'duplicate_reasons': {},
             'duplicate_patterns': {},
         }
+        for record in duplicate_records:
+            self.tally_duplicate(analysis, record)
+        return analysis
+    
+    def tally_duplicate(self, analysis: Dict[str, Any], record: Dict[str, Any]) -> None:
+        """Count one duplicate record into an ``analyze_duplicates`` result."""
+        analysis['total_duplicates'] += 1
         
         # Count reasons
-        for record in duplicate_records:
-            reason = record['comparison']['reason']
-            analysis['duplicate_reasons'][reason] = analysis['duplicate_reasons'].get(reason, 0) + 1
+        reason = record['comparison']['reason']
+        analysis['duplicate_reasons'][reason] = analysis['duplicate_reasons'].get(reason, 0) + 1
         
         # Analyze patterns (e.g., same product from different URLs)
-        url_groups = {}
-        for record in duplicate_records:
-            kept_url = record['kept_item'].get('url', '')
-            dup_url = record['duplicate_item'].get('url', '')
-            
-            # Extract paths
-            from urllib.parse import urlparse
-            kept_path = urlparse(kept_url).path
-            dup_path = urlparse(dup_url).path
-            
-            if kept_path != dup_path:
-                pattern = 'different_urls_same_content'
-                analysis['duplicate_patterns'][pattern] = analysis['duplicate_patterns'].get(pattern, 0) + 1
+        kept_url = record['kept_item'].get('url', '')
+        dup_url = record['duplicate_item'].get('url', '')
         
-        return analysis
+        # Extract paths
+        kept_path = urlparse(kept_url).path
+        dup_path = urlparse(dup_url).path
+        
+        if kept_path != dup_path:
+            pattern = 'different_urls_same_content'
+            analysis['duplicate_patterns'][pattern] = analysis['duplicate_patterns'].get(pattern, 0) + 1
     
     def run(self, input_file: Optional[Path] = None, 
             strategy: str = 'auto',
@@ -275,6 +582,12 @@ Examples:
   # Deduplicate custom input file
   python dedupe.py --domain example.com --input custom_data.ndjson
   
+  # Stream a multi-GB parse output within a 128 MB index budget
+  python dedupe.py --domain example.com --streaming --memory-mb 128
+  
+  # Exact keys first, then variant URLs and near-identical titles/descriptions
+  python dedupe.py --domain example.com --near-duplicates --threshold 0.85
+  
 Strategies:
   - auto: Tries multiple strategies (ID, title+price, URL, content hash)
   - url: Deduplicate by URL only
@@ -289,6 +602,16 @@ Strategies:
                        default='auto', help='Deduplication strategy')
     parser.add_argument('--batch-size', type=int, default=10000,
                        help='Batch size for processing')
+    parser.add_argument('--streaming', action='store_true',
+                       help='Two-pass streaming dedupe that does not load the input into memory')
+    parser.add_argument('--memory-mb', type=int, default=256,
+                       help='Index memory budget for --streaming/--near-duplicates before spilling to disk')
+    parser.add_argument('--near-duplicates', action='store_true',
+                       help='After the exact-key dedupe, cluster near-duplicate titles/descriptions with MinHash/LSH')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                       help='Jaccard similarity threshold for --near-duplicates')
+    parser.add_argument('--num-perm', type=int, default=64,
+                       help='MinHash permutations for --near-duplicates')
     
     args = parser.parse_args()
     
@@ -296,11 +619,26 @@ Strategies:
     deduplicator = Deduplicator(args.domain)
     
     input_file = Path(args.input) if args.input else None
-    stats = deduplicator.run(
-        input_file=input_file,
-        strategy=args.strategy,
-        batch_size=args.batch_size
-    )
+    if args.near_duplicates:
+        stats = deduplicator.run_near_duplicates(
+            input_file=input_file,
+            strategy=args.strategy,
+            memory_mb=args.memory_mb,
+            threshold=args.threshold,
+            num_perm=args.num_perm
+        )
+    elif args.streaming:
+        stats = deduplicator.run_streaming(
+            input_file=input_file,
+            strategy=args.strategy,
+            memory_mb=args.memory_mb
+        )
+    else:
+        stats = deduplicator.run(
+            input_file=input_file,
+            strategy=args.strategy,
+            batch_size=args.batch_size
+        )
     
     if stats:
         print(f"\nDeduplication complete!")
@@ -0,0 +1,136 @@
+"""
+External-memory winner index for streaming deduplication.
+
+The index maps each dedupe key to the one record that should survive, as
+``key -> (offset, fields, timestamp, digest)`` where ``offset`` is the
+record's byte offset in the input file and the rest is the score used by
+``Deduplicator.compare_items``. Records themselves are never held.
+
+While the index fits in its memory budget it is a plain dict. Above the
+budget it is spilled to hash-partitioned files and cleared; once the input
+is exhausted each partition is reduced on its own, so no more than one
+partition's keys are ever in memory. Either way the result is the sorted
+stream of winning offsets, which the second pass walks in lockstep with
+the input file.
+"""
+import hashlib
+import heapq
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+# (offset, non-empty field count, timestamp, content digest)
+Entry = Tuple[int, int, str, str]
+
+# Rough per-entry cost of a dict slot, the tuple and its small members
+ENTRY_OVERHEAD = 240
+
+
+def beats(new: Entry, old: Entry) -> bool:
+    """Whether a later record replaces the current winner.
+
+    Mirrors ``Deduplicator.compare_items``: identical content keeps the
+    first record, otherwise more non-empty fields win, then the newer
+    timestamp; ties keep the first.
+    """
+    if new[3] == old[3]:
+        return False
+    return (new[1], new[2]) > (old[1], old[2])
+
+
+class DedupeIndex:
+    """Key -> winning record index with a memory budget and disk spill."""
+
+    def __init__(self, spill_dir: Path, memory_budget: int = 256 * 1024 * 1024,
+                 partitions: int = 64):
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.partitions = partitions
+        self.entries: Dict[str, Entry] = {}
+        self.memory = 0
+        self.spills = 0
+
+    def offer(self, key: str, entry: Entry) -> None:
+        """Record a candidate; it becomes the winner if it beats the current one."""
+        current = self.entries.get(key)
+        if current is None:
+            self.entries[key] = entry
+            self.memory += ENTRY_OVERHEAD + len(key) + len(entry[2]) + len(entry[3])
+            if self.memory > self.memory_budget:
+                self.spill()
+        elif beats(entry, current):
+            self.entries[key] = entry
+
+    def _partition(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.partitions
+
+    def _partition_file(self, partition: int) -> Path:
+        return self.spill_dir / f'part_{partition:04d}.ndjson'
+
+    def spill(self) -> None:
+        """Append the in-memory winners to their partitions and clear them.
+
+        A key spilled more than once appears in its partition in input
+        order, so reducing a partition replays the same comparisons.
+        """
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        buckets: List[List[str]] = [[] for _ in range(self.partitions)]
+        for key, entry in self.entries.items():
+            buckets[self._partition(key)].append(json.dumps([key, *entry], ensure_ascii=False))
+
+        for partition, lines in enumerate(buckets):
+            if lines:
+                with open(self._partition_file(partition), 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+
+        self.entries = {}
+        self.memory = 0
+        self.spills += 1
+
+    def _reduce_partition(self, partition: int) -> List[int]:
+        path = self._partition_file(partition)
+        if not path.exists():
+            return []
+
+        winners: Dict[str, Entry] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key, *entry = json.loads(line)
+                entry = tuple(entry)
+                current = winners.get(key)
+                if current is None or beats(entry, current):
+                    winners[key] = entry
+        return sorted(entry[0] for entry in winners.values())
+
+    def winner_offsets(self) -> Iterator[int]:
+        """Sorted byte offsets of every winning record."""
+        if not self.spills:
+            return iter(sorted(entry[0] for entry in self.entries.values()))
+
+        if self.entries:
+            self.spill()
+
+        # Reduce partitions one at a time, keeping only their sorted offsets
+        runs = []
+        for partition in range(self.partitions):
+            offsets = self._reduce_partition(partition)
+            if offsets:
+                run_file = self.spill_dir / f'winners_{partition:04d}.txt'
+                with open(run_file, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(map(str, offsets)) + '\n')
+                runs.append(run_file)
+                self._partition_file(partition).unlink()
+
+        return heapq.merge(*(self._read_run(run) for run in runs))
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[int]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield int(line)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,136 @@
+"""
+MinHash/LSH near-duplicate clustering for deduplication.
+
+Exact keys miss the same product reached through colour/size variant URLs
+or listed with a slightly different title. Here each item's title and
+description are shingled into character n-grams and summarised by a
+MinHash signature; LSH banding then turns "similar signatures" into
+"share a bucket", so candidate pairs come from bucket lookups instead of
+pairwise comparison.
+
+Items are clustered online: a new item is checked against the first item
+of every bucket it lands in and joins that cluster when the estimated
+Jaccard similarity clears the threshold. Only bucket representatives keep
+their signature, and clusters are tracked with union-find over item
+ordinals, so memory grows with the number of distinct products rather
+than with the number of candidate pairs.
+"""
+import re
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+NON_WORD = re.compile(r'[^\w]+')
+
+
+def shingles(text: str, size: int = 5) -> Set[bytes]:
+    """Character n-grams of whitespace- and punctuation-normalised text."""
+    text = NON_WORD.sub(' ', text.lower()).strip()
+    if len(text) <= size:
+        return {text.encode('utf-8')} if text else set()
+    return {text[i:i + size].encode('utf-8') for i in range(len(text) - size + 1)}
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Pick (bands, rows) whose S-curve midpoint is closest to ``threshold``."""
+    best = (num_perm, 1)
+    best_error = float('inf')
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes ``(a * x + b) mod p``."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens: Set[bytes]) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(t) for t in tokens),
+            dtype=np.uint64, count=len(tokens),
+        )
+        # (tokens x perms); uint64 wrap-around is part of the hash family
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """Online LSH clustering of item signatures."""
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, shingle_size: int = 5):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets: List[Dict[bytes, int]] = [{} for _ in range(self.bands)]
+        self.signatures: Dict[int, np.ndarray] = {}
+        self.parent: List[int] = []
+        self.comparisons = 0
+
+    def find(self, item: int) -> int:
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Lower ordinal stays the root so clusters are named by their first item
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+    def add(self, text: str) -> Optional[int]:
+        """Index an item's text and return its ordinal (None if it has no text)."""
+        tokens = shingles(text, self.shingle_size)
+        if not tokens:
+            return None
+
+        item = len(self.parent)
+        self.parent.append(item)
+        signature = self.hasher.signature(tokens)
+
+        representative = False
+        for band, bucket in enumerate(self.buckets):
+            band_key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            first = bucket.get(band_key)
+            if first is None:
+                bucket[band_key] = item
+                representative = True
+            elif self.find(first) != self.find(item):
+                self.comparisons += 1
+                if np.mean(self.signatures[first] == signature) >= self.threshold:
+                    self.union(first, item)
+
+        if representative:
+            self.signatures[item] = signature
+        return item
+
+    def clusters(self) -> Dict[int, List[int]]:
+        """Clusters with more than one member, as ``root -> ordinals``."""
+        roots = [self.find(item) for item in range(len(self.parent))]
+        members: Dict[int, List[int]] = {}
+        for item, root in enumerate(roots):
+            # Roots are each cluster's lowest ordinal, so members stay in input order
+            if root != item:
+                members.setdefault(root, [root]).append(item)
+        return members
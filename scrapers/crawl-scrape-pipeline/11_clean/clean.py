@@ -8,18 +8,22 @@ import argparse
 import re
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Union
 from datetime import datetime
+import json
+import numpy as np
 import pandas as pd
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent))
 
 from config import config
 from utils_minimal import (
     setup_logging, load_ndjson, save_json, clean_text,
     extract_price, create_timestamp
 )
+from columnar import ColumnarCleaner, CLEAN_COLUMNS
 
 
 class DataCleaner:
@@ -31,6 +35,7 @@ class DataCleaner:
         self.logger = setup_logging('data_cleaner', Path(__file__).parent / 'clean.log')
         self.output_csv = Path(__file__).parent / 'clean.csv'
         self.output_json = Path(__file__).parent / 'clean.json'
+        self.output_ndjson = Path(__file__).parent / 'cleaned.ndjson'
         self.validation_report = Path(__file__).parent / 'validation_report.json'
     
     def clean_title(self, title: Any) -> Optional[str]:
@@ -278,6 +283,23 @@ class DataCleaner:
         
         return cleaned
     
+    def iter_cleaned(self, raw_items: Iterable[Dict[str, Any]],
+                     stats: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Clean items one at a time, counting kept, dropped and warnings into ``stats``."""
+        for raw_item in raw_items:
+            cleaned = self.clean_item(raw_item)
+            
+            if cleaned:
+                stats['cleaned'] += 1
+                
+                # Track warnings
+                if '_warnings' in cleaned:
+                    for warning in cleaned['_warnings']:
+                        stats['validation_warnings'][warning] = stats['validation_warnings'].get(warning, 0) + 1
+                yield cleaned
+            else:
+                stats['dropped'] += 1
+    
     def run(self, input_file: Optional[Path] = None) -> Dict[str, Any]:
         """Run data cleaning process."""
         self.logger.info(f"Starting data cleaning for domain: {self.domain}")
@@ -295,7 +317,6 @@ class DataCleaner:
         self.logger.info(f"Loaded {len(raw_items)} items from {input_file}")
         
         # Clean items
-        cleaned_items = []
         stats = {
             'total_input': len(raw_items),
             'cleaned': 0,
@@ -304,19 +325,7 @@ class DataCleaner:
             'validation_warnings': {},
         }
         
-        for raw_item in raw_items:
-            cleaned = self.clean_item(raw_item)
-            
-            if cleaned:
-                cleaned_items.append(cleaned)
-                stats['cleaned'] += 1
-                
-                # Track warnings
-                if '_warnings' in cleaned:
-                    for warning in cleaned['_warnings']:
-                        stats['validation_warnings'][warning] = stats['validation_warnings'].get(warning, 0) + 1
-            else:
-                stats['dropped'] += 1
+        cleaned_items = list(self.iter_cleaned(raw_items, stats))
         
         self.logger.info(f"Cleaned {stats['cleaned']} items, dropped {stats['dropped']}")
         
@@ -389,6 +398,124 @@ class DataCleaner:
         
         return summary
 
+    
+    def iter_chunks(self, input_file: Path, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Yield lists of up to ``chunk_size`` raw items from an NDJSON file."""
+        chunk = []
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                chunk.append(json.loads(line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+    
+    def run_batch(self, input_file: Optional[Path] = None, chunk_size: int = 50000) -> Dict[str, Any]:
+        """Column-wise cleaning of the input in chunks.
+        
+        Rows match ``clean_item``; each cleaned chunk is appended to
+        clean.csv and cleaned.ndjson so memory is bounded by ``chunk_size``.
+        """
+        self.logger.info(f"Starting batch data cleaning for domain: {self.domain}")
+        
+        if input_file is None:
+            input_file = Path(__file__).parent.parent / '10_dedupe' / 'deduped.ndjson'
+        
+        if not input_file.exists():
+            self.logger.error(f"Input file not found: {input_file}")
+            return {}
+        
+        engine = ColumnarCleaner(self)
+        timestamp = create_timestamp()
+        stats = {
+            'total_input': 0,
+            'cleaned': 0,
+            'dropped': 0,
+            'validation_errors': {},
+            'validation_warnings': {},
+        }
+        coverage = {col: 0 for col in CLEAN_COLUMNS}
+        prices = []
+        image_counts = []
+        
+        for path in (self.output_csv, self.output_ndjson):
+            path.unlink(missing_ok=True)
+        
+        with open(self.output_ndjson, 'w', encoding='utf-8') as ndjson_out:
+            for chunk_no, raw_items in enumerate(self.iter_chunks(input_file, chunk_size)):
+                df = engine.clean_chunk(raw_items, timestamp)
+                stats['total_input'] += len(df)
+                
+                # Drop rows with validation errors, count messages
+                failed = df['_errors'].map(bool)
+                for column, key in (('_errors', 'validation_errors'), ('_warnings', 'validation_warnings')):
+                    counts = df.loc[~failed if column == '_warnings' else failed, column].explode().value_counts()
+                    for message, count in counts.items():
+                        stats[key][message] = stats[key].get(message, 0) + int(count)
+                
+                df = df[~failed]
+                stats['cleaned'] += len(df)
+                stats['dropped'] += int(failed.sum())
+                
+                warnings = df['_warnings']
+                df = df[CLEAN_COLUMNS].copy()
+                
+                for col in CLEAN_COLUMNS:
+                    coverage[col] += int(df[col].notna().sum())
+                prices.append(df['price'].dropna().to_numpy())
+                image_counts.append(df['images'].map(len).to_numpy())
+                
+                df['price_range'] = engine.price_range(df['price'])
+                df.to_csv(self.output_csv, mode='a', header=chunk_no == 0, index=False)
+                
+                # NDJSON keeps the per-item warnings like clean_item does
+                records = df.drop(columns='price_range')
+                records['_warnings'] = warnings.where(warnings.map(bool))
+                records.to_json(ndjson_out, orient='records', lines=True, force_ascii=False)
+                
+                self.logger.info(f"Chunk {chunk_no + 1}: cleaned {stats['cleaned']} of {stats['total_input']} items")
+        
+        summary = {
+            'timestamp': create_timestamp(),
+            'stats': stats,
+            'field_coverage': {},
+            'data_quality': {},
+        }
+        
+        total = stats['cleaned']
+        for col, count in coverage.items():
+            summary['field_coverage'][col] = {
+                'count': count,
+                'percentage': round(count / total * 100, 1) if total else 0.0,
+            }
+        
+        prices = pd.Series(np.concatenate(prices) if prices else [], dtype=float)
+        summary['data_quality']['price_stats'] = {
+            'min': float(prices.min()) if len(prices) else None,
+            'max': float(prices.max()) if len(prices) else None,
+            'mean': float(prices.mean()) if len(prices) else None,
+            'median': float(prices.median()) if len(prices) else None,
+        }
+        
+        image_counts = pd.Series(np.concatenate(image_counts) if image_counts else [], dtype=int)
+        if len(image_counts):
+            summary['data_quality']['images_per_item'] = {
+                'min': int(image_counts.min()),
+                'max': int(image_counts.max()),
+                'mean': round(image_counts.mean(), 1),
+            }
+        
+        save_json(summary, self.validation_report)
+        
+        self.logger.info("Data cleaning complete!")
+        self.logger.info(f"Input items: {stats['total_input']}")
+        self.logger.info(f"Cleaned items: {stats['cleaned']}")
+        self.logger.info(f"Dropped items: {stats['dropped']}")
+        
+        return summary
 
 def main():
     """Main entry point."""
@@ -405,6 +532,9 @@ Examples:
   
   # Generate detailed validation report
   python clean.py --domain example.com --detailed
+  
+  # Column-wise cleaning in 100k-item chunks (large inputs)
+  python clean.py --domain example.com --batch --chunk-size 100000
         """
     )
     
@@ -412,6 +542,10 @@ Examples:
     parser.add_argument('--input', help='Input NDJSON file')
     parser.add_argument('--detailed', action='store_true',
                        help='Generate detailed validation report')
+    parser.add_argument('--batch', action='store_true',
+                       help='Vectorized column-wise cleaning, written in chunks')
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                       help='Items per chunk for --batch')
     
     args = parser.parse_args()
     
@@ -419,7 +553,10 @@ Examples:
     cleaner = DataCleaner(args.domain)
     
     input_file = Path(args.input) if args.input else None
-    summary = cleaner.run(input_file=input_file)
+    if args.batch:
+        summary = cleaner.run_batch(input_file=input_file, chunk_size=args.chunk_size)
+    else:
+        summary = cleaner.run(input_file=input_file)
     
     if summary:
         print(f"\nData cleaning complete!")
@@ -0,0 +1,220 @@
+"""
+Memory-mappable catalog, index and price-history files for the file loader.
+
+Layout under ``12_load/data/{domain}/``:
+
+* ``catalog.arrow`` - Arrow IPC file, one row per product (id, url, title,
+  price, brand, category). Row numbers are what the indexes point at.
+* ``indexes/{url,brand,category}.idx.arrow`` - ``(key, row)`` pairs sorted by
+  key, so a lookup is a binary search over the memory-mapped key column and
+  multi-valued keys (brand, category) are one contiguous run.
+* ``indexes/price.idx.arrow`` - ``(price, row)`` sorted by price; a price
+  range is two ``searchsorted`` calls and a slice.
+* ``history/prices.log`` - append-only fixed-width records
+  ``(previous offset, timestamp, price)``; each record points back at the
+  product's previous one.
+* ``history/price_heads.arrow`` - ``(key, offset, count)`` sorted by product
+  id, the offset of each product's newest record.
+
+Readers open everything with ``pa.memory_map``, so looking up one product or
+filtering a price range touches a few pages instead of parsing the catalog.
+"""
+import struct
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+CATALOG_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('url', pa.string()),
+    ('title', pa.string()),
+    ('price', pa.float64()),
+    ('brand', pa.string()),
+    ('category', pa.string()),
+])
+
+# Keys the string indexes are built on, with the old JSON indexes' defaults
+KEY_INDEXES = {
+    'url': None,
+    'brand': 'unknown',
+    'category': 'uncategorized',
+}
+
+# (offset of the product's previous record or -1, unix timestamp, price)
+PRICE_RECORD = struct.Struct('<qdd')
+
+# Same cap the per-product JSON history files had
+HISTORY_LIMIT = 100
+
+
+def write_arrow(table: pa.Table, path: Path) -> None:
+    """Write a table as a single-batch Arrow IPC file, atomically."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    table = table.combine_chunks()
+    with pa.OSFile(str(tmp), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    tmp.replace(path)
+
+
+def read_arrow(path: Path) -> pa.Table:
+    """Memory-map an Arrow IPC file; column buffers are not copied."""
+    return pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+
+
+def _sorted_index(keys: pa.Array, name: str) -> pa.Table:
+    rows = pa.array(np.arange(len(keys), dtype=np.uint32))
+    table = pa.table({name: keys, 'row': rows}).filter(pc.is_valid(keys))
+    order = pc.sort_indices(table, sort_keys=[(name, 'ascending'), ('row', 'ascending')])
+    return table.take(order)
+
+
+def _bisect(column: pa.ChunkedArray, key: Any, right: bool = False) -> int:
+    """bisect_left/right over a sorted, memory-mapped string column.
+
+    Arrow sorts strings by UTF-8 bytes, which is Python's code point order.
+    """
+    column = column.chunk(0) if column.num_chunks else pa.array([], column.type)
+    lo, hi = 0, len(column)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        value = column[mid].as_py()
+        if value < key or (right and value == key):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class CatalogWriter:
+    """Builds the catalog, indexes and price-history log for one load."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.index_dir = output_dir / 'indexes'
+        self.history_dir = output_dir / 'history'
+        self.columns: Dict[str, List[Any]] = {field.name: [] for field in CATALOG_SCHEMA}
+        self.prices: List[Tuple[str, float]] = []
+
+    def add(self, product: Dict[str, Any]) -> None:
+        for name, values in self.columns.items():
+            value = product.get('_id' if name == 'id' else name)
+            if name == 'price':
+                try:
+                    value = float(value) if value not in (None, '') else None
+                except (TypeError, ValueError):
+                    value = None
+            else:
+                default = KEY_INDEXES.get(name)
+                value = str(value) if value not in (None, '') else default
+            values.append(value)
+
+        price = self.columns['price'][-1]
+        if price:
+            self.prices.append((self.columns['id'][-1], price))
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def write(self) -> pa.Table:
+        """Write catalog.arrow and its indexes; returns the catalog table."""
+        catalog = pa.table(self.columns, schema=CATALOG_SCHEMA)
+        write_arrow(catalog, self.output_dir / 'catalog.arrow')
+
+        for key in KEY_INDEXES:
+            write_arrow(_sorted_index(catalog[key].combine_chunks(), 'key'),
+                        self.index_dir / f'{key}.idx.arrow')
+        write_arrow(_sorted_index(catalog['price'].combine_chunks(), 'price'),
+                    self.index_dir / 'price.idx.arrow')
+
+        self.append_prices()
+        return catalog
+
+    def append_prices(self) -> None:
+        """Append this load's price points to the log and rewrite the heads."""
+        heads_file = self.history_dir / 'price_heads.arrow'
+        heads: Dict[str, Tuple[int, int]] = {}
+        if heads_file.exists():
+            existing = read_arrow(heads_file).to_pydict()
+            heads = {k: (o, c) for k, o, c in
+                     zip(existing['key'], existing['offset'], existing['count'])}
+
+        if not self.prices:
+            return
+
+        now = time.time()
+        with open(self.history_dir / 'prices.log', 'ab') as log:
+            offset = log.seek(0, 2)
+            buffer = bytearray()
+            for product_id, price in self.prices:
+                previous, count = heads.get(product_id, (-1, 0))
+                buffer += PRICE_RECORD.pack(previous, now, price)
+                heads[product_id] = (offset, count + 1)
+                offset += PRICE_RECORD.size
+            log.write(buffer)
+
+        keys = sorted(heads)
+        write_arrow(pa.table({
+            'key': pa.array(keys, pa.string()),
+            'offset': pa.array([heads[k][0] for k in keys], pa.int64()),
+            'count': pa.array([heads[k][1] for k in keys], pa.int64()),
+        }), heads_file)
+
+
+class CatalogReader:
+    """Lookups against the files ``CatalogWriter`` produced, via memory maps."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.catalog = read_arrow(output_dir / 'catalog.arrow')
+        self._indexes: Dict[str, pa.Table] = {}
+
+    def _index(self, name: str) -> pa.Table:
+        if name not in self._indexes:
+            self._indexes[name] = read_arrow(self.output_dir / 'indexes' / f'{name}.idx.arrow')
+        return self._indexes[name]
+
+    def rows(self, key: str, value: str) -> np.ndarray:
+        """Catalog row numbers whose ``key`` (url, brand, category) equals ``value``."""
+        index = self._index(key)
+        lo = _bisect(index['key'], value)
+        hi = _bisect(index['key'], value, right=True)
+        return index['row'].slice(lo, hi - lo).to_numpy()
+
+    def lookup(self, key: str, value: str) -> pa.Table:
+        return self.catalog.take(self.rows(key, value))
+
+    def by_url(self, url: str) -> Optional[Dict[str, Any]]:
+        found = self.lookup('url', url).to_pylist()
+        return found[0] if found else None
+
+    def price_range(self, low: float = float('-inf'), high: float = float('inf')) -> pa.Table:
+        """Products with ``low <= price < high``, cheapest first."""
+        index = self._index('price')
+        prices = index['price'].to_numpy()
+        lo = int(np.searchsorted(prices, low, side='left'))
+        hi = int(np.searchsorted(prices, high, side='left'))
+        return self.catalog.take(index['row'].slice(lo, hi - lo).to_numpy())
+
+    def price_history(self, product_id: str, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+        """A product's price points, oldest first (at most ``limit``)."""
+        history_dir = self.output_dir / 'history'
+        heads = read_arrow(history_dir / 'price_heads.arrow')
+        position = _bisect(heads['key'], product_id)
+        if position >= heads.num_rows or heads['key'][position].as_py() != product_id:
+            return []
+
+        offset = heads['offset'][position].as_py()
+        log = np.memmap(history_dir / 'prices.log', dtype=np.uint8, mode='r')
+        points = []
+        while offset >= 0 and len(points) < limit:
+            previous, timestamp, price = PRICE_RECORD.unpack_from(log, offset)
+            points.append({'price': price, 'timestamp': timestamp})
+            offset = previous
+        points.reverse()
+        return points
@@ -7,9 +7,12 @@ Loads cleaned data into PostgreSQL database.
 import argparse
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from datetime import datetime
-import pandas as pd
+import ast
+import csv
+import io
+import math
 import psycopg2
 from psycopg2.extras import RealDictCursor, execute_batch
 from psycopg2 import sql
@@ -20,6 +23,116 @@ sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
 
 from config import config
 from utils_minimal import setup_logging, create_timestamp, save_json
+from record_stream import iter_record_chunks, prefetch
+
+
+# Columns COPYed into the staging table, in order
+STAGING_COLUMNS = [
+    'row_no', 'source_url', 'external_id', 'sku', 'title', 'description', 'price',
+    'brand', 'category', 'availability', 'rating', 'reviews_count', 'metadata', 'images',
+]
+
+# Numeric columns of clean.csv; everything else is read as text
+CSV_DTYPES = {'price': float, 'rating': float, 'reviews_count': float}
+
+# One set-based statement per chunk: upsert products, log new/changed
+# prices and replace images. Data-modifying CTEs all see the snapshot taken
+# before the statement, so ``old`` holds the pre-upsert prices and the
+# image DELETE only removes rows that existed before the INSERT.
+BULK_UPSERT_SQL = """
+    WITH s AS (
+        SELECT DISTINCT ON (source_url) *
+        FROM scraper.products_staging
+        ORDER BY source_url, row_no DESC
+    ),
+    old AS (
+        SELECT p.id, p.price
+        FROM scraper.products p
+        JOIN s ON s.source_url = p.source_url
+    ),
+    up AS (
+        INSERT INTO scraper.products (
+            source_url, source_domain, external_id, sku,
+            title, description, price, brand, category,
+            availability, rating, reviews_count,
+            last_scraped_at, metadata
+        )
+        SELECT source_url, %(domain)s, external_id, sku,
+               title, description, price, brand, category,
+               availability, rating, reviews_count,
+               NOW(), metadata
+        FROM s
+        ON CONFLICT (source_url) DO {conflict_action}
+        RETURNING id, source_url, price
+    ),
+    hist AS (
+        INSERT INTO scraper.price_history (product_id, price)
+        SELECT up.id, up.price
+        FROM up
+        LEFT JOIN old ON old.id = up.id
+        WHERE up.price IS NOT NULL
+          AND (old.id IS NULL OR (old.price IS NOT NULL AND old.price <> up.price))
+        RETURNING product_id
+    ),
+    del AS (
+        DELETE FROM scraper.product_images i
+        USING up JOIN s ON s.source_url = up.source_url
+        WHERE i.product_id = up.id
+          AND jsonb_array_length(s.images) > 0
+        RETURNING 1
+    ),
+    img AS (
+        INSERT INTO scraper.product_images (product_id, image_url, image_type, position)
+        SELECT up.id, t.url,
+               CASE WHEN t.ord = 1 THEN 'primary' ELSE 'additional' END,
+               t.ord - 1
+        FROM up
+        JOIN s ON s.source_url = up.source_url
+        CROSS JOIN LATERAL jsonb_array_elements_text(s.images) WITH ORDINALITY AS t(url, ord)
+        WHERE t.ord <= 10
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM s) AS staged,
+           (SELECT count(*) FROM up) AS loaded,
+           (SELECT count(*) FROM up JOIN old ON old.id = up.id) AS updated,
+           (SELECT count(*) FROM hist JOIN old ON old.id = hist.product_id) AS price_changes,
+           (SELECT count(*) FROM img) AS images
+"""
+
+UPDATE_ON_CONFLICT = """UPDATE SET
+            title = EXCLUDED.title,
+            description = EXCLUDED.description,
+            price = EXCLUDED.price,
+            brand = EXCLUDED.brand,
+            category = EXCLUDED.category,
+            availability = EXCLUDED.availability,
+            rating = EXCLUDED.rating,
+            reviews_count = EXCLUDED.reviews_count,
+            last_scraped_at = EXCLUDED.last_scraped_at,
+            metadata = EXCLUDED.metadata"""
+
+
+def _copy_value(value: Any) -> Any:
+    """Missing values (None, NaN) become NULL in the COPY stream."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def _image_list(value: Any) -> List[str]:
+    """Images arrive as a list (NDJSON) or its repr (CSV)."""
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return [value]
+    return [str(v) for v in parsed if v] if isinstance(parsed, list) else [str(parsed)]
 
 
 class DatabaseLoader:
@@ -152,7 +265,7 @@ class DatabaseLoader:
                         availability, rating, reviews_count,
                         last_scraped_at, metadata
                     ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s
                     ) RETURNING id
                 """, (
                     product_data['url'],
@@ -167,7 +280,6 @@ class DatabaseLoader:
                     product_data.get('availability'),
                     product_data.get('rating'),
                     product_data.get('reviews_count'),
-                    datetime.utcnow(),
                     json.dumps(product_data.get('metadata', {}))
                 ))
                 
@@ -207,7 +319,7 @@ class DatabaseLoader:
                         availability = %s,
                         rating = %s,
                         reviews_count = %s,
-                        last_scraped_at = %s,
+                        last_scraped_at = NOW(),
                         metadata = %s
                     WHERE id = %s
                 """, (
@@ -219,7 +331,6 @@ class DatabaseLoader:
                     product_data.get('availability'),
                     product_data.get('rating'),
                     product_data.get('reviews_count'),
-                    datetime.utcnow(),
                     json.dumps(product_data.get('metadata', {})),
                     product_id
                 ))
@@ -307,12 +418,141 @@ class DatabaseLoader:
         
         return stats
     
+    def create_staging_table(self) -> None:
+        """Create the unlogged staging table bulk loads COPY into."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS scraper.products_staging (
+                    row_no bigint,
+                    source_url text,
+                    external_id text,
+                    sku text,
+                    title text,
+                    description text,
+                    price numeric,
+                    brand text,
+                    category text,
+                    availability text,
+                    rating numeric,
+                    reviews_count integer,
+                    metadata jsonb,
+                    images jsonb
+                )
+            """)
+            # ON CONFLICT (source_url) needs a unique index to arbitrate on
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS products_source_url_key
+                ON scraper.products (source_url)
+            """)
+        self.conn.commit()
+    
+    def copy_to_staging(self, cursor, products: List[Dict[str, Any]]) -> int:
+        """COPY a chunk of cleaned products into the staging table."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = 0
+        
+        for row_no, product in enumerate(products):
+            url = _copy_value(product.get('url'))
+            if not url or not _copy_value(product.get('title')):
+                continue
+            reviews = _copy_value(product.get('reviews_count'))
+            writer.writerow([
+                row_no,
+                url,
+                _copy_value(product.get('external_id')),
+                _copy_value(product.get('sku')),
+                product['title'],
+                _copy_value(product.get('description')),
+                _copy_value(product.get('price')),
+                _copy_value(product.get('brand')),
+                _copy_value(product.get('category')),
+                _copy_value(product.get('availability')),
+                _copy_value(product.get('rating')),
+                int(reviews) if reviews is not None else None,
+                json.dumps(product.get('metadata') or {}),
+                json.dumps(_image_list(product.get('images'))),
+            ])
+            rows += 1
+        
+        buffer.seek(0)
+        cursor.execute("TRUNCATE scraper.products_staging")
+        cursor.copy_expert(
+            f"COPY scraper.products_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        return rows
+    
+    def load_chunk_bulk(self, products: List[Dict[str, Any]],
+                        update_existing: bool = True) -> Dict[str, int]:
+        """Load a chunk with COPY + one set-based upsert, in a single transaction."""
+        stats = {
+            'processed': len(products),
+            'inserted': 0,
+            'updated': 0,
+            'failed': 0,
+            'price_changes': 0,
+        }
+        
+        query = BULK_UPSERT_SQL.format(
+            conflict_action=UPDATE_ON_CONFLICT if update_existing else 'NOTHING'
+        )
+        
+        try:
+            with self.conn.cursor() as cur:
+                staged = self.copy_to_staging(cur, products)
+                cur.execute(query, {'domain': self.domain})
+                _, loaded, updated, price_changes, _ = cur.fetchone()
+            self.conn.commit()
+        except Exception as e:
+            self.logger.error(f"Bulk load of chunk failed: {e}")
+            self.conn.rollback()
+            stats['failed'] = len(products)
+            return stats
+        
+        # Rows without a URL/title are skipped, as are duplicate URLs in the
+        # chunk (the last one wins) and, without updates, existing products
+        stats['inserted'] = loaded - updated
+        stats['updated'] = updated
+        stats['failed'] = len(products) - staged
+        stats['price_changes'] = price_changes
+        return stats
+    
     def run(self, input_file: Optional[Path] = None, 
             batch_size: int = 100,
-            update_existing: bool = True) -> Dict[str, Any]:
-        """Run database loading process."""
+            update_existing: bool = True,
+            bulk: bool = False) -> Dict[str, Any]:
+        """Run database loading process.
+        
+        The input (CSV, NDJSON or JSON, optionally compressed) is streamed
+        ``batch_size`` records at a time, so memory stays flat however large
+        the catalog is. With ``bulk`` each batch is COPYed into a staging
+        table and merged with one set-based statement instead of per-row
+        round trips.
+        """
         self.logger.info(f"Starting database load for domain: {self.domain}")
         
+        # Default input per spec: 11_clean/clean.csv
+        if input_file is None:
+            input_file = Path(__file__).parent.parent / '11_clean' / 'clean.csv'
+        
+        if not input_file.exists():
+            self.logger.error(f"Input file not found: {input_file}")
+            return {}
+        
+        # Stream the input in batches; prefetch parses the next batch
+        # while the current one is written, one batch ahead at most
+        self.logger.info(f"Streaming data from {input_file}")
+        return self.load_batches(prefetch(iter_record_chunks(input_file, batch_size, CSV_DTYPES)),
+                                 update_existing=update_existing, bulk=bulk)
+    
+    def load_batches(self, batches: Iterable[List[Dict[str, Any]]],
+                     update_existing: bool = True, bulk: bool = False) -> Dict[str, Any]:
+        """Load batches of cleaned records as they arrive.
+        
+        ``batches`` may be a file reader or the tail of a chain of in-process
+        stages; each batch is committed before the next one is pulled.
+        """
         # Connect to database
         if not self.connect():
             return {}
@@ -322,51 +562,38 @@ class DatabaseLoader:
             if not self.create_schema():
                 return {}
             
-            # Default input per spec: 11_clean/clean.csv
-            if input_file is None:
-                input_file = Path(__file__).parent.parent / '11_clean' / 'clean.csv'
-            
-            if not input_file.exists():
-                self.logger.error(f"Input file not found: {input_file}")
-                return {}
-            
-            # Load data
-            self.logger.info(f"Loading data from {input_file}")
-            if input_file.suffix == '.csv':
-                df = pd.read_csv(input_file)
-            else:
-                df = pd.read_json(input_file)
-            
-            # Convert DataFrame to list of dicts
-            products = df.to_dict('records')
-            self.logger.info(f"Loaded {len(products)} products")
-            
             # Start scrape history
             self.start_scrape_history('full' if not update_existing else 'update')
             
-            # Process in batches
+            if bulk:
+                self.create_staging_table()
+            
             overall_stats = {
                 'start_time': create_timestamp(),
-                'total_products': len(products),
+                'total_products': 0,
                 'processed': 0,
                 'inserted': 0,
                 'updated': 0,
                 'failed': 0,
                 'price_changes': 0,
-                'urls_scraped': len(products),
-                'items_extracted': len(products),
             }
             
-            for i in range(0, len(products), batch_size):
-                batch = products[i:i + batch_size]
-                self.logger.info(f"Processing batch {i//batch_size + 1} ({len(batch)} items)")
+            for batch_no, batch in enumerate(batches, 1):
+                overall_stats['total_products'] += len(batch)
+                self.logger.info(f"Processing batch {batch_no} ({len(batch)} items)")
                 
-                batch_stats = self.load_batch(batch)
+                if bulk:
+                    batch_stats = self.load_chunk_bulk(batch, update_existing)
+                else:
+                    batch_stats = self.load_batch(batch)
                 
                 # Update overall stats
                 for key in ['processed', 'inserted', 'updated', 'failed', 'price_changes']:
                     overall_stats[key] += batch_stats[key]
             
+            self.logger.info(f"Loaded {overall_stats['total_products']} products")
+            overall_stats['urls_scraped'] = overall_stats['total_products']
+            overall_stats['items_extracted'] = overall_stats['total_products']
             overall_stats['items_loaded'] = overall_stats['inserted'] + overall_stats['updated']
             overall_stats['end_time'] = create_timestamp()
             
@@ -415,20 +642,28 @@ Examples:
   # Load from custom file
   python load_db.py --domain example.com --input custom_clean.csv
   
+  # Stream compressed NDJSON
+  python load_db.py --domain example.com --input cleaned.ndjson.gz --bulk
+  
   # Skip updating existing products
   python load_db.py --domain example.com --no-update
   
   # Use larger batch size
   python load_db.py --domain example.com --batch-size 500
+  
+  # Bulk COPY + set-based upsert, 10k rows per transaction
+  python load_db.py --domain example.com --bulk
         """
     )
     
     parser.add_argument('--domain', required=True, help='Domain being loaded')
-    parser.add_argument('--input', help='Input CSV or JSON file')
-    parser.add_argument('--batch-size', type=int, default=100,
-                       help='Batch size for database operations')
+    parser.add_argument('--input', help='Input CSV, NDJSON or JSON file (.gz/.bz2/.xz/.zst ok)')
+    parser.add_argument('--batch-size', type=int,
+                       help='Batch size for database operations (default: 100, or 10000 with --bulk)')
     parser.add_argument('--no-update', action='store_true',
                        help='Skip updating existing products')
+    parser.add_argument('--bulk', action='store_true',
+                       help='COPY batches into a staging table and upsert them set-based')
     
     args = parser.parse_args()
     
@@ -438,8 +673,9 @@ Examples:
     input_file = Path(args.input) if args.input else None
     stats = loader.run(
         input_file=input_file,
-        batch_size=args.batch_size,
-        update_existing=not args.no_update
+        batch_size=args.batch_size or (10000 if args.bulk else 100),
+        update_existing=not args.no_update,
+        bulk=args.bulk
     )
     
     if stats:
@@ -10,13 +10,17 @@ import json
 import shutil
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-import csv
+from typing import Dict, Optional, Any
+
+import pyarrow.csv as pa_csv
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent))
 
-from utils_minimal import setup_logging, create_timestamp, save_json, load_json
+from utils_minimal import setup_logging, create_timestamp, save_json
+from record_stream import iter_records
+from columnar_store import CatalogWriter
 
 
 class FileLoader:
@@ -36,6 +40,8 @@ class FileLoader:
         
         for dir_path in [self.products_dir, self.index_dir, self.history_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
+        
+        self.catalog = CatalogWriter(self.output_dir)
     
     def load_product(self, product: Dict[str, Any]) -> bool:
         """Save individual product to file."""
@@ -53,9 +59,9 @@ class FileLoader:
             product_file = self.products_dir / f"{product_id}.json"
             save_json(product, product_file)
             
-            # Update price history if exists
-            if product.get('price'):
-                self.update_price_history(product_id, product['price'])
+            # Catalog row, indexes and price history are written in bulk
+            # once the whole input has been loaded
+            self.catalog.add(product)
             
             return True
             
@@ -63,119 +69,21 @@ class FileLoader:
             self.logger.error(f"Failed to load product {product.get('url')}: {e}")
             return False
     
-    def update_price_history(self, product_id: str, price: float):
-        """Track price changes over time."""
-        history_file = self.history_dir / f"{product_id}_prices.json"
-        
-        # Load existing history
-        if history_file.exists():
-            history = load_json(history_file)
-        else:
-            history = {'product_id': product_id, 'prices': []}
-        
-        # Add new price entry
-        history['prices'].append({
-            'price': price,
-            'timestamp': create_timestamp()
-        })
-        
-        # Keep only last 100 price points
-        history['prices'] = history['prices'][-100:]
-        
-        save_json(history, history_file)
-    
-    def build_indexes(self, products: List[Dict[str, Any]]):
-        """Build index files for quick lookups."""
-        # URL index
-        url_index = {}
-        
-        # Category index
-        category_index = {}
-        
-        # Brand index
-        brand_index = {}
-        
-        # Price range index
-        price_ranges = {
-            'under_50': [],
-            '50_100': [],
-            '100_200': [],
-            '200_500': [],
-            'over_500': []
-        }
-        
-        for product in products:
-            product_id = product.get('_id')
-            
-            # URL index
-            url_index[product.get('url')] = product_id
-            
-            # Category index
-            category = product.get('category', 'uncategorized')
-            if category not in category_index:
-                category_index[category] = []
-            category_index[category].append(product_id)
-            
-            # Brand index
-            brand = product.get('brand', 'unknown')
-            if brand not in brand_index:
-                brand_index[brand] = []
-            brand_index[brand].append(product_id)
-            
-            # Price range index
-            price = product.get('price', 0)
-            if price < 50:
-                price_ranges['under_50'].append(product_id)
-            elif price < 100:
-                price_ranges['50_100'].append(product_id)
-            elif price < 200:
-                price_ranges['100_200'].append(product_id)
-            elif price < 500:
-                price_ranges['200_500'].append(product_id)
-            else:
-                price_ranges['over_500'].append(product_id)
-        
-        # Save indexes
-        save_json(url_index, self.index_dir / 'url_index.json')
-        save_json(category_index, self.index_dir / 'category_index.json')
-        save_json(brand_index, self.index_dir / 'brand_index.json')
-        save_json(price_ranges, self.index_dir / 'price_ranges.json')
-        
-        self.logger.info("Built index files for quick lookups")
-    
-    def create_catalog(self, products: List[Dict[str, Any]]):
-        """Create a master catalog file."""
-        catalog = {
-            'domain': self.domain,
-            'generated_at': create_timestamp(),
-            'total_products': len(products),
-            'products': []
-        }
-        
-        # Add summary info for each product
-        for product in products:
-            catalog['products'].append({
-                'id': product.get('_id'),
-                'url': product.get('url'),
-                'title': product.get('title'),
-                'price': product.get('price'),
-                'brand': product.get('brand'),
-                'category': product.get('category')
-            })
+    def build_catalog(self) -> int:
+        """Write the Arrow catalog, sorted indexes and price-history log.
         
-        # Save catalog
-        catalog_file = self.output_dir / 'catalog.json'
-        save_json(catalog, catalog_file)
+        catalog.arrow and the indexes/*.idx.arrow files are memory-mappable
+        (see columnar_store.CatalogReader), so lookups and price-range
+        filters never parse the whole catalog. Each price point is appended
+        to history/prices.log rather than rewriting a file per product.
+        """
+        catalog = self.catalog.write()
         
         # Also save as CSV for easy viewing
-        catalog_csv = self.output_dir / 'catalog.csv'
-        if catalog['products']:
-            with open(catalog_csv, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=catalog['products'][0].keys())
-                writer.writeheader()
-                writer.writerows(catalog['products'])
+        pa_csv.write_csv(catalog, str(self.output_dir / 'catalog.csv'))
         
-        self.logger.info(f"Created catalog with {len(products)} products")
+        self.logger.info(f"Created catalog and indexes for {catalog.num_rows} products")
+        return catalog.num_rows
     
     def run(self, input_file: Optional[Path] = None) -> Dict[str, Any]:
         """Run file-based loading process."""
@@ -189,42 +97,26 @@ class FileLoader:
             self.logger.error(f"Input file not found: {input_file}")
             return {}
         
-        # Load cleaned data
-        products = []
-        with open(input_file, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Convert price to float
-                if row.get('price'):
-                    try:
-                        row['price'] = float(row['price'])
-                    except:
-                        pass
-                products.append(row)
+        # Stream cleaned data; only the catalog columns are kept in memory
+        self.logger.info(f"Loading products from {input_file}")
         
-        self.logger.info(f"Loaded {len(products)} products from {input_file}")
-        
-        # Process products
         stats = {
             'start_time': create_timestamp(),
-            'total_products': len(products),
+            'total_products': 0,
             'loaded': 0,
             'failed': 0,
         }
         
-        loaded_products = []
-        
-        for product in products:
+        for product in iter_records(input_file):
+            stats['total_products'] += 1
             if self.load_product(product):
                 stats['loaded'] += 1
-                loaded_products.append(product)
             else:
                 stats['failed'] += 1
         
         # Build indexes and catalog
-        if loaded_products:
-            self.build_indexes(loaded_products)
-            self.create_catalog(loaded_products)
+        if stats['loaded']:
+            self.build_catalog()
         
         stats['end_time'] = create_timestamp()
         
@@ -242,11 +134,11 @@ class FileLoader:
             f.write(f"Failed: {stats['failed']}\n")
             f.write(f"\nData Location: {self.output_dir}\n")
             f.write(f"\nAvailable Files:\n")
-            f.write(f"- catalog.json - Master product catalog\n")
+            f.write(f"- catalog.arrow - Master product catalog (Arrow IPC)\n")
             f.write(f"- catalog.csv - Catalog in CSV format\n")
             f.write(f"- products/ - Individual product JSON files\n")
-            f.write(f"- indexes/ - Quick lookup indexes\n")
-            f.write(f"- history/ - Price history tracking\n")
+            f.write(f"- indexes/ - Sorted key/row indexes (url, brand, category, price)\n")
+            f.write(f"- history/ - Append-only price log and per-product heads\n")
         
         # Log summary
         self.logger.info("File loading complete!")
@@ -274,23 +166,32 @@ Examples:
 
 Output Structure:
   12_load/data/{domain}/
-    ├── catalog.json      # Master catalog
+    ├── catalog.arrow     # Master catalog (Arrow IPC, memory-mappable)
     ├── catalog.csv       # CSV version
     ├── summary.txt       # Load summary
     ├── products/         # Individual product files
     │   └── {id}.json
-    ├── indexes/          # Quick lookup indexes
-    │   ├── url_index.json
-    │   ├── category_index.json
-    │   ├── brand_index.json
-    │   └── price_ranges.json
+    ├── indexes/          # Sorted (key, row) lookup indexes
+    │   ├── url.idx.arrow
+    │   ├── category.idx.arrow
+    │   ├── brand.idx.arrow
+    │   └── price.idx.arrow
     └── history/          # Price tracking
-        └── {id}_prices.json
+        ├── prices.log          # Append-only price records
+        └── price_heads.arrow   # Newest record offset per product
+
+Reading it back:
+  from columnar_store import CatalogReader
+  reader = CatalogReader(Path('12_load/data/example.com'))
+  reader.by_url('https://example.com/p/1')
+  reader.lookup('brand', 'Shimano')
+  reader.price_range(100, 200)
+  reader.price_history(product_id)
         """
     )
     
     parser.add_argument('--domain', required=True, help='Domain being loaded')
-    parser.add_argument('--input', help='Input CSV file')
+    parser.add_argument('--input', help='Input CSV or NDJSON file (optionally compressed)')
     
     args = parser.parse_args()
     
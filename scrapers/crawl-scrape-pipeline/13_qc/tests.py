@@ -9,7 +9,6 @@ import sys
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
-import pandas as pd
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import statistics
@@ -19,6 +18,84 @@ sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
 
 from config import config
 from utils_minimal import setup_logging, save_json, create_timestamp
+from record_stream import iter_record_chunks
+
+
+# Every per-domain product metric in one statement. The filtered products
+# are read once (the CTE is referenced twice, so Postgres materializes it)
+# and image presence is an EXISTS probe per product instead of a join.
+DOMAIN_METRICS_SQL = """
+WITH p AS (
+    SELECT p.title, p.price, p.description, p.brand, p.category, p.sku,
+           p.last_scraped_at,
+           EXISTS (
+               SELECT 1 FROM scraper.product_images pi WHERE pi.product_id = p.id
+           ) AS has_images
+    FROM scraper.products p
+    WHERE p.source_domain = %(domain)s AND p.is_active = TRUE
+),
+dup AS (
+    SELECT title, COUNT(*) AS count
+    FROM p
+    GROUP BY title
+    HAVING COUNT(*) > 1
+    ORDER BY count DESC
+    LIMIT 10
+)
+SELECT
+    COUNT(*) AS total,
+    MAX(last_scraped_at) AS latest_scrape,
+    COUNT(title) AS has_title,
+    COUNT(price) AS has_price,
+    COUNT(description) AS has_description,
+    COUNT(brand) AS has_brand,
+    COUNT(category) AS has_category,
+    COUNT(sku) AS has_sku,
+    COUNT(*) FILTER (WHERE has_images) AS has_images,
+    MIN(price) AS min_price,
+    MAX(price) AS max_price,
+    AVG(price) AS avg_price,
+    STDDEV(price) AS stddev_price,
+    COUNT(*) FILTER (WHERE price <= 0) AS bad_price_count,
+    COUNT(*) FILTER (WHERE LENGTH(title) < 10) AS short_title_count,
+    (SELECT COUNT(*) FROM dup) AS duplicate_count,
+    COALESCE((SELECT json_agg(json_build_object('title', title, 'count', count))
+              FROM dup), '[]'::json) AS duplicate_titles
+FROM p
+"""
+
+# One row per QC run, so trend checks read history instead of rescanning
+METRICS_SNAPSHOT_SQL = """
+CREATE TABLE IF NOT EXISTS scraper.qc_metrics (
+    id bigserial PRIMARY KEY,
+    domain text NOT NULL,
+    captured_at timestamp NOT NULL DEFAULT NOW(),
+    total_products integer,
+    latest_scrape timestamp,
+    has_title integer,
+    has_price integer,
+    has_description integer,
+    has_brand integer,
+    has_category integer,
+    has_sku integer,
+    has_images integer,
+    min_price numeric,
+    max_price numeric,
+    avg_price numeric,
+    stddev_price numeric,
+    bad_price_count integer,
+    short_title_count integer,
+    duplicate_count integer
+);
+CREATE INDEX IF NOT EXISTS qc_metrics_domain_captured_idx
+    ON scraper.qc_metrics (domain, captured_at DESC);
+"""
+
+SNAPSHOT_COLUMNS = [
+    'total_products', 'latest_scrape', 'has_title', 'has_price', 'has_description',
+    'has_brand', 'has_category', 'has_sku', 'has_images', 'min_price', 'max_price',
+    'avg_price', 'stddev_price', 'bad_price_count', 'short_title_count', 'duplicate_count',
+]
 
 
 class QualityChecker:
@@ -34,6 +111,7 @@ class QualityChecker:
         self.checks_passed = 0
         self.checks_failed = 0
         self.warnings = []
+        self._metrics = None
     
     def connect(self) -> bool:
         """Connect to database."""
@@ -69,6 +147,29 @@ class QualityChecker:
         self.warnings.append(warning)
         self.logger.warning(warning)
     
+    def domain_metrics(self) -> Dict[str, Any]:
+        """All per-domain product metrics, computed once per run in one scan."""
+        if self._metrics is None:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(DOMAIN_METRICS_SQL, {'domain': self.domain})
+                self._metrics = dict(cur.fetchone())
+        return self._metrics
+    
+    def save_metrics_snapshot(self) -> None:
+        """Append this run's metrics to scraper.qc_metrics."""
+        metrics = dict(self.domain_metrics(), total_products=self.domain_metrics()['total'])
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    f"INSERT INTO scraper.qc_metrics (domain, {', '.join(SNAPSHOT_COLUMNS)}) "
+                    f"VALUES (%(domain)s, {', '.join(f'%({c})s' for c in SNAPSHOT_COLUMNS)})",
+                    {'domain': self.domain, **{c: metrics[c] for c in SNAPSHOT_COLUMNS}}
+                )
+            self.conn.commit()
+        except Exception as e:
+            self.logger.error(f"Failed to save metrics snapshot: {e}")
+            self.conn.rollback()
+    
     def check_csv_file(self) -> Tuple[bool, Dict[str, Any]]:
         """Check if clean.csv file exists and is valid."""
         csv_file = Path(__file__).parent.parent / '11_clean' / 'clean.csv'
@@ -77,24 +178,29 @@ class QualityChecker:
             if not csv_file.exists():
                 return False, {'error': 'clean.csv not found'}
             
-            # Load CSV and check basic properties
-            df = pd.read_csv(csv_file)
+            # Stream the CSV and check basic properties
+            row_count = 0
+            columns = []
+            for chunk in iter_record_chunks(csv_file, 10000):
+                if not columns:
+                    columns = list(chunk[0].keys())
+                row_count += len(chunk)
             
             details = {
                 'file_path': str(csv_file),
-                'row_count': len(df),
-                'column_count': len(df.columns),
-                'columns': list(df.columns),
+                'row_count': row_count,
+                'column_count': len(columns),
+                'columns': columns,
                 'file_size_mb': round(csv_file.stat().st_size / 1024 / 1024, 2),
             }
             
             # Basic validation
-            if len(df) == 0:
+            if row_count == 0:
                 return False, {'error': 'CSV file is empty', **details}
             
             # Check for required columns
             required_columns = ['url', 'title']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in required_columns if col not in columns]
             if missing_columns:
                 details['missing_columns'] = missing_columns
                 return False, details
@@ -107,182 +213,96 @@ class QualityChecker:
     def check_data_freshness(self) -> Tuple[bool, Dict[str, Any]]:
         """Check if data is fresh."""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get latest scrape
-                cur.execute("""
-                    SELECT MAX(last_scraped_at) as latest_scrape,
-                           COUNT(*) as total_products
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE
-                """, (self.domain,))
-                
-                result = cur.fetchone()
-                
-                if not result or not result['latest_scrape']:
-                    return False, {'error': 'No data found'}
-                
-                latest_scrape = result['latest_scrape']
-                age_hours = (datetime.utcnow() - latest_scrape).total_seconds() / 3600
-                
-                details = {
-                    'latest_scrape': str(latest_scrape),
-                    'age_hours': round(age_hours, 1),
-                    'total_products': result['total_products'],
-                }
-                
-                # Check if data is stale (>24 hours old)
-                if age_hours > 24:
-                    self.add_warning(f"Data is {age_hours:.1f} hours old")
-                
-                return True, details
-                
+            result = self.domain_metrics()
+            
+            if not result or not result['latest_scrape']:
+                return False, {'error': 'No data found'}
+            
+            latest_scrape = result['latest_scrape']
+            age_hours = (datetime.utcnow() - latest_scrape).total_seconds() / 3600
+            
+            details = {
+                'latest_scrape': str(latest_scrape),
+                'age_hours': round(age_hours, 1),
+                'total_products': result['total'],
+            }
+            
+            # Check if data is stale (>24 hours old)
+            if age_hours > 24:
+                self.add_warning(f"Data is {age_hours:.1f} hours old")
+            
+            return True, details
+            
         except Exception as e:
             return False, {'error': str(e)}
     
     def check_data_completeness(self) -> Tuple[bool, Dict[str, Any]]:
         """Check data completeness."""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Check field coverage
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) as total,
-                        COUNT(title) as has_title,
-                        COUNT(price) as has_price,
-                        COUNT(description) as has_description,
-                        COUNT(brand) as has_brand,
-                        COUNT(category) as has_category,
-                        COUNT(sku) as has_sku
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE
-                """, (self.domain,))
-                
-                coverage = cur.fetchone()
-                total = coverage['total']
-                
-                if total == 0:
-                    return False, {'error': 'No products found'}
-                
-                # Calculate percentages
-                field_coverage = {
-                    'title': round(coverage['has_title'] / total * 100, 1),
-                    'price': round(coverage['has_price'] / total * 100, 1),
-                    'description': round(coverage['has_description'] / total * 100, 1),
-                    'brand': round(coverage['has_brand'] / total * 100, 1),
-                    'category': round(coverage['has_category'] / total * 100, 1),
-                    'sku': round(coverage['has_sku'] / total * 100, 1),
-                }
-                
-                # Check image coverage
-                cur.execute("""
-                    SELECT COUNT(DISTINCT p.id) as products_with_images
-                    FROM scraper.products p
-                    JOIN scraper.product_images pi ON p.id = pi.product_id
-                    WHERE p.source_domain = %s AND p.is_active = TRUE
-                """, (self.domain,))
-                
-                img_result = cur.fetchone()
-                field_coverage['images'] = round(img_result['products_with_images'] / total * 100, 1)
-                
-                # Determine if coverage is acceptable
-                critical_fields = ['title', 'price']
-                acceptable = all(field_coverage[f] >= 90 for f in critical_fields)
-                
-                # Add warnings for low coverage
-                for field, pct in field_coverage.items():
-                    if pct < 80:
-                        self.add_warning(f"Low coverage for {field}: {pct}%")
-                
-                return acceptable, {
-                    'total_products': total,
-                    'field_coverage': field_coverage,
-                }
-                
+            coverage = self.domain_metrics()
+            total = coverage['total']
+            
+            if total == 0:
+                return False, {'error': 'No products found'}
+            
+            # Calculate percentages
+            field_coverage = {
+                field: round(coverage[f'has_{field}'] / total * 100, 1)
+                for field in ['title', 'price', 'description', 'brand', 'category', 'sku', 'images']
+            }
+            
+            # Determine if coverage is acceptable
+            critical_fields = ['title', 'price']
+            acceptable = all(field_coverage[f] >= 90 for f in critical_fields)
+            
+            # Add warnings for low coverage
+            for field, pct in field_coverage.items():
+                if pct < 80:
+                    self.add_warning(f"Low coverage for {field}: {pct}%")
+            
+            return acceptable, {
+                'total_products': total,
+                'field_coverage': field_coverage,
+            }
+            
         except Exception as e:
             return False, {'error': str(e)}
     
     def check_data_quality(self) -> Tuple[bool, Dict[str, Any]]:
         """Check data quality metrics."""
         try:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Check for suspicious prices
-                cur.execute("""
-                    SELECT 
-                        MIN(price) as min_price,
-                        MAX(price) as max_price,
-                        AVG(price) as avg_price,
-                        STDDEV(price) as stddev_price,
-                        COUNT(*) as price_count
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE AND price IS NOT NULL
-                """, (self.domain,))
-                
-                price_stats = cur.fetchone()
-                
-                quality_issues = []
-                
-                # Check for zero or negative prices
-                cur.execute("""
-                    SELECT COUNT(*) as bad_price_count
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE AND price <= 0
-                """, (self.domain,))
-                
-                bad_prices = cur.fetchone()['bad_price_count']
-                if bad_prices > 0:
-                    quality_issues.append(f"{bad_prices} products with zero/negative prices")
-                
-                # Check for duplicate titles
-                cur.execute("""
-                    SELECT title, COUNT(*) as count
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE
-                    GROUP BY title
-                    HAVING COUNT(*) > 1
-                    ORDER BY count DESC
-                    LIMIT 10
-                """, (self.domain,))
-                
-                duplicates = cur.fetchall()
-                if duplicates:
-                    quality_issues.append(f"{len(duplicates)} duplicate titles found")
-                
-                # Check for very short titles
-                cur.execute("""
-                    SELECT COUNT(*) as short_title_count
-                    FROM scraper.products
-                    WHERE source_domain = %s AND is_active = TRUE 
-                    AND LENGTH(title) < 10
-                """, (self.domain,))
-                
-                short_titles = cur.fetchone()['short_title_count']
-                if short_titles > 0:
-                    quality_issues.append(f"{short_titles} products with very short titles")
-                
-                # Check for missing images
-                cur.execute("""
-                    SELECT COUNT(*) as no_image_count
-                    FROM scraper.products p
-                    LEFT JOIN scraper.product_images pi ON p.id = pi.product_id
-                    WHERE p.source_domain = %s AND p.is_active = TRUE
-                    AND pi.id IS NULL
-                """, (self.domain,))
-                
-                no_images = cur.fetchone()['no_image_count']
-                if no_images > 0:
-                    self.add_warning(f"{no_images} products without images")
-                
-                return len(quality_issues) == 0, {
-                    'price_stats': {
-                        'min': float(price_stats['min_price']) if price_stats['min_price'] else None,
-                        'max': float(price_stats['max_price']) if price_stats['max_price'] else None,
-                        'avg': float(price_stats['avg_price']) if price_stats['avg_price'] else None,
-                        'stddev': float(price_stats['stddev_price']) if price_stats['stddev_price'] else None,
-                    },
-                    'quality_issues': quality_issues,
-                    'duplicate_count': len(duplicates),
-                }
-                
+            metrics = self.domain_metrics()
+            quality_issues = []
+            
+            # Check for zero or negative prices
+            bad_prices = metrics['bad_price_count']
+            if bad_prices > 0:
+                quality_issues.append(f"{bad_prices} products with zero/negative prices")
+            
+            # Check for duplicate titles
+            duplicates = metrics['duplicate_titles']
+            if duplicates:
+                quality_issues.append(f"{len(duplicates)} duplicate titles found")
+            
+            # Check for very short titles
+            short_titles = metrics['short_title_count']
+            if short_titles > 0:
+                quality_issues.append(f"{short_titles} products with very short titles")
+            
+            # Check for missing images
+            no_images = metrics['total'] - metrics['has_images']
+            if no_images > 0:
+                self.add_warning(f"{no_images} products without images")
+            
+            return len(quality_issues) == 0, {
+                'price_stats': {
+                    stat: float(metrics[f'{stat}_price']) if metrics[f'{stat}_price'] else None
+                    for stat in ['min', 'max', 'avg', 'stddev']
+                },
+                'quality_issues': quality_issues,
+                'duplicate_count': len(duplicates),
+            }
+            
         except Exception as e:
             return False, {'error': str(e)}
     
@@ -323,9 +343,12 @@ class QualityChecker:
                     if avg_recent < avg_older * 0.8:  # 20% decline
                         self.add_warning(f"Declining scrape performance: {avg_recent:.0f} vs {avg_older:.0f} items")
                 
+                trend = self.metrics_trend(cur)
+                
                 return success_rate >= 80, {
                     'scrape_count': len(history),
                     'success_rate': round(success_rate, 1),
+                    **trend,
                     'recent_scrapes': [
                         {
                             'date': str(h['start_time']),
@@ -340,6 +363,38 @@ class QualityChecker:
         except Exception as e:
             return False, {'error': str(e)}
     
+    def metrics_trend(self, cur) -> Dict[str, Any]:
+        """Compare this run's metrics with the stored snapshots of earlier runs."""
+        cur.execute("""
+            SELECT captured_at, total_products, has_price, has_images
+            FROM scraper.qc_metrics
+            WHERE domain = %s
+            ORDER BY captured_at DESC
+            LIMIT 5
+        """, (self.domain,))
+        snapshots = [s for s in cur.fetchall() if s['total_products']]
+        if not snapshots:
+            return {}
+        
+        current = self.domain_metrics()
+        avg_products = statistics.mean(s['total_products'] for s in snapshots)
+        if current['total'] < avg_products * 0.8:  # 20% decline
+            self.add_warning(f"Catalog shrinking: {current['total']} vs {avg_products:.0f} products")
+        
+        coverage = {}
+        for field in ['price', 'images']:
+            previous = statistics.mean(s[f'has_{field}'] / s['total_products'] * 100 for s in snapshots)
+            now = current[f'has_{field}'] / current['total'] * 100 if current['total'] else 0
+            if now < previous - 10:
+                self.add_warning(f"{field} coverage dropped: {now:.1f}% vs {previous:.1f}%")
+            coverage[field] = {'now': round(now, 1), 'previous': round(previous, 1)}
+        
+        return {
+            'snapshot_count': len(snapshots),
+            'avg_products': round(avg_products),
+            'coverage_trend': coverage,
+        }
+    
     def check_price_stability(self) -> Tuple[bool, Dict[str, Any]]:
         """Check for unusual price changes."""
         try:
@@ -460,6 +515,10 @@ class QualityChecker:
         try:
             results = {}
             
+            with self.conn.cursor() as cur:
+                cur.execute(METRICS_SNAPSHOT_SQL)
+            self.conn.commit()
+            
             # Run checks
             checks = [
                 ('csv_file', self.check_csv_file),
@@ -486,6 +545,10 @@ class QualityChecker:
                     'details': details,
                 }
             
+            # Store this run's metrics for future trend checks
+            if self._metrics is not None:
+                self.save_metrics_snapshot()
+            
             # Generate report
             report_text = self.generate_report(results)
             
@@ -0,0 +1,80 @@
+"""
+Per-product change-rate estimates for refresh scheduling.
+
+Each product's changes (new price, availability flip) are modelled as a
+Poisson process with rate ``lambda`` per day. The estimate is a Gamma
+posterior over exponentially decayed counts: ``changes`` and
+``exposure_days`` both decay with a half-life, so the rate follows a
+product whose behaviour shifts, and the prior keeps products with little
+history near the site-wide default instead of at 0 or infinity.
+
+A visit only reveals *whether* something changed since the last one, not
+how many times, so a detected change is credited with the expected number
+of events given at least one, ``lambda*dt / (1 - exp(-lambda*dt))``.
+Rates well above one change per visit interval can't be told apart this
+way; they saturate near ``1/dt``, where the change probability is ~1 anyway.
+
+Scheduling value is the probability a re-crawl finds a change,
+``1 - exp(-lambda * age)``: every request costs the same, so taking the
+highest probabilities maximises expected detected changes per request.
+"""
+import heapq
+import math
+from typing import Iterable, List, Optional, Tuple
+
+
+# Prior: one change per 30 days, worth PRIOR_DAYS days of observation
+PRIOR_RATE = 1 / 30
+PRIOR_DAYS = 15.0
+
+# Older observations count half as much every HALF_LIFE_DAYS
+HALF_LIFE_DAYS = 60.0
+
+
+def rate(changes: float, exposure_days: float) -> float:
+    """Posterior mean change rate (per day)."""
+    return (changes + PRIOR_RATE * PRIOR_DAYS) / (exposure_days + PRIOR_DAYS)
+
+
+def expected_events(current_rate: float, interval_days: float) -> float:
+    """Expected number of changes in an interval known to contain at least one."""
+    mean = current_rate * interval_days
+    if mean < 1e-9:
+        return 1.0
+    return mean / -math.expm1(-mean)
+
+
+def update(changes: float, exposure_days: float, interval_days: float,
+           detected: int) -> Tuple[float, float]:
+    """Fold one observed interval into the decayed counts.
+
+    ``detected`` is how many changes the interval is known to contain
+    (e.g. price_history rows); 0 means the visit found nothing new.
+    """
+    interval_days = max(interval_days, 0.0)
+    decay = 0.5 ** (interval_days / HALF_LIFE_DAYS)
+    credited = 0.0
+    if detected:
+        credited = max(float(detected),
+                       expected_events(rate(changes, exposure_days), interval_days))
+    return changes * decay + credited, exposure_days * decay + interval_days
+
+
+def change_probability(current_rate: float, age_days: Optional[float]) -> float:
+    """Chance a product changed since it was last seen (1 if never seen)."""
+    if age_days is None:
+        return 1.0
+    return -math.expm1(-current_rate * max(age_days, 0.0))
+
+
+def allocate(candidates: Iterable[Tuple[str, float, Optional[float]]], budget: int,
+             min_gain: float = 0.0) -> Tuple[List[str], float]:
+    """Pick up to ``budget`` URLs with the highest change probability.
+
+    ``candidates`` are ``(url, rate, age_days)``. URLs below ``min_gain``
+    are not worth a request; their slots are left for discovery. Returns
+    the URLs, most promising first, and their expected detected changes.
+    """
+    scored = ((change_probability(r, age), url) for url, r, age in candidates)
+    best = heapq.nlargest(budget, (s for s in scored if s[0] >= min_gain))
+    return [url for _, url in best], sum(score for score, _ in best)
@@ -5,22 +5,78 @@ Performs incremental updates by crawling only new or changed content.
 """
 
 import argparse
+import csv
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
-from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
 
 from config import config
 from utils_minimal import (
     setup_logging, save_json, load_json, write_urls_file,
     read_urls_file, create_timestamp
 )
+from orchestration.page_store import PageStore
+from orchestration.utils_minimal import read_ndjson
+import change_rate
+
+
+# Per-product change-rate state, updated incrementally on every planning run
+CHANGE_ESTIMATES_SQL = """
+    CREATE TABLE IF NOT EXISTS scraper.change_estimates (
+        product_id integer PRIMARY KEY
+            REFERENCES scraper.products (id) ON DELETE CASCADE,
+        changes double precision NOT NULL,
+        exposure_days double precision NOT NULL,
+        rate double precision NOT NULL,
+        last_price numeric,
+        last_availability text,
+        observed_at timestamp,
+        updated_at timestamp NOT NULL DEFAULT NOW()
+    )
+"""
+
+# Every active product with its stored estimate and the price changes
+# logged since that estimate last saw the product. The loader stamps
+# last_scraped_at and price_history.recorded_at with the same transaction
+# NOW(), so the row a visit logs falls in exactly one window
+CHANGE_OBSERVATIONS_SQL = """
+    SELECT p.id, p.source_url, p.price, p.availability, p.last_scraped_at,
+           e.changes, e.exposure_days, e.last_price, e.last_availability,
+           e.observed_at, ph.logged, ph.first_logged
+    FROM scraper.products p
+    LEFT JOIN scraper.change_estimates e ON e.product_id = p.id
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS logged, MIN(recorded_at) AS first_logged
+        FROM scraper.price_history h
+        WHERE h.product_id = p.id
+          AND (e.observed_at IS NULL OR h.recorded_at > e.observed_at)
+          AND h.recorded_at <= COALESCE(p.last_scraped_at, NOW())
+    ) ph ON TRUE
+    WHERE p.source_domain = %s AND p.is_active = TRUE
+"""
+
+UPSERT_ESTIMATES_SQL = """
+    INSERT INTO scraper.change_estimates (
+        product_id, changes, exposure_days, rate,
+        last_price, last_availability, observed_at, updated_at
+    ) VALUES %s
+    ON CONFLICT (product_id) DO UPDATE SET
+        changes = EXCLUDED.changes,
+        exposure_days = EXCLUDED.exposure_days,
+        rate = EXCLUDED.rate,
+        last_price = EXCLUDED.last_price,
+        last_availability = EXCLUDED.last_availability,
+        observed_at = EXCLUDED.observed_at,
+        updated_at = EXCLUDED.updated_at
+"""
 
 
 class IncrementalCrawler:
@@ -31,6 +87,7 @@ class IncrementalCrawler:
         self.domain = domain
         self.logger = setup_logging('incremental_crawler', Path(__file__).parent / 'refresh.log')
         self.output_dir = Path(__file__).parent
+        self.page_store_dir = Path(__file__).parent.parent / '08_fetch' / 'pages'
         self.conn = None
     
     def connect(self) -> bool:
@@ -177,65 +234,187 @@ class IncrementalCrawler:
             self.logger.error(f"Error getting existing URLs: {e}")
             return set()
     
+    def seed_validators(self) -> int:
+        """Copy ETag / Last-Modified from the latest 01_map dump into the page store.
+        
+        URLs that already have validators from a previous fetch keep them;
+        the fetch engine refreshes them on every 200 response.
+        """
+        map_dir = Path(__file__).parent.parent / '01_map'
+        dumps = list(map_dir.glob('*_enhanced.csv')) + list(map_dir.glob('dump.csv'))
+        dumps.sort(key=lambda p: p.stat().st_mtime)
+        if not dumps:
+            return 0
+        
+        dump_file = dumps[-1]
+        seeded = 0
+        
+        with PageStore(self.page_store_dir) as store, \
+                open(dump_file, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('status_code') != '200':
+                    continue
+                if not row.get('etag') and not row.get('last_modified'):
+                    continue
+                if store.validators(row['url']):
+                    continue
+                store.set_validators(
+                    row['url'],
+                    etag=row.get('etag'),
+                    last_modified=row.get('last_modified'),
+                    cache_control=row.get('cache_control'),
+                )
+                seeded += 1
+        
+        self.logger.info(f"Seeded validators for {seeded} URLs from {dump_file.name}")
+        return seeded
+    
+    def mark_unchanged(self, since: str) -> int:
+        """Bump last_scraped_at for URLs the refresh fetch found unchanged.
+        
+        These URLs skip parse, dedupe, clean and load, so this is the only
+        place their freshness is recorded.
+        """
+        metadata_file = Path(__file__).parent.parent / '08_fetch' / 'crawl_metadata.ndjson'
+        unchanged = [
+            r['requested_url'] for r in read_ndjson(metadata_file)
+            if r.get('unchanged') and r.get('timestamp', '') >= since
+        ]
+        if not unchanged:
+            return 0
+        
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE scraper.products
+                    SET last_scraped_at = NOW()
+                    WHERE source_domain = %s
+                    AND source_url = ANY(%s)
+                """, (self.domain, unchanged))
+                updated = cur.rowcount
+            self.conn.commit()
+        except Exception as e:
+            self.logger.error(f"Error marking unchanged URLs: {e}")
+            self.conn.rollback()
+            return 0
+        
+        self.logger.info(f"Marked {updated} unchanged URLs as fresh")
+        return updated
+    
+    def update_change_estimates(self) -> List[Tuple[str, float, Optional[float]]]:
+        """Fold new observations into scraper.change_estimates.
+        
+        A product was observed again when its last_scraped_at moved past the
+        stored observed_at; the visit detected a change if price_history
+        logged one in between or the price/availability differs from what
+        the estimate last saw. Products without an estimate are seeded from
+        their whole price history.
+        
+        Returns ``(url, rate, age_days)`` for every active product.
+        """
+        candidates = []
+        updates = []
+        
+        with self.conn.cursor() as cur:
+            cur.execute(CHANGE_ESTIMATES_SQL)
+            # Ages on the clock that stamped last_scraped_at
+            cur.execute("SELECT LOCALTIMESTAMP")
+            now = cur.fetchone()[0]
+        
+        # Named cursor streams the products instead of fetching them all
+        with self.conn.cursor('change_observations', cursor_factory=RealDictCursor) as cur:
+            cur.itersize = 5000
+            cur.execute(CHANGE_OBSERVATIONS_SQL, (self.domain,))
+            
+            for row in cur:
+                scraped_at = row['last_scraped_at']
+                changes, exposure = row['changes'], row['exposure_days']
+                logged = row['logged'] or 0
+                
+                if changes is None:
+                    # Seed: the first price_history row is the initial price
+                    changes = float(max(logged - 1, 0))
+                    exposure = 0.0
+                    if scraped_at and row['first_logged']:
+                        exposure = (scraped_at - row['first_logged']).total_seconds() / 86400
+                    observed = True
+                elif scraped_at and (row['observed_at'] is None or scraped_at > row['observed_at']):
+                    flipped = (row['availability'] != row['last_availability']
+                               or (row['price'] is not None and row['last_price'] is not None
+                                   and row['price'] != row['last_price']))
+                    detected = max(logged, 1) if (logged or flipped) else 0
+                    interval = 0.0
+                    if row['observed_at']:
+                        interval = (scraped_at - row['observed_at']).total_seconds() / 86400
+                    changes, exposure = change_rate.update(changes, exposure, interval, detected)
+                    observed = True
+                else:
+                    observed = False
+                
+                current_rate = change_rate.rate(changes, exposure)
+                if observed:
+                    updates.append((
+                        row['id'], changes, exposure, current_rate,
+                        row['price'], row['availability'], scraped_at, now,
+                    ))
+                
+                age = (now - scraped_at).total_seconds() / 86400 if scraped_at else None
+                candidates.append((row['source_url'], current_rate, age))
+        
+        with self.conn.cursor() as cur:
+            execute_values(cur, UPSERT_ESTIMATES_SQL, updates, page_size=5000)
+        self.conn.commit()
+        
+        self.logger.info(f"Updated change estimates for {len(updates)} of {len(candidates)} products")
+        return candidates
+    
+    def get_adaptive_urls(self, max_urls: int,
+                          min_gain: float = 0.05) -> Tuple[List[str], float]:
+        """URLs most likely to have changed, and the expected changes they find."""
+        try:
+            candidates = self.update_change_estimates()
+        except Exception as e:
+            self.logger.error(f"Error estimating change rates: {e}")
+            self.conn.rollback()
+            return [], 0.0
+        return change_rate.allocate(candidates, max_urls, min_gain)
+    
     def prioritize_urls(self, urls: List[str], max_urls: int) -> List[str]:
-        """Prioritize URLs for crawling."""
+        """Prioritize URLs for crawling by their chance of having changed."""
         if len(urls) <= max_urls:
             return urls
         
-        # Group URLs by priority
-        priority_groups = {
-            'high': [],
-            'medium': [],
-            'low': [],
-        }
-        
-        # Get URL metadata from database
+        # Get stored estimates from database
         try:
             with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                url_str = ','.join(f"'{url}'" for url in urls[:1000])  # Limit for query
-                
-                cur.execute(f"""
-                    SELECT 
-                        source_url,
-                        last_scraped_at,
-                        price,
-                        availability
-                    FROM scraper.products
-                    WHERE source_url IN ({url_str})
-                """)
+                cur.execute("""
+                    SELECT p.source_url, p.last_scraped_at, e.rate, LOCALTIMESTAMP AS now
+                    FROM scraper.products p
+                    LEFT JOIN scraper.change_estimates e ON e.product_id = p.id
+                    WHERE p.source_url = ANY(%s)
+                """, (urls,))
                 
                 url_data = {r['source_url']: r for r in cur.fetchall()}
-        except:
+        except Exception as e:
+            self.logger.error(f"Error getting change estimates: {e}")
+            self.conn.rollback()
             url_data = {}
         
-        # Categorize URLs
+        now = next(iter(url_data.values()))['now'] if url_data else None
+        candidates = []
         for url in urls:
             data = url_data.get(url, {})
-            
-            # High priority: never scraped or out of stock
-            if not data.get('last_scraped_at') or data.get('availability') == 'out_of_stock':
-                priority_groups['high'].append(url)
-            # Medium priority: high-value items or stale
-            elif data.get('price', 0) > 100 or (
-                data.get('last_scraped_at') and 
-                (datetime.utcnow() - data['last_scraped_at']).days > 3
-            ):
-                priority_groups['medium'].append(url)
-            else:
-                priority_groups['low'].append(url)
-        
-        # Build final list
-        prioritized = []
-        for group in ['high', 'medium', 'low']:
-            remaining = max_urls - len(prioritized)
-            if remaining > 0:
-                prioritized.extend(priority_groups[group][:remaining])
+            scraped_at = data.get('last_scraped_at')
+            age = (now - scraped_at).total_seconds() / 86400 if scraped_at else None
+            candidates.append((url, data.get('rate') or change_rate.PRIOR_RATE, age))
         
+        prioritized, _ = change_rate.allocate(candidates, max_urls)
         return prioritized
     
-    def generate_crawl_list(self, strategy: str = 'balanced',
+    def generate_crawl_list(self, strategy: str = 'adaptive',
                            max_urls: int = 1000,
-                           stale_days: int = 7) -> Tuple[List[str], Dict[str, Any]]:
+                           stale_days: int = 7,
+                           min_gain: float = 0.05) -> Tuple[List[str], Dict[str, Any]]:
         """Generate list of URLs to crawl based on strategy."""
         urls_to_crawl = []
         stats = {
@@ -245,7 +424,21 @@ class IncrementalCrawler:
             'new_urls': 0,
         }
         
-        if strategy == 'stale':
+        if strategy == 'adaptive':
+            # Spend the budget where a change is most likely; slots no known
+            # product is worth (gain below min_gain) go to discovery
+            adaptive_urls, expected = self.get_adaptive_urls(max_urls, min_gain)
+            urls_to_crawl.extend(adaptive_urls)
+            stats['adaptive_urls'] = len(adaptive_urls)
+            stats['expected_changes'] = round(expected, 1)
+            
+            remaining = max_urls - len(adaptive_urls)
+            if remaining > 0:
+                new_urls = self.discover_new_urls()
+                urls_to_crawl.extend(new_urls[:remaining])
+                stats['new_urls'] = min(len(new_urls), remaining)
+        
+        elif strategy == 'stale':
             # Only crawl stale URLs
             stale_urls = self.get_stale_urls(stale_days)
             urls_to_crawl = stale_urls[:max_urls]
@@ -298,9 +491,10 @@ class IncrementalCrawler:
         
         return unique_urls, stats
     
-    def run(self, strategy: str = 'balanced',
+    def run(self, strategy: str = 'adaptive',
             max_urls: int = 1000,
-            stale_days: int = 7) -> Dict[str, Any]:
+            stale_days: int = 7,
+            min_gain: float = 0.05) -> Dict[str, Any]:
         """Run incremental crawl planning."""
         self.logger.info(f"Starting incremental crawl planning for domain: {self.domain}")
         self.logger.info(f"Strategy: {strategy}, Max URLs: {max_urls}")
@@ -314,13 +508,17 @@ class IncrementalCrawler:
             urls_to_crawl, stats = self.generate_crawl_list(
                 strategy=strategy,
                 max_urls=max_urls,
-                stale_days=stale_days
+                stale_days=stale_days,
+                min_gain=min_gain
             )
             
             if not urls_to_crawl:
                 self.logger.warning("No URLs selected for incremental crawl")
                 return {'error': 'No URLs to crawl'}
             
+            # Make stored validators available for conditional re-fetch
+            stats['validators_seeded'] = self.seed_validators()
+            
             # Save URL list
             urls_file = self.output_dir / 'incremental_urls.txt'
             write_urls_file(urls_to_crawl, urls_file)
@@ -349,27 +547,40 @@ cd {Path(__file__).parent.parent}
 echo "Starting incremental crawl for {self.domain}"
 echo "URLs to crawl: {len(urls_to_crawl)}"
 
-# Run the crawl
+RUN_STARTED=$(date +%Y-%m-%dT%H:%M:%S)
+
+# Run the crawl; unchanged pages (304) are not stored
 python 08_fetch/crawl_full.py \\
     --domain {self.domain} \\
     --input {urls_file} \\
-    --batch-size 100
+    --conditional
 
-# Run parsing
+# Record freshness of unchanged pages
+python 14_refresh/incremental_crawl.py \\
+    --domain {self.domain} \\
+    --mark-unchanged "$RUN_STARTED"
+
+# Run parsing on changed pages only; parsed.ndjson is replaced, so the
+# steps below see this run's changed pages and nothing else
 python 09_scrape/parse_dom.py \\
-    --domain {self.domain}
+    --domain {self.domain} \\
+    --since "$RUN_STARTED"
 
-# Run deduplication
-python 10_dedupe/dedupe.py \\
-    --domain {self.domain}
+if [ -s 09_scrape/parsed.ndjson ]; then
+    # Run deduplication
+    python 10_dedupe/dedupe.py \\
+        --domain {self.domain}
 
-# Run cleaning
-python 11_clean/clean.py \\
-    --domain {self.domain}
+    # Run cleaning
+    python 11_clean/clean.py \\
+        --domain {self.domain}
 
-# Load to database
-python 12_load/load_db.py \\
-    --domain {self.domain}
+    # Load to database
+    python 12_load/load_db.py \\
+        --domain {self.domain}
+else
+    echo "No changed pages to load"
+fi
 
 # Run quality checks
 python 13_qc/tests.py \\
@@ -408,9 +619,12 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  # Balanced incremental crawl
+  # Change-rate driven incremental crawl
   python incremental_crawl.py --domain example.com
   
+  # Fixed 40/40/20 priority/stale/new split
+  python incremental_crawl.py --domain example.com --strategy balanced
+  
   # Focus on stale content
   python incremental_crawl.py --domain example.com --strategy stale
   
@@ -424,7 +638,9 @@ Examples:
   python incremental_crawl.py --domain example.com --max-urls 500 --stale-days 3
 
 Strategies:
-  - balanced: Mix of stale, priority, and new URLs (default)
+  - adaptive: URLs most likely to have changed, from per-product change-rate
+    estimates (scraper.change_estimates); spare budget goes to discovery (default)
+  - balanced: Mix of stale, priority, and new URLs
   - stale: Focus on URLs not crawled recently
   - priority: High-value and frequently changing items
   - discover: Find new URLs not in database
@@ -432,23 +648,39 @@ Strategies:
     )
     
     parser.add_argument('--domain', required=True, help='Domain to crawl')
-    parser.add_argument('--strategy', choices=['balanced', 'stale', 'priority', 'discover'],
-                       default='balanced', help='Crawl strategy')
+    parser.add_argument('--strategy', choices=['adaptive', 'balanced', 'stale', 'priority', 'discover'],
+                       default='adaptive', help='Crawl strategy')
     parser.add_argument('--max-urls', type=int, default=1000,
                        help='Maximum URLs to crawl')
     parser.add_argument('--stale-days', type=int, default=7,
                        help='Days before considering URL stale')
+    parser.add_argument('--min-gain', type=float, default=0.05,
+                       help='Adaptive: minimum change probability worth a request')
     parser.add_argument('--execute', action='store_true',
                        help='Execute the crawl immediately')
+    parser.add_argument('--mark-unchanged', metavar='SINCE',
+                       help='Mark URLs fetched as unchanged since SINCE as fresh, then exit')
     
     args = parser.parse_args()
     
     # Run incremental crawler
     crawler = IncrementalCrawler(args.domain)
+    
+    if args.mark_unchanged:
+        if not crawler.connect():
+            sys.exit(1)
+        try:
+            count = crawler.mark_unchanged(args.mark_unchanged)
+        finally:
+            crawler.disconnect()
+        print(f"Marked {count} unchanged URLs as fresh")
+        return
+    
     plan = crawler.run(
         strategy=args.strategy,
         max_urls=args.max_urls,
-        stale_days=args.stale_days
+        stale_days=args.stale_days,
+        min_gain=args.min_gain
     )
     
     if plan and not plan.get('error'):
@@ -7,23 +7,61 @@ Handles URL changes, redirects, and maintains URL mapping history.
 import argparse
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Any, Dict, List, Optional, Tuple, Set
 from urllib.parse import urlparse
 import requests
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'orchestration'))
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
 
 from config import config
 from utils_minimal import setup_logging, save_json, load_json, create_timestamp
+from url_verifier import URLVerifier
+
+
+# Statuses that mean the product page is gone
+GONE_STATUSES = {404, 410}
+
+# Apply one batch of old -> new URL mappings in a single statement. A new
+# URL that already exists (or that several old URLs redirect to) keeps its
+# product; the other old rows are deactivated and point at it. Otherwise
+# the product moves to the new URL and remembers the old one.
+REMAP_BATCH_SQL = """
+    WITH m (old_url, new_url) AS (VALUES %s),
+    r AS (
+        SELECT m.old_url, m.new_url,
+               EXISTS (SELECT 1 FROM scraper.products p WHERE p.source_url = m.new_url) AS taken,
+               ROW_NUMBER() OVER (PARTITION BY m.new_url ORDER BY m.old_url) AS rn
+        FROM m
+    ),
+    deactivated AS (
+        UPDATE scraper.products p
+        SET is_active = FALSE,
+            metadata = jsonb_set(COALESCE(p.metadata, '{}'), '{redirected_to}', to_jsonb(r.new_url))
+        FROM r
+        WHERE p.source_url = r.old_url AND (r.taken OR r.rn > 1)
+        RETURNING 1
+    ),
+    moved AS (
+        UPDATE scraper.products p
+        SET source_url = r.new_url,
+            metadata = jsonb_set(COALESCE(p.metadata, '{}'), '{previous_url}', to_jsonb(r.old_url))
+        FROM r
+        WHERE p.source_url = r.old_url AND NOT r.taken AND r.rn = 1
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM deactivated) + (SELECT COUNT(*) FROM moved)
+"""
 
 
 class URLRemapper:
     """Handles URL remapping and redirect resolution."""
     
-    def __init__(self, domain: str):
+    def __init__(self, domain: str, max_in_flight: int = 64):
         """Initialize URL remapper."""
         self.domain = domain
         self.logger = setup_logging('url_remapper', Path(__file__).parent / 'remap.log')
@@ -31,6 +69,7 @@ class URLRemapper:
         self.conn = None
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': config.user_agent})
+        self.max_in_flight = max_in_flight
     
     def connect(self) -> bool:
         """Connect to database."""
@@ -80,6 +119,26 @@ class URLRemapper:
         
         return result
     
+    def verify_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Check many URLs concurrently; returns redirected, gone and failed ones.
+        
+        Results for URLs that answered at their own address are dropped as
+        they arrive, so memory follows the number of changes, not of URLs.
+        """
+        interesting = []
+        
+        def keep(result: Dict[str, Any]) -> None:
+            if (result['url_changed'] or result['error']
+                    or result['status_code'] in GONE_STATUSES):
+                interesting.append(result)
+        
+        verifier = URLVerifier(max_in_flight=self.max_in_flight,
+                               headers={'User-Agent': config.user_agent})
+        stats = verifier.run(urls, keep)
+        self.logger.info(f"Verified {stats['checked']} URLs: {stats['head']} HEAD, "
+                         f"{stats['get_fallback']} GET fallbacks, {stats['errors']} errors")
+        return interesting
+    
     def get_active_urls(self) -> List[str]:
         """Get all active URLs from database."""
         try:
@@ -131,14 +190,19 @@ class URLRemapper:
             summary = load_json(patterns_file)
             patterns = summary.get('patterns', {})
             
-            # Check sample URLs from each pattern
-            for pattern, info in patterns.items():
-                examples = info.get('examples', [])[:3]
-                
+            # Check sample URLs from every pattern in one concurrent batch
+            examples = {pattern: info.get('examples', [])[:3]
+                        for pattern, info in patterns.items()}
+            checked = {
+                result['original_url']: result
+                for result in self.verify_urls([u for urls in examples.values() for u in urls])
+            }
+            
+            for pattern, urls in examples.items():
                 redirects = []
-                for url in examples:
-                    result = self.check_url_status(url)
-                    if result['url_changed'] and not result.get('error'):
+                for url in urls:
+                    result = checked.get(url)
+                    if result and result['url_changed'] and not result.get('error'):
                         redirects.append({
                             'from': url,
                             'to': result['final_url'],
@@ -172,65 +236,56 @@ class URLRemapper:
         
         return path
     
-    def update_database_urls(self, mappings: Dict[str, str]) -> Dict[str, int]:
-        """Update URLs in database based on mappings."""
+    def update_database_urls(self, mappings: Dict[str, str],
+                             batch_size: int = 1000) -> Dict[str, int]:
+        """Update URLs in database based on mappings, one statement per batch."""
         stats = {
             'updated': 0,
             'failed': 0,
         }
         
-        try:
-            with self.conn.cursor() as cur:
-                for old_url, new_url in mappings.items():
-                    try:
-                        # Check if new URL already exists
-                        cur.execute("""
-                            SELECT id FROM scraper.products
-                            WHERE source_url = %s
-                        """, (new_url,))
-                        
-                        if cur.fetchone():
-                            # Mark old as inactive instead of updating
-                            cur.execute("""
-                                UPDATE scraper.products
-                                SET is_active = FALSE,
-                                    metadata = jsonb_set(
-                                        COALESCE(metadata, '{}'),
-                                        '{redirected_to}',
-                                        %s
-                                    )
-                                WHERE source_url = %s
-                            """, (f'"{new_url}"', old_url))
-                        else:
-                            # Update URL
-                            cur.execute("""
-                                UPDATE scraper.products
-                                SET source_url = %s,
-                                    metadata = jsonb_set(
-                                        COALESCE(metadata, '{}'),
-                                        '{previous_url}',
-                                        %s
-                                    )
-                                WHERE source_url = %s
-                            """, (new_url, f'"{old_url}"', old_url))
-                        
-                        self.conn.commit()
-                        stats['updated'] += 1
-                        
-                    except Exception as e:
-                        self.logger.error(f"Failed to update {old_url}: {e}")
-                        self.conn.rollback()
-                        stats['failed'] += 1
-            
-        except Exception as e:
-            self.logger.error(f"Error updating database: {e}")
+        pairs = [(old, new) for old, new in mappings.items() if old != new]
+        for i in range(0, len(pairs), batch_size):
+            batch = pairs[i:i + batch_size]
+            try:
+                with self.conn.cursor() as cur:
+                    result = execute_values(cur, REMAP_BATCH_SQL, batch,
+                                            page_size=len(batch), fetch=True)
+                self.conn.commit()
+                stats['updated'] += result[0][0]
+            except Exception as e:
+                self.logger.error(f"Failed to apply {len(batch)} URL mappings: {e}")
+                self.conn.rollback()
+                stats['failed'] += len(batch)
         
         return stats
     
+    def deactivate_urls(self, urls: List[str], reason: str) -> int:
+        """Mark products inactive in one statement, recording why."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE scraper.products
+                SET is_active = FALSE,
+                    metadata = jsonb_set(
+                        COALESCE(metadata, '{}'),
+                        '{deactivated_reason}',
+                        to_jsonb(%s::text)
+                    )
+                WHERE source_url = ANY(%s)
+            """, (reason, urls))
+            deactivated = cur.rowcount
+        self.conn.commit()
+        return deactivated
+    
     def run(self, check_redirects: bool = True,
             check_404s: bool = True,
-            auto_update: bool = False) -> Dict[str, Any]:
-        """Run URL remapping process."""
+            auto_update: bool = False,
+            check_all: bool = False) -> Dict[str, Any]:
+        """Run URL remapping process.
+        
+        With ``check_all`` every active URL is verified instead of a
+        100-URL sample.
+        """
         self.logger.info(f"Starting URL remapping for domain: {self.domain}")
         
         # Connect to database
@@ -239,6 +294,7 @@ class URLRemapper:
         
         try:
             mappings = {}
+            gone_urls = []
             report = {
                 'timestamp': create_timestamp(),
                 'domain': self.domain,
@@ -255,14 +311,18 @@ class URLRemapper:
                 report['checks_performed'].append('redirects')
                 
                 active_urls = self.get_active_urls()
-                sample_size = min(100, len(active_urls))
+                if not check_all:
+                    active_urls = active_urls[:100]
                 
-                self.logger.info(f"Checking {sample_size} sample URLs")
+                self.logger.info(f"Checking {len(active_urls)} URLs")
                 
-                for url in active_urls[:sample_size]:
-                    result = self.check_url_status(url)
-                    
-                    if result['url_changed'] and not result.get('error'):
+                for result in self.verify_urls(active_urls):
+                    url = result['original_url']
+                    if result.get('error'):
+                        continue
+                    if result['status_code'] in GONE_STATUSES:
+                        gone_urls.append(url)
+                    elif result['url_changed']:
                         mappings[url] = result['final_url']
                         report['url_changes'].append({
                             'from': url,
@@ -275,24 +335,13 @@ class URLRemapper:
                 self.logger.info("Checking for 404 URLs...")
                 report['checks_performed'].append('404s')
                 
-                not_found = self.find_404_urls()
+                # 404s from the last map dump plus any the redirect check hit
+                not_found = list(dict.fromkeys(self.find_404_urls() + gone_urls))
                 report['404_urls'] = not_found
                 
                 # Mark 404s as inactive
                 if not_found and auto_update:
-                    with self.conn.cursor() as cur:
-                        for url in not_found:
-                            cur.execute("""
-                                UPDATE scraper.products
-                                SET is_active = FALSE,
-                                    metadata = jsonb_set(
-                                        COALESCE(metadata, '{}'),
-                                        '{deactivated_reason}',
-                                        '"404_not_found"'
-                                    )
-                                WHERE source_url = %s
-                            """, (url,))
-                        self.conn.commit()
+                    self.deactivate_urls(not_found, '404_not_found')
             
             # Detect pattern changes
             self.logger.info("Detecting URL pattern changes...")
@@ -355,8 +404,11 @@ Examples:
   # Only check for 404s
   python remap.py --domain example.com --no-redirects
   
-  # Full check without updating
+  # Verify every active URL (HEAD-first, 64 in flight, per-host limits)
   python remap.py --domain example.com --check-all
+  
+  # Same, with more requests in flight
+  python remap.py --domain example.com --check-all --concurrency 200
         """
     )
     
@@ -369,15 +421,18 @@ Examples:
                        help='Skip 404 checking')
     parser.add_argument('--check-all', action='store_true',
                        help='Check all URLs (not just samples)')
+    parser.add_argument('--concurrency', type=int, default=64,
+                       help='Maximum URL checks in flight (default: 64)')
     
     args = parser.parse_args()
     
     # Run remapper
-    remapper = URLRemapper(args.domain)
+    remapper = URLRemapper(args.domain, max_in_flight=args.concurrency)
     report = remapper.run(
         check_redirects=not args.no_redirects,
         check_404s=not args.no_404s,
-        auto_update=args.auto_update
+        auto_update=args.auto_update,
+        check_all=args.check_all
     )
     
     if report:
@@ -0,0 +1,313 @@
+"""
+Pool of long-lived headless browsers shared by the Playwright-based steps.
+
+Launching Chromium costs 1-2 s, far more than rendering most pages, so
+the pool keeps a few browsers running and hands out pages from them:
+
+* each browser serves up to ``contexts_per_browser`` contexts at once.
+  A context is created once with its init (stealth) scripts and its
+  resource-blocking route, and owns a single page, which is reused lease
+  after lease
+* images, fonts and media are aborted at the route, so renders only wait
+  for documents, scripts, stylesheets and XHR
+* a browser is relaunched after ``max_pages_per_browser`` pages, or when
+  its process tree grows past ``max_memory_mb``. Memory is only measured
+  when psutil is installed. The old browser finishes its in-flight pages
+  first
+* a page whose lease raised is dropped along with its context, so a
+  crashed or wedged tab never goes back into the pool
+
+Usage::
+
+    async with BrowserPool() as pool:
+        async with pool.page() as page:
+            await page.goto(url)
+
+Listeners a caller adds with ``page.on`` must be removed before release,
+because the page is reused by the next lease.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Union
+
+from .config import BROWSER_POOL_CONFIG
+
+# Playwright is optional - only the browser-based methods need it
+try:
+    from playwright.async_api import async_playwright
+    PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    PLAYWRIGHT_AVAILABLE = False
+
+# psutil is optional - without it browsers are only recycled by page count
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+    window.chrome = {runtime: {}};
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({state: Notification.permission}) :
+            originalQuery(parameters)
+    );
+"""
+
+
+class BrowserSlot:
+    """One running browser and the idle pages it holds."""
+
+    __slots__ = ('browser', 'pids', 'idle', 'leased', 'pages_served', 'retiring')
+
+    def __init__(self, browser: Any, pids: Set[int]):
+        self.browser = browser
+        self.pids = pids
+        self.idle: List[Any] = []
+        self.leased = 0
+        self.pages_served = 0
+        self.retiring = False
+
+    def memory_mb(self) -> float:
+        """Resident memory of the browser's process tree."""
+        if not PSUTIL_AVAILABLE or not self.pids:
+            return 0.0
+        seen: Set[int] = set()
+        total = 0
+        for pid in self.pids:
+            try:
+                root = psutil.Process(pid)
+                for proc in [root] + root.children(recursive=True):
+                    if proc.pid not in seen:
+                        seen.add(proc.pid)
+                        total += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+
+class BrowserPool:
+    """Long-lived headless browsers serving recycled contexts and pages."""
+
+    def __init__(self, size: Optional[int] = None, contexts_per_browser: Optional[int] = None,
+                 max_pages_per_browser: Optional[int] = None,
+                 max_memory_mb: Optional[float] = None,
+                 block_resources: Optional[Sequence[str]] = None,
+                 context_options: Union[Dict[str, Any], Callable[[], Dict[str, Any]], None] = None,
+                 init_scripts: Sequence[str] = (STEALTH_SCRIPT,),
+                 page_setup: Optional[Callable[[Any], Awaitable[None]]] = None,
+                 launch_args: Optional[Sequence[str]] = None, headless: bool = True):
+        settings = BROWSER_POOL_CONFIG
+        self.size = size or settings['browsers']
+        self.contexts_per_browser = contexts_per_browser or settings['contexts_per_browser']
+        self.max_pages_per_browser = max_pages_per_browser or settings['max_pages_per_browser']
+        self.max_memory_mb = max_memory_mb or settings['max_memory_mb']
+        self.memory_check_every = settings['memory_check_every']
+        self.block_resources = frozenset(settings['block_resources'] if block_resources is None
+                                         else block_resources)
+        # A callable gives every new context fresh options (e.g. a rotated user agent)
+        self.context_options = context_options if context_options is not None \
+            else settings['context']
+        self.init_scripts = list(init_scripts)
+        self.page_setup = page_setup
+        self.launch_args = list(settings['launch_args'] if launch_args is None else launch_args)
+        self.headless = headless
+
+        self.stats = {'launches': 0, 'recycled_by_pages': 0, 'recycled_by_memory': 0,
+                      'contexts': 0, 'pages_served': 0, 'blocked_requests': 0}
+        self._playwright = None
+        self._slots: List[BrowserSlot] = []
+        self._leases: Dict[Any, BrowserSlot] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._starting: Optional[asyncio.Future] = None
+        self._releases = 0
+
+    async def start(self) -> 'BrowserPool':
+        if not PLAYWRIGHT_AVAILABLE:
+            raise RuntimeError("playwright is not installed - pip install playwright && playwright install chromium")
+        if self._starting is None:
+            # Stored before the first await, so concurrent callers share one driver
+            self._starting = asyncio.ensure_future(self._start_driver())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            self._starting = None  # let a later call retry
+            raise
+        return self
+
+    async def _start_driver(self) -> None:
+        self._playwright = await async_playwright().start()
+        self._lock = asyncio.Lock()
+        self._capacity = asyncio.Semaphore(self.size * self.contexts_per_browser)
+
+    async def close(self) -> None:
+        if self._starting is not None and not self._starting.done():
+            await asyncio.gather(self._starting, return_exceptions=True)
+        for slot in self._slots:
+            await self._close_browser(slot)
+        self._slots = []
+        self._starting = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def __aenter__(self) -> 'BrowserPool':
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @staticmethod
+    def _process_tree() -> Set[int]:
+        if not PSUTIL_AVAILABLE:
+            return set()
+        return {proc.pid for proc in psutil.Process().children(recursive=True)}
+
+    async def _launch(self) -> BrowserSlot:
+        # Called under the lock, so the new processes belong to this browser
+        before = self._process_tree()
+        browser = await self._playwright.chromium.launch(headless=self.headless,
+                                                         args=self.launch_args)
+        slot = BrowserSlot(browser, self._process_tree() - before)
+        self._slots.append(slot)
+        self.stats['launches'] += 1
+        return slot
+
+    async def _close_browser(self, slot: BrowserSlot) -> None:
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass  # already gone
+
+    async def _new_page(self, slot: BrowserSlot) -> Any:
+        """A context with the pool's scripts and route, and its one page."""
+        options = self.context_options() if callable(self.context_options) \
+            else dict(self.context_options)
+        context = await slot.browser.new_context(**options)
+        try:
+            for script in self.init_scripts:
+                await context.add_init_script(script)
+            if self.block_resources:
+                await context.route('**/*', self._route)
+            page = await context.new_page()
+            if self.page_setup is not None:
+                await self.page_setup(page)
+        except Exception:
+            await context.close()
+            raise
+        self.stats['contexts'] += 1
+        return page
+
+    async def _route(self, route: Any) -> None:
+        if route.request.resource_type in self.block_resources:
+            self.stats['blocked_requests'] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def _pick_slot(self) -> Optional[BrowserSlot]:
+        """The live browser with spare capacity, preferring idle pages, then fewest leases."""
+        candidates = [slot for slot in self._slots
+                      if not slot.retiring and slot.leased < self.contexts_per_browser]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda slot: (not slot.idle, slot.leased))
+
+    async def acquire(self) -> Any:
+        """Wait for a free page. Pair every call with ``release``."""
+        await self.start()
+        await self._capacity.acquire()
+        slot = None
+        try:
+            async with self._lock:
+                slot = self._pick_slot() or await self._launch()
+                slot.leased += 1
+                page = slot.idle.pop() if slot.idle else None
+            if page is None or page.is_closed():
+                page = await self._new_page(slot)
+        except BaseException:
+            if slot is not None:
+                slot.leased -= 1
+                if not slot.browser.is_connected():
+                    slot.retiring = True
+                await self._retire_if_done(slot)
+            self._capacity.release()
+            raise
+        self._leases[page] = slot
+        return page
+
+    async def release(self, page: Any, discard: bool = False) -> None:
+        """Return a page; ``discard`` drops it and its context instead of reusing them."""
+        slot = self._leases.pop(page)
+        slot.pages_served += 1
+        self.stats['pages_served'] += 1
+        try:
+            keep = not discard and not slot.retiring and not page.is_closed()
+            if keep:
+                # Stops the old document's scripts and timers and frees its DOM
+                await page.goto('about:blank')
+        except Exception:
+            keep = False
+
+        if keep:
+            slot.idle.append(page)
+        else:
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+        slot.leased -= 1
+
+        for retired in self._check_recycle(slot):
+            await self._retire_if_done(retired)
+        await self._retire_if_done(slot)
+        self._capacity.release()
+
+    def _check_recycle(self, slot: BrowserSlot) -> List[BrowserSlot]:
+        """Flag browsers due for recycling; returns the others newly flagged so idle ones get closed."""
+        if not slot.retiring and slot.pages_served >= self.max_pages_per_browser:
+            slot.retiring = True
+            self.stats['recycled_by_pages'] += 1
+
+        flagged = []
+        self._releases += 1
+        if PSUTIL_AVAILABLE and self._releases % self.memory_check_every == 0:
+            for other in self._slots:
+                if not other.retiring and other.memory_mb() > self.max_memory_mb:
+                    other.retiring = True
+                    self.stats['recycled_by_memory'] += 1
+                    if other is not slot:
+                        flagged.append(other)
+        return flagged
+
+    async def _retire_if_done(self, slot: BrowserSlot) -> None:
+        """Close a retiring browser once its last lease is back."""
+        if slot.retiring and slot.leased == 0 and slot in self._slots:
+            self._slots.remove(slot)
+            await self._close_browser(slot)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Any]:
+        """Lease a page for the duration of the block."""
+        page = await self.acquire()
+        discard = False
+        try:
+            yield page
+        except BaseException:
+            discard = True
+            raise
+        finally:
+            await self.release(page, discard=discard)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'browsers': len(self._slots),
+            'leased': sum(slot.leased for slot in self._slots),
+            'memory_mb': {i: round(slot.memory_mb(), 1) for i, slot in enumerate(self._slots)},
+        }
@@ -45,6 +45,42 @@ CRAWLER_CONFIG = {
     "cookies_enabled": False,
 }
 
+# Adaptive per-host rate control (see orchestration/rate_control.py)
+RATE_LIMIT_CONFIG = {
+    "initial_rate": 2.0,           # requests/second per host
+    "min_rate": 0.1,
+    "max_rate": 50.0,
+    "initial_concurrency": 4,
+    "max_concurrency": 32,
+    "additive_increase": 0.5,      # rate gained per second of healthy traffic
+    "backoff_factor": 0.5,         # multiplier on 429/503
+    "error_factor": 0.8,           # multiplier on errors and latency spikes
+    "latency_alpha": 0.2,          # EWMA smoothing for response latency
+    "latency_tolerance": 3.0,      # latency / EWMA ratio treated as a spike
+    "throttle_pause": 5.0,         # pause when 429/503 has no Retry-After
+    "max_retry_after": 120.0,
+}
+
+# Headless browser pool shared by the Playwright-based steps
+BROWSER_POOL_CONFIG = {
+    "browsers": 2,
+    "contexts_per_browser": 4,     # concurrent pages per browser
+    "max_pages_per_browser": 200,  # relaunch a browser after serving this many pages
+    "max_memory_mb": 1536,         # relaunch a browser whose processes exceed this (needs psutil)
+    "memory_check_every": 20,      # page releases between memory checks
+    "block_resources": ["image", "font", "media"],
+    "launch_args": [
+        "--disable-blink-features=AutomationControlled",
+        "--no-sandbox",
+        "--disable-dev-shm-usage",
+    ],
+    "context": {
+        "viewport": {"width": 1920, "height": 1080},
+        "locale": "en-US",
+        "timezone_id": "America/New_York",
+    },
+}
+
 # Database settings
 DATABASE_CONFIG = {
     "host": os.getenv("DB_HOST", "localhost"),
@@ -109,6 +145,13 @@ def get_step_config(step_name: str) -> Dict[str, Any]:
             "input_file": STEPS["01_map"] / "sitemap.txt",
             "output_file": STEPS["02_filter"] / "all_urls.txt",
             "exclude_patterns": ["login", "logout", "admin"],
+            "include_patterns": [],
+            "status_codes": [200],
+            "content_types": ["text/html"],
+            "min_size": None,
+            "max_size": None,
+            "robots_file": None,
+            "canonicalize": True,
         },
         "03_group": {
             "input_file": STEPS["02_filter"] / "all_urls.txt",
@@ -121,9 +164,12 @@ def get_step_config(step_name: str) -> Dict[str, Any]:
         "08_fetch": {
             "output_dir": STEPS["08_fetch"] / "html",
             "batch_dir": STEPS["08_fetch"],
+            "page_store": STEPS["08_fetch"] / "pages",
+            "metadata_file": STEPS["08_fetch"] / "crawl_metadata.ndjson",
         },
         "09_scrape": {
             "input_dir": STEPS["08_fetch"] / "html",
+            "page_store": STEPS["08_fetch"] / "pages",
             "output_file": STEPS["09_scrape"] / "parsed.ndjson",
         },
         "12_load": {
@@ -0,0 +1,292 @@
+"""
+Persistent crawl frontier for the site mappers.
+
+The frontier combines:
+
+* an append-only, disk-backed FIFO queue per priority level, so pushing and
+  popping are O(1) and the pending URLs never have to fit in memory;
+* a compact seen-set: a Bloom filter answers "definitely new" without
+  touching disk, and an exact SQLite index of URL fingerprints settles the
+  Bloom filter's "maybe seen" answers;
+* cheap incremental checkpoints: queue read offsets and counters are
+  written in the same SQLite transaction that commits the new seen-set
+  rows, so the two can never disagree. The Bloom filter is not saved at
+  all; a resumed frontier rebuilds it from the exact index;
+* an optional per-URL results table, committed with the seen-set, so a
+  crawler's fetch records live on disk rather than in a dict.
+
+A crawl that dies between checkpoints resumes from the last checkpoint and
+re-fetches at most the URLs popped since then.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+
+def url_fingerprint(url: str) -> bytes:
+    """128-bit fingerprint used as the exact seen-set key."""
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over URL fingerprints."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, fingerprint: bytes):
+        # Kirsch-Mitzenmacher double hashing from the two fingerprint halves
+        h1 = int.from_bytes(fingerprint[:8], 'little')
+        h2 = int.from_bytes(fingerprint[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, fingerprint: bytes) -> None:
+        for pos in self._positions(fingerprint):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(fingerprint))
+
+
+class FrontierResults(Mapping):
+    """Read-only URL -> result view of a frontier's results table.
+
+    Iterates in URL order straight from the table's primary key, so a
+    sorted dump can be streamed without loading the results.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __getitem__(self, url: str) -> Dict[str, Any]:
+        row = self.db.execute("SELECT record FROM results WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return json.loads(row[0])
+
+    def __iter__(self) -> Iterator[str]:
+        for (url,) in self.db.execute("SELECT url FROM results ORDER BY url"):
+            yield url
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        """Results in URL order, one query for all of them."""
+        for (record,) in self.db.execute("SELECT record FROM results ORDER BY url"):
+            yield json.loads(record)
+
+
+class Frontier:
+    """Disk-backed priority FIFO with a deduplicating seen-set.
+
+    Priority 0 is popped first; within a priority URLs come out in the
+    order they were added.
+    """
+
+    def __init__(self, state_dir: Path, capacity: int = 5_000_000,
+                 error_rate: float = 0.01, priorities: int = 2):
+        """Open (or resume) a frontier.
+
+        Args:
+            state_dir: Directory holding queue files, seen index and state
+            capacity: Expected number of distinct URLs (sizes the Bloom filter)
+            error_rate: Target Bloom filter false-positive rate
+            priorities: Number of priority levels
+        """
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.priorities = priorities
+
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.db = self._connect(self.state_dir)
+
+        state = self._load_state(self.db)
+        if state.get('finished'):
+            # Results of a completed crawl were kept for reading; start over
+            for table in ('seen', 'results', 'state'):
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.commit()
+            state = {}
+
+        self.offsets = state.get('offsets', [0] * priorities)
+        self.pending = state.get('pending', 0)
+        self.seen_count = state.get('seen_count', 0)
+        self.resumed = bool(state)
+
+        if self.resumed:
+            # One sequential scan of the exact index; cheaper over a crawl
+            # than writing the whole bit array at every checkpoint
+            self._rebuild_bloom()
+
+        # Drop anything appended after the last checkpoint so the queue files
+        # agree with the committed seen-set
+        sizes = state.get('sizes', [0] * priorities)
+        for p in range(priorities):
+            with open(self._queue_path(p), 'ab') as f:
+                f.truncate(sizes[p])
+
+        self._writers = [open(self._queue_path(p), 'ab') for p in range(priorities)]
+        self._readers = []
+        for p in range(priorities):
+            reader = open(self._queue_path(p), 'rb')
+            reader.seek(self.offsets[p])
+            self._readers.append(reader)
+
+    @classmethod
+    def exists(cls, state_dir: Path) -> bool:
+        """Whether an unfinished, checkpointed frontier is present in ``state_dir``."""
+        if not (Path(state_dir) / 'frontier.sqlite').exists():
+            return False
+        db = cls._connect(Path(state_dir))
+        try:
+            state = cls._load_state(db)
+        finally:
+            db.close()
+        return bool(state) and not state.get('finished')
+
+    @staticmethod
+    def _connect(state_dir: Path) -> sqlite3.Connection:
+        db = sqlite3.connect(str(state_dir / 'frontier.sqlite'))
+        db.execute("CREATE TABLE IF NOT EXISTS seen (fp BLOB PRIMARY KEY)")
+        db.execute("CREATE TABLE IF NOT EXISTS results (url TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS state (id INTEGER PRIMARY KEY CHECK (id = 0), data TEXT NOT NULL)")
+        db.commit()
+        return db
+
+    @staticmethod
+    def _load_state(db: sqlite3.Connection) -> Dict[str, Any]:
+        row = db.execute("SELECT data FROM state WHERE id = 0").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _commit_state(self, state: Dict[str, Any]) -> None:
+        # Same transaction as the seen and results rows added since the last commit
+        self.db.execute("INSERT OR REPLACE INTO state (id, data) VALUES (0, ?)", (json.dumps(state),))
+        self.db.commit()
+
+    def _queue_path(self, priority: int) -> Path:
+        return self.state_dir / f"queue_{priority}.txt"
+
+    def _rebuild_bloom(self) -> None:
+        for (fp,) in self.db.execute("SELECT fp FROM seen"):
+            self.bloom.add(fp)
+
+    # -- seen-set --------------------------------------------------------
+
+    def seen(self, url: str) -> bool:
+        """Whether ``url`` has been added or marked before."""
+        fp = url_fingerprint(url)
+        if fp not in self.bloom:
+            return False
+        return self.db.execute("SELECT 1 FROM seen WHERE fp = ?", (fp,)).fetchone() is not None
+
+    def mark_seen(self, url: str) -> bool:
+        """Record ``url`` as seen; returns False if it already was."""
+        fp = url_fingerprint(url)
+        if fp in self.bloom:
+            cur = self.db.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (fp,))
+            if cur.rowcount == 0:
+                return False
+        else:
+            self.db.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (fp,))
+        self.bloom.add(fp)
+        self.seen_count += 1
+        return True
+
+    # -- queue -----------------------------------------------------------
+
+    def add(self, url: str, priority: int = 1) -> bool:
+        """Queue ``url`` unless it was seen before; returns True if queued."""
+        if '\n' in url or not self.mark_seen(url):
+            return False
+        priority = min(max(priority, 0), self.priorities - 1)
+        self._writers[priority].write(url.encode('utf-8') + b'\n')
+        self.pending += 1
+        return True
+
+    def pop(self) -> Optional[str]:
+        """Remove and return the next URL, or None when empty."""
+        for priority in range(self.priorities):
+            reader = self._readers[priority]
+            line = reader.readline()
+            if not line:
+                # Make recently appended URLs visible to the reader
+                self._writers[priority].flush()
+                line = reader.readline()
+            if line:
+                self.offsets[priority] = reader.tell()
+                self.pending -= 1
+                return line.rstrip(b'\n').decode('utf-8')
+        return None
+
+    def __len__(self) -> int:
+        return self.pending
+
+    # -- results ---------------------------------------------------------
+
+    def record(self, url: str, result: Dict[str, Any]) -> None:
+        """Store the fetch result for ``url``; committed with the next checkpoint."""
+        self.db.execute("INSERT OR REPLACE INTO results (url, record) VALUES (?, ?)",
+                        (url, json.dumps(result)))
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Stored results in the order they were first recorded."""
+        for (record,) in self.db.execute("SELECT record FROM results ORDER BY rowid"):
+            yield json.loads(record)
+
+    def record_count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def results(self) -> FrontierResults:
+        """URL -> result mapping over the stored results."""
+        return FrontierResults(self.db)
+
+    # -- persistence -----------------------------------------------------
+
+    def checkpoint(self) -> None:
+        """Persist queue offsets, counters, the seen-set and results atomically."""
+        # Queue lines must be on disk before a committed size points past them
+        for writer in self._writers:
+            writer.flush()
+            os.fsync(writer.fileno())
+        self._commit_state({
+            'offsets': self.offsets,
+            'sizes': [writer.tell() for writer in self._writers],
+            'pending': self.pending,
+            'seen_count': self.seen_count,
+        })
+
+    def finish(self) -> None:
+        """Mark the crawl complete and drop the queue.
+
+        Results stay readable through ``results()`` until the frontier is
+        opened again, which starts a fresh crawl.
+        """
+        for handle in self._writers + self._readers:
+            handle.close()
+        self._commit_state({'finished': True})
+        for p in range(self.priorities):
+            self._queue_path(p).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """Checkpoint and release file handles."""
+        self.checkpoint()
+        for handle in self._writers + self._readers:
+            handle.close()
+        self.db.close()
+
+    def destroy(self) -> None:
+        """Close and delete all frontier state."""
+        for handle in self._writers + self._readers:
+            handle.close()
+        self.db.close()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
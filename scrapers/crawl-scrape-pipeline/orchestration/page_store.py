@@ -0,0 +1,267 @@
+"""
+Content-addressed, compressed storage for fetched pages.
+
+Page bodies are keyed by their SHA-256 hash and appended, compressed, to
+large segment files so a crawl produces a handful of files instead of one
+per URL. An SQLite index maps each (url, fetched_at) pair to its content
+hash and each hash to its segment offset. Identical bodies fetched again
+(e.g. on refresh) are stored only once. The index also keeps each URL's
+HTTP cache validators (ETag / Last-Modified) for conditional re-fetches.
+
+Layout::
+
+    <root>/index.sqlite
+    <root>/segment_00000.seg
+    <root>/segment_00001.seg
+    ...
+"""
+import gzip
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# zstd is optional - fall back to gzip when it isn't installed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+from .utils_minimal import format_timestamp
+
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    codec TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fetches (
+    url TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    status INTEGER,
+    PRIMARY KEY (url, fetched_at)
+);
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    cache_control TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+class PageStore:
+    """Append-only, deduplicating page store."""
+
+    def __init__(self, root: Path, segment_size: int = SEGMENT_SIZE,
+                 codec: Optional[str] = None):
+        """Open (or create) a page store.
+
+        Args:
+            root: Directory holding the index and segment files
+            segment_size: Size after which a new segment file is started
+            codec: 'zstd' or 'gzip'; defaults to zstd when available
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.codec = codec or ('zstd' if ZSTD_AVAILABLE else 'gzip')
+        if self.codec == 'zstd' and not ZSTD_AVAILABLE:
+            raise ValueError("zstd codec requested but zstandard is not installed")
+
+        self.db = sqlite3.connect(str(self.root / 'index.sqlite'))
+        self.db.executescript(SCHEMA)
+
+        row = self.db.execute("SELECT MAX(segment) FROM blobs").fetchone()
+        self._segment = row[0] if row[0] is not None else 0
+        self._writer = None
+        self._readers: Dict[int, Any] = {}
+        self._pending = 0
+
+    # -- compression -----------------------------------------------------
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == 'zstd':
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    # -- segments --------------------------------------------------------
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.root / f"segment_{segment:05d}.seg"
+
+    def _open_writer(self):
+        """Return the current segment opened for append, rolling if full."""
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._segment), 'ab')
+
+        if self._writer.tell() >= self.segment_size:
+            self._writer.close()
+            self._segment += 1
+            self._writer = open(self._segment_path(self._segment), 'ab')
+
+        return self._writer
+
+    # -- public API ------------------------------------------------------
+
+    @staticmethod
+    def content_hash(body: bytes) -> str:
+        """Content address for a page body."""
+        return hashlib.sha256(body).hexdigest()
+
+    def put(self, url: str, body: bytes, fetched_at: Optional[str] = None,
+            status: int = 200) -> str:
+        """Store a fetched page and return its content hash."""
+        digest = self.content_hash(body)
+        fetched_at = fetched_at or format_timestamp()
+
+        exists = self.db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if not exists:
+            compressed = self._compress(body)
+            writer = self._open_writer()
+            offset = writer.tell()
+            writer.write(compressed)
+            self.db.execute(
+                "INSERT INTO blobs (hash, segment, offset, length, raw_size, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, self._segment, offset, len(compressed), len(body), self.codec)
+            )
+
+        self.db.execute(
+            "INSERT OR REPLACE INTO fetches (url, fetched_at, hash, status) VALUES (?, ?, ?, ?)",
+            (url, fetched_at, digest, status)
+        )
+
+        self._pending += 1
+        if self._pending >= 500:
+            self.flush()
+
+        return digest
+
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        """Read a body by content hash."""
+        row = self.db.execute(
+            "SELECT segment, offset, length, codec FROM blobs WHERE hash = ?", (digest,)
+        ).fetchone()
+        if not row:
+            return None
+
+        segment, offset, length, codec = row
+        if self._writer is not None and segment == self._segment:
+            self._writer.flush()
+
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self._segment_path(segment), 'rb')
+        reader.seek(offset)
+        return self._decompress(reader.read(length), codec)
+
+    def lookup(self, url: str, fetched_at: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Return (fetched_at, hash) for a URL's latest (or given) fetch."""
+        if fetched_at:
+            row = self.db.execute(
+                "SELECT fetched_at, hash FROM fetches WHERE url = ? AND fetched_at = ?",
+                (url, fetched_at)
+            ).fetchone()
+        else:
+            row = self.db.execute(
+                "SELECT fetched_at, hash FROM fetches WHERE url = ? ORDER BY fetched_at DESC LIMIT 1",
+                (url,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def get(self, url: str, fetched_at: Optional[str] = None) -> Optional[bytes]:
+        """Read the latest (or a specific) fetch of a URL."""
+        found = self.lookup(url, fetched_at)
+        return self.get_blob(found[1]) if found else None
+
+    def iter_latest(self, since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the latest fetch record of every stored URL.
+
+        With ``since``, only URLs whose latest fetch is at or after that
+        timestamp are returned (i.e. pages that changed in a refresh run).
+        """
+        cursor = self.db.execute(
+            """SELECT f.url, f.fetched_at, f.hash, f.status FROM fetches f
+               JOIN (SELECT url, MAX(fetched_at) AS fetched_at FROM fetches GROUP BY url) latest
+               ON f.url = latest.url AND f.fetched_at = latest.fetched_at
+               WHERE f.fetched_at >= ?""",
+            (since or '',)
+        )
+        for url, fetched_at, digest, status in cursor:
+            yield {'url': url, 'fetched_at': fetched_at, 'hash': digest, 'status': status}
+
+    def validators(self, url: str) -> Optional[Dict[str, str]]:
+        """Stored ETag / Last-Modified / Cache-Control for a URL."""
+        row = self.db.execute(
+            "SELECT etag, last_modified, cache_control FROM validators WHERE url = ?", (url,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'etag': row[0] or '', 'last_modified': row[1] or '', 'cache_control': row[2] or ''}
+
+    def set_validators(self, url: str, etag: Optional[str] = None,
+                       last_modified: Optional[str] = None,
+                       cache_control: Optional[str] = None) -> None:
+        """Remember a URL's validators; URLs without any are forgotten."""
+        if not etag and not last_modified:
+            self.db.execute("DELETE FROM validators WHERE url = ?", (url,))
+            return
+        self.db.execute(
+            """INSERT OR REPLACE INTO validators (url, etag, last_modified, cache_control, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (url, etag or '', last_modified or '', cache_control or '', format_timestamp())
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts and sizes for reporting."""
+        fetches, urls = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT url) FROM fetches").fetchone()
+        blobs, stored, raw = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(raw_size), 0) FROM blobs"
+        ).fetchone()
+        return {
+            'fetches': fetches,
+            'urls': urls,
+            'unique_bodies': blobs,
+            'stored_bytes': stored,
+            'raw_bytes': raw,
+            'segments': self._segment + 1,
+        }
+
+    def flush(self) -> None:
+        """Flush pending segment writes and commit the index."""
+        if self._writer is not None:
+            self._writer.flush()
+        self.db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        """Flush and release all file handles."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+        self.db.close()
+
+    def __enter__(self) -> 'PageStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
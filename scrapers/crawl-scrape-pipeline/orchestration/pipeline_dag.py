@@ -0,0 +1,370 @@
+"""
+Dependency-graph scheduling of the pipeline steps.
+
+Each step declares the files it reads and writes, and the graph follows
+from those declarations: a step waits for the steps that produce its
+inputs, and nothing else. With that:
+
+* independent branches run at the same time - ``fetch`` starts as soon
+  as the URL list is filtered, while ``group -> probe -> sample`` checks
+  the templates; ``parse_json`` runs beside ``parse_dom``; ``refresh``
+  beside ``dedupe -> clean -> load -> qc``
+* a step whose script, arguments and input contents match its last
+  successful run, and whose outputs are still there, is skipped. Files
+  are hashed by content; directories (page stores, by-template lists) by
+  their file names, sizes and mtimes, which is all a re-fetch changes
+* ``volatile`` steps (mapping, fetching, QC against the database,
+  refresh) read the live site or database, so they always run; a re-fetch
+  changes the page store, which is what re-runs parse through load
+* a failed step blocks only its descendants; other branches and other
+  domains carry on
+* step output is streamed to the log line by line as it is written
+* ``select_steps(stream=True)`` swaps steps 09-12 for ``STREAM_STEP``,
+  which runs them chained in one process
+
+Steps still run as child processes: each one puts its own directory on
+``sys.path`` and several share module names, so they cannot share an
+interpreter. Several domains can be scheduled on one worker pool; each
+then runs in its own workspace (``data/workspaces/<domain>``), a tree of
+step directories whose scripts are symlinks to the real ones, so the
+domains' fixed-name output files never collide.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .config import BASE_DIR, DATA_DIR, STEPS
+from .utils_minimal import logger
+
+
+CACHE_DIR = DATA_DIR / 'pipeline_cache'
+WORKSPACE_DIR = DATA_DIR / 'workspaces'
+
+# Hand-edited step files; a new workspace starts from the shared copies
+SEEDED_STEPS = ('05_decide', '06_plan')
+
+HASH_CHUNK = 1024 * 1024
+
+# Lines of a failed step's output repeated in the failure message
+TAIL_LINES = 20
+
+
+class StepSpec:
+    """One runnable step: its script, arguments and declared files."""
+
+    __slots__ = ('name', 'step', 'script', 'args', 'inputs', 'outputs', 'volatile', 'code')
+
+    def __init__(self, name: str, step: int, script: str, args: Sequence[str] = (),
+                 inputs: Sequence[str] = (), outputs: Sequence[str] = (),
+                 volatile: bool = False, code: Sequence[str] = ()):
+        self.name = name
+        self.step = step
+        self.script = script
+        self.args = list(args)          # '{domain}' is filled in per run
+        self.inputs = list(inputs)      # paths relative to the pipeline root
+        self.outputs = list(outputs)
+        self.volatile = volatile
+        self.code = list(code)          # step directories the script imports from
+
+    def command(self, domain: str) -> List[str]:
+        return [sys.executable, self.script] + [arg.format(domain=domain) for arg in self.args]
+
+
+# Steps 05 and 06 are manual; their files are plain inputs of the steps that read them
+PIPELINE_STEPS = [
+    StepSpec('map', 1, '01_map/run_map.py', ['{domain}'],
+             outputs=['01_map/dump.csv'], volatile=True),
+    StepSpec('filter', 2, '02_filter/filter_urls.py',
+             inputs=['01_map/dump.csv'],
+             outputs=['02_filter/dump_filtered.txt', '02_filter/dump_filter_stats.json']),
+    StepSpec('group', 3, '03_group/group_urls.py',
+             ['--domain', '{domain}', '--input', '02_filter/dump_filtered.txt'],
+             inputs=['02_filter/dump_filtered.txt'],
+             outputs=['03_group/by_template', '03_group/grouping_summary.json',
+                      '03_group/patterns_to_probe.json']),
+    StepSpec('probe', 4, '04_probe/probe_template.py', ['--domain', '{domain}'],
+             inputs=['03_group/patterns_to_probe.json'],
+             outputs=['04_probe/findings.json']),
+    StepSpec('sample', 7, '07_sample/crawl_sample.py', ['--domain', '{domain}'],
+             inputs=['04_probe/findings.json', '03_group/by_template',
+                     '06_plan/css_selectors.yaml'],
+             outputs=['07_sample/output.ndjson']),
+    StepSpec('fetch', 8, '08_fetch/crawl_full.py',
+             ['--domain', '{domain}', '--input', '02_filter/dump_filtered.txt'],
+             inputs=['02_filter/dump_filtered.txt', '06_plan/api_endpoints.yaml'],
+             outputs=['08_fetch/crawl_metadata.ndjson', '08_fetch/pages'], volatile=True),
+    StepSpec('parse_dom', 9, '09_scrape/parse_dom.py', ['--domain', '{domain}'],
+             inputs=['08_fetch/crawl_metadata.ndjson', '08_fetch/pages',
+                     '06_plan/css_selectors.yaml'],
+             outputs=['09_scrape/parsed.ndjson']),
+    StepSpec('parse_json', 9, '09_scrape/parse_json.py', ['--domain', '{domain}'],
+             inputs=['08_fetch/crawl_metadata.ndjson', '08_fetch/json',
+                     '06_plan/api_endpoints.yaml'],
+             outputs=['09_scrape/parsed_json.ndjson']),
+    StepSpec('dedupe', 10, '10_dedupe/dedupe.py', ['--domain', '{domain}'],
+             inputs=['09_scrape/parsed.ndjson'],
+             outputs=['10_dedupe/deduped.ndjson']),
+    StepSpec('clean', 11, '11_clean/clean.py', ['--domain', '{domain}'],
+             inputs=['10_dedupe/deduped.ndjson'],
+             outputs=['11_clean/clean.csv']),
+    StepSpec('load', 12, '12_load/load_db.py', ['--domain', '{domain}'],
+             inputs=['11_clean/clean.csv'],
+             outputs=['12_load/load_stats.json']),
+    StepSpec('qc', 13, '13_qc/tests.py', ['--domain', '{domain}'],
+             inputs=['11_clean/clean.csv', '12_load/load_stats.json'],
+             outputs=['13_qc/qc_report.json'], volatile=True),
+    StepSpec('refresh', 14, '14_refresh/incremental_crawl.py', ['--domain', '{domain}'],
+             inputs=['03_group/grouping_summary.json', '08_fetch/crawl_metadata.ndjson',
+                     '08_fetch/pages'],
+             volatile=True),
+]
+
+
+# Steps 09-12 as one streaming process (orchestration/stream_pipeline.py); the
+# checkpoints keep the files QC and the cache look at
+STREAM_STEP = StepSpec('stream', 9, 'orchestration/stream_pipeline.py',
+                       ['--domain', '{domain}', '--checkpoint'],
+                       inputs=['08_fetch/crawl_metadata.ndjson', '08_fetch/pages',
+                               '06_plan/css_selectors.yaml'],
+                       outputs=['09_scrape/parsed.ndjson', '10_dedupe/deduped.ndjson',
+                                '11_clean/clean.csv', '12_load/load_stats.json'],
+                       code=['09_scrape', '10_dedupe', '11_clean', '12_load'])
+STREAMED_STEPS = ('parse_dom', 'dedupe', 'clean', 'load')
+
+
+def fingerprint(path: Path) -> str:
+    """Content hash of a file; name/size/mtime hash of a directory tree."""
+    if not path.exists():
+        return 'missing'
+    digest = hashlib.sha256()
+    if path.is_dir():
+        for item in sorted(path.rglob('*')):
+            if item.is_file():
+                stat = item.stat()
+                digest.update(f'{item.relative_to(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'
+                              .encode('utf-8'))
+    else:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def step_key(spec: StepSpec, root: Path, domain: str) -> str:
+    """Cache key of a step: its code, its command line and its inputs' contents."""
+    script = root / spec.script
+    parts = [str(root), ' '.join(spec.command(domain)[1:])]
+    # Helpers beside the script (filter_rules.py, selector_plan.py, ...) count as its code
+    code_dirs = [script.resolve().parent] + [(root / name).resolve() for name in spec.code]
+    for code_dir in code_dirs:
+        for source in sorted(code_dir.glob('*.py')):
+            parts.append(f'{code_dir.name}/{source.name}:{fingerprint(source)}')
+    for name in spec.inputs:
+        parts.append(f'{name}:{fingerprint(root / name)}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class StepCache:
+    """Keys of each step's last successful run, one JSON file per domain."""
+
+    def __init__(self, domain: str, cache_dir: Path = CACHE_DIR):
+        self.path = Path(cache_dir) / f'{domain}.json'
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def hit(self, name: str, key: str) -> bool:
+        return self.entries.get(name, {}).get('key') == key
+
+    def store(self, name: str, key: str, duration: float) -> None:
+        self.entries[name] = {'key': key, 'duration': round(duration, 1),
+                              'finished': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.save()
+
+    def forget(self, name: str) -> None:
+        if self.entries.pop(name, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def prepare_workspace(domain: str, base_dir: Path = BASE_DIR,
+                      workspace_dir: Path = WORKSPACE_DIR) -> Path:
+    """A per-domain pipeline tree whose scripts are symlinks into ``base_dir``.
+
+    Scripts find their data through ``Path(__file__).parent``, which stays
+    the workspace path, while Python resolves the symlink for ``sys.path``,
+    so sibling imports still come from the real step directory.
+    """
+    root = Path(workspace_dir) / domain
+    root.mkdir(parents=True, exist_ok=True)
+
+    orchestration = root / 'orchestration'
+    if not orchestration.exists():
+        orchestration.symlink_to(base_dir / 'orchestration', target_is_directory=True)
+
+    for step_name in STEPS:
+        source_dir = base_dir / step_name
+        if not source_dir.is_dir():
+            continue
+        step_dir = root / step_name
+        step_dir.mkdir(exist_ok=True)
+        for source in source_dir.iterdir():
+            target = step_dir / source.name
+            if target.exists() or target.is_symlink() or not source.is_file():
+                continue
+            if source.suffix == '.py':
+                target.symlink_to(source)
+            elif step_name in SEEDED_STEPS:
+                shutil.copy2(source, target)
+    return root
+
+
+class DomainRun:
+    """One domain's steps and their outcomes."""
+
+    def __init__(self, domain: str, root: Path, specs: Sequence[StepSpec], force: bool = False):
+        self.domain = domain
+        self.root = root
+        self.specs = {spec.name: spec for spec in specs}
+        self.cache = StepCache(domain)
+        self.force = force
+        self.status: Dict[str, str] = {}
+        self.durations: Dict[str, float] = {}
+
+        producers = {output: spec.name for spec in specs for output in spec.outputs}
+        self.deps = {spec.name: sorted({producers[name] for name in spec.inputs
+                                        if name in producers and producers[name] != spec.name})
+                     for spec in specs}
+
+    def missing_prerequisites(self, spec: StepSpec) -> List[str]:
+        """Inputs made by a step outside this run that are not on disk."""
+        all_outputs = {output: other for other in PIPELINE_STEPS for output in other.outputs}
+        missing = []
+        for name in spec.inputs:
+            producer = all_outputs.get(name)
+            if producer is not None and producer.name not in self.specs \
+                    and not (self.root / name).exists():
+                missing.append(f"{name} from step {producer.step} ({producer.name})")
+        return missing
+
+
+class DagRunner:
+    """Runs the step graphs of one or more domains on a shared pool of workers."""
+
+    def __init__(self, runs: Sequence[DomainRun], workers: int = 4):
+        self.runs = list(runs)
+        self.workers = workers
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+
+    async def run(self) -> bool:
+        self._slots = asyncio.Semaphore(self.workers)
+        for run in self.runs:
+            for name in run.specs:
+                self._tasks[(run.domain, name)] = asyncio.ensure_future(self._run_step(run, name))
+        await asyncio.gather(*self._tasks.values())
+        return all(status in ('done', 'cached')
+                   for run in self.runs for status in run.status.values())
+
+    async def _run_step(self, run: DomainRun, name: str) -> str:
+        outcomes = [await self._tasks[(run.domain, dep)] for dep in run.deps[name]]
+        label = f'{run.domain}:{name}'
+        if any(outcome not in ('done', 'cached') for outcome in outcomes):
+            logger.warning(f"[{label}] skipped - an upstream step failed")
+            run.status[name] = 'blocked'
+            return 'blocked'
+
+        spec = run.specs[name]
+        missing = run.missing_prerequisites(spec)
+        if missing:
+            for item in missing:
+                logger.error(f"[{label}] missing {item}. Run that step first.")
+            run.status[name] = 'failed'
+            return 'failed'
+
+        async with self._slots:
+            # Hashing large inputs must not stall the other steps' log streams
+            key = await asyncio.to_thread(step_key, spec, run.root, run.domain)
+            outputs_present = all((run.root / output).exists() for output in spec.outputs)
+            if not run.force and not spec.volatile and outputs_present and run.cache.hit(name, key):
+                logger.info(f"[{label}] unchanged inputs - skipped")
+                run.status[name] = 'cached'
+                return 'cached'
+
+            run.cache.forget(name)
+            started = time.time()
+            ok = await self._execute(spec, run, label)
+            run.durations[name] = time.time() - started
+
+        if not ok:
+            run.status[name] = 'failed'
+            return 'failed'
+        if not spec.volatile:
+            # Re-key: a step may have written files it also reads
+            run.cache.store(name, await asyncio.to_thread(step_key, spec, run.root, run.domain),
+                            run.durations[name])
+        run.status[name] = 'done'
+        return 'done'
+
+    async def _execute(self, spec: StepSpec, run: DomainRun, label: str) -> bool:
+        command = spec.command(run.domain)
+        started = time.time()
+        logger.info(f"[{label}] Executing: {' '.join(command)}")
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        process = await asyncio.create_subprocess_exec(
+            *command, cwd=str(run.root), env=env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+
+        tail: deque = deque(maxlen=TAIL_LINES)
+        try:
+            async for raw in process.stdout:
+                line = raw.decode('utf-8', errors='replace').rstrip()
+                tail.append(line)
+                logger.info(f"[{label}] {line}")
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            raise
+
+        if returncode != 0:
+            logger.error(f"[{label}] failed with exit code {returncode}")
+            if tail:
+                logger.error(f"[{label}] last output:\n" + '\n'.join(tail))
+            return False
+        logger.info(f"[{label}] completed in {time.time() - started:.1f}s")
+        return True
+
+    def summary(self) -> Dict[str, Dict[str, str]]:
+        return {run.domain: {name: run.status.get(name, 'pending') for name in run.specs}
+                for run in self.runs}
+
+
+def select_steps(start_step: int = 1, end_step: int = 14,
+                 names: Optional[Iterable[str]] = None, stream: bool = False) -> List[StepSpec]:
+    """Steps in the ``start_step``-``end_step`` range, optionally limited to ``names``.
+
+    With ``stream``, a range covering steps 09-12 runs them as ``STREAM_STEP``.
+    """
+    wanted = set(names) if names else None
+    specs = [spec for spec in PIPELINE_STEPS
+             if start_step <= spec.step <= end_step and (wanted is None or spec.name in wanted)]
+    if stream and start_step <= 9 and end_step >= 12:
+        specs = [spec for spec in specs if spec.name not in STREAMED_STEPS]
+        specs.append(STREAM_STEP)
+    return specs
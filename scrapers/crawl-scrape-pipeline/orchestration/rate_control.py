@@ -0,0 +1,189 @@
+"""
+Per-host adaptive rate control shared by the crawlers.
+
+Each host gets a token bucket whose refill rate and concurrency limit follow
+an AIMD (additive-increase, multiplicative-decrease) policy: healthy, fast
+responses slowly raise the rate, while 429/503 responses, ``Retry-After``
+headers and latency spikes cut it back. Crawlers ask the controller for
+permission before each request and report the outcome afterwards.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import urlparse
+
+from .config import RATE_LIMIT_CONFIG
+
+
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HostRateLimiter:
+    """AIMD token bucket for a single host."""
+
+    def __init__(self, host: str, settings: Dict[str, Any]):
+        self.host = host
+        self.settings = settings
+        self.rate = settings['initial_rate']
+        self.concurrency = settings['initial_concurrency']
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.ewma_latency: Optional[float] = None
+        self.healthy_streak = 0
+        self.counts = {'requests': 0, 'throttled': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1.0
+
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self) -> None:
+        """Block the calling thread until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait for a concurrency slot and a token without blocking the loop."""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def release_async(self) -> None:
+        """Give back a concurrency slot taken by acquire_async."""
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, status: int, latency: Optional[float] = None,
+               retry_after: Optional[float] = None) -> None:
+        """Adjust rate and concurrency based on a response outcome."""
+        s = self.settings
+        with self._lock:
+            self.counts['requests'] += 1
+
+            if latency is not None:
+                if self.ewma_latency is None:
+                    self.ewma_latency = latency
+                else:
+                    self.ewma_latency += s['latency_alpha'] * (latency - self.ewma_latency)
+
+            if status in THROTTLE_STATUSES:
+                self.counts['throttled'] += 1
+                self._decrease(s['backoff_factor'])
+                pause = retry_after if retry_after is not None else s['throttle_pause']
+                self.blocked_until = max(self.blocked_until,
+                                         time.monotonic() + min(pause, s['max_retry_after']))
+            elif status == 0 or status >= 500:
+                self.counts['errors'] += 1
+                self._decrease(s['error_factor'])
+            elif (latency is not None and self.ewma_latency is not None
+                  and latency > self.ewma_latency * s['latency_tolerance']):
+                # Server is slowing down: ease off before it starts refusing
+                self._decrease(s['error_factor'])
+            else:
+                self.healthy_streak += 1
+                self.rate = min(s['max_rate'], self.rate + s['additive_increase'] / max(self.rate, 1.0))
+                if self.healthy_streak >= self.concurrency * 2:
+                    self.concurrency = min(s['max_concurrency'], self.concurrency + 1)
+                    self.healthy_streak = 0
+
+    def _decrease(self, factor: float) -> None:
+        """Multiplicatively reduce rate and concurrency."""
+        s = self.settings
+        self.rate = max(s['min_rate'], self.rate * factor)
+        self.concurrency = max(1, int(self.concurrency * factor))
+        self.healthy_streak = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state of this limiter for metrics output."""
+        return {
+            'rate': round(self.rate, 3),
+            'concurrency': self.concurrency,
+            'in_flight': self.in_flight,
+            'ewma_latency': round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            'blocked_for': round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            **self.counts,
+        }
+
+
+class RateController:
+    """Registry of per-host limiters shared across crawler workers."""
+
+    def __init__(self, **overrides: Any):
+        self.settings = {**RATE_LIMIT_CONFIG, **overrides}
+        self.hosts: Dict[str, HostRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> HostRateLimiter:
+        """Return (creating if needed) the limiter for a URL's host."""
+        host = urlparse(url).netloc.lower()
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self.hosts.setdefault(host, HostRateLimiter(host, self.settings))
+        return limiter
+
+    def acquire(self, url: str) -> None:
+        """Block until a request to ``url`` is allowed."""
+        self.for_url(url).acquire()
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Async context manager holding a request slot for ``url``."""
+        limiter = self.for_url(url)
+        await limiter.acquire_async()
+        try:
+            yield limiter
+        finally:
+            await limiter.release_async()
+
+    def record(self, url: str, status: int, latency: Optional[float] = None,
+               headers: Optional[Mapping[str, str]] = None) -> None:
+        """Report the outcome of a request to ``url``."""
+        retry_after = None
+        if headers is not None:
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+        self.for_url(url).record(status, latency, retry_after)
+
+    def current_rate(self, url: str) -> float:
+        """Current requests/second allowed for ``url``'s host."""
+        return self.for_url(url).rate
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host rate, concurrency and outcome counters."""
+        return {host: limiter.snapshot() for host, limiter in self.hosts.items()}
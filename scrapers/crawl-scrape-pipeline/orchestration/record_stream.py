@@ -0,0 +1,197 @@
+"""
+Bounded-memory record streams for the pipeline's file hand-offs.
+
+Readers yield records (or lists of records) from NDJSON or CSV files, which
+may be compressed (.gz, .bz2, .xz, or .zst when zstandard is installed).
+A plain JSON array has no record boundaries to stream on, so ``.json``
+input is still read whole and only chunked afterwards.
+Nothing is read ahead of the consumer except through ``prefetch``, whose
+queue is bounded, so a slow writer holds the reader back and memory stays
+at a few chunks however large the input is. ``pipe`` uses the same queue
+to run a record generator on its own thread, which is how in-process
+stages are chained without writing the records in between; ``tee_records``
+writes a copy of a stream to a file as it passes.
+"""
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+# zstd is optional - .zst inputs need zstandard installed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+T = TypeVar('T')
+
+COMPRESSED_SUFFIXES = {'.gz', '.bz2', '.xz', '.zst'}
+
+
+def record_format(path: Path) -> str:
+    """'ndjson', 'csv' or 'json', looking through a compression suffix."""
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes and suffixes[-1] in COMPRESSED_SUFFIXES:
+        suffixes = suffixes[:-1]
+    if suffixes and suffixes[-1] in ('.csv', '.json'):
+        return suffixes[-1][1:]
+    return 'ndjson'
+
+
+def open_text(path: Path) -> io.TextIOBase:
+    """Open a possibly compressed file for streaming text reads."""
+    suffix = path.suffix.lower()
+    if suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if suffix == '.bz2':
+        return bz2.open(path, 'rt', encoding='utf-8', newline='')
+    if suffix == '.xz':
+        return lzma.open(path, 'rt', encoding='utf-8', newline='')
+    if suffix == '.zst':
+        if not ZSTD_AVAILABLE:
+            raise ValueError(f"{path} is zstd-compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _csv_chunks(path: Path, size: int,
+                dtypes: Optional[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    import pandas as pd
+
+    # A chunked read_csv infers dtypes per chunk, so an untyped column could
+    # be int in one chunk and str in the next; columns not typed explicitly
+    # are read as text instead
+    with open_text(path) as f:
+        header = next(csv.reader(f), [])
+    dtype = {column: str for column in header}
+    dtype.update({k: v for k, v in (dtypes or {}).items() if k in dtype})
+
+    with open_text(path) as f:
+        for df in pd.read_csv(f, chunksize=size, dtype=dtype):
+            df = df.astype(object).where(df.notna(), None)
+            yield df.to_dict('records')
+
+
+def iter_record_chunks(path: Path, size: int,
+                       dtypes: Optional[Dict[str, Any]] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of up to ``size`` records from ``path``.
+
+    CSV cells are strings unless ``dtypes`` maps their column to a type;
+    missing cells come through as None.
+    """
+    fmt = record_format(path)
+    if fmt == 'csv':
+        return _csv_chunks(path, size, dtypes)
+    if fmt == 'json':
+        with open_text(path) as f:
+            return chunked(json.load(f), size)
+    return chunked(_ndjson_records(path), size)
+
+
+def iter_records(path: Path, size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Yield one record at a time, reading ``size`` at a time."""
+    for chunk in iter_record_chunks(path, size):
+        yield from chunk
+
+
+def _ndjson_records(path: Path) -> Iterator[Dict[str, Any]]:
+    with open_text(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group an iterable into lists of at most ``size`` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_DONE = object()
+
+
+def prefetch(items: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """Produce items on a background thread, at most ``depth`` ahead.
+
+    Lets parsing the next chunk overlap with writing the current one while
+    the bounded queue keeps the reader from running away from the writer.
+    """
+    q: 'queue.Queue' = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    error: List[BaseException] = []
+
+    def produce():
+        try:
+            for item in items:
+                while not stop.is_set():
+                    try:
+                        q.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            error.append(e)
+        finally:
+            while not stop.is_set():
+                try:
+                    q.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            yield item
+        if error:
+            raise error[0]
+    finally:
+        stop.set()
+        thread.join()
+
+
+def pipe(records: Iterable[T], depth: int = 4, chunk_size: int = 100) -> Iterator[T]:
+    """Run a record stream on its own thread, handing over ``chunk_size`` at a time.
+
+    At most ``depth`` chunks wait between the two sides, so a slow consumer
+    stalls the producer instead of letting records pile up.
+    """
+    for chunk in prefetch(chunked(records, chunk_size), depth):
+        yield from chunk
+
+
+def tee_records(records: Iterable[Dict[str, Any]], path: Path,
+                fieldnames: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Pass records through while writing them to ``path`` (NDJSON, or CSV with ``fieldnames``)."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if record_format(path) == 'csv':
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames), extrasaction='ignore')
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                yield record
+        else:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                yield record
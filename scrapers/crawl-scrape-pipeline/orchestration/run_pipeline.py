@@ -5,8 +5,8 @@ Runs all or specific steps of the 14-step pipeline.
 """
 
 import argparse
+import asyncio
 import logging
-import subprocess
 import sys
 from pathlib import Path
 from typing import List, Optional
@@ -16,30 +16,13 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from orchestration.config import STEPS, LOGGING_CONFIG, get_step_config
 from orchestration.utils_minimal import logger
+from orchestration.pipeline_dag import DagRunner, DomainRun, prepare_workspace, select_steps
 
 def setup_logging():
     """Set up logging configuration."""
     import logging.config
     logging.config.dictConfig(LOGGING_CONFIG)
 
-# Map of step numbers to their execution scripts
-STEP_SCRIPTS = {
-    1: "01_map/run_map.py",
-    2: "02_filter/filter_urls.py",
-    3: "03_group/group_urls.py",
-    4: "04_probe/probe_template.py",
-    5: None,  # Manual step - decision.md
-    6: None,  # Manual step - css_selectors.json
-    7: "07_sample/crawl_sample.py",
-    8: "08_fetch/crawl_full.py",
-    9: "09_scrape/parse_dom.py",
-    10: "10_dedupe/dedupe.py",
-    11: "11_clean/clean.py",
-    12: "12_load/load_db.py",
-    13: "13_qc/tests.py",
-    14: "14_refresh/incremental_crawl.py"
-}
-
 # Step names for display
 STEP_NAMES = {
     1: "Map - URL Discovery",
@@ -60,13 +43,23 @@ STEP_NAMES = {
 
 
 class PipelineRunner:
-    """Orchestrates the execution of pipeline steps."""
+    """Orchestrates the execution of pipeline steps for one or more domains."""
     
-    def __init__(self, domain: str, start_step: int = 1, end_step: int = 14):
-        """Initialize pipeline runner."""
-        self.domain = domain
+    def __init__(self, domains, start_step: int = 1, end_step: int = 14,
+                 workers: int = 4, force: bool = False, workspace: Optional[bool] = None,
+                 stream: bool = False):
+        """Initialize pipeline runner.
+        
+        Several domains always run in their own workspaces, since the steps
+        write fixed-name files; ``workspace=True`` isolates a single domain too.
+        """
+        self.domains = [domains] if isinstance(domains, str) else list(dict.fromkeys(domains))
         self.start_step = start_step
         self.end_step = end_step
+        self.workers = workers
+        self.force = force
+        self.workspace = len(self.domains) > 1 if workspace is None else workspace
+        self.stream = stream
         self.base_dir = Path(__file__).parent.parent
         setup_logging()
         
@@ -80,116 +73,43 @@ class PipelineRunner:
             return False
         return True
         
-    def check_prerequisites(self, step: int) -> bool:
-        """Check if prerequisites for a step are met."""
-        # Check if previous step output exists
-        if step > 1:
-            if step == 2:
-                # Check for dump.csv from step 1
-                dump_file = self.base_dir / "01_map" / "dump.csv"
-                if not dump_file.exists():
-                    logger.error(f"Missing dump.csv from step 1. Run step 1 first.")
-                    return False
-            elif step == 3:
-                # Check for all_urls.txt from step 2
-                urls_file = self.base_dir / "02_filter" / "all_urls.txt"
-                if not urls_file.exists():
-                    logger.error(f"Missing all_urls.txt from step 2. Run step 2 first.")
-                    return False
-            # Add more prerequisite checks as needed
-        return True
-        
-    def run_step(self, step: int) -> bool:
-        """Run a single pipeline step."""
-        step_name = STEP_NAMES.get(step, f"Step {step}")
-        logger.info(f"\n{'='*60}")
-        logger.info(f"Running Step {step}: {step_name}")
-        logger.info(f"{'='*60}")
-        
-        # Check prerequisites
-        if not self.check_prerequisites(step):
-            return False
-            
-        # Get script path
-        script_path = STEP_SCRIPTS.get(step)
-        
-        # Handle manual steps
-        if script_path is None:
-            if step == 5:
-                logger.info("Step 5 is manual. Please edit 05_decide/decision.md")
-                logger.info("Define which URL patterns to scrape and in what order.")
-                return True
-            elif step == 6:
-                logger.info("Step 6 is manual. Please edit 06_plan/css_selectors.json")
-                logger.info("Define CSS/XPath selectors for data extraction.")
-                return True
-            else:
-                logger.error(f"No script defined for step {step}")
-                return False
-                
-        # Run the script
-        full_script_path = self.base_dir / script_path
-        
-        if not full_script_path.exists():
-            logger.error(f"Script not found: {full_script_path}")
-            return False
-            
-        try:
-            # Build command
-            cmd = [sys.executable, str(full_script_path)]
-            
-            # Add domain argument for steps that need it
-            if step in [1, 3, 7, 8, 14]:
-                if step == 3:
-                    cmd.extend(['--domain', self.domain])
-                else:
-                    cmd.append(self.domain)
-                
-            logger.info(f"Executing: {' '.join(cmd)}")
-            
-            # Run the script
-            result = subprocess.run(
-                cmd,
-                cwd=str(self.base_dir),
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"Step {step} failed with exit code {result.returncode}")
-                if result.stderr:
-                    logger.error(f"Error output:\n{result.stderr}")
-                return False
-                
-            # Log output
-            if result.stdout:
-                logger.info(f"Output:\n{result.stdout}")
-                
-            logger.info(f"Step {step} completed successfully")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error running step {step}: {e}")
-            return False
+    def log_manual_steps(self) -> None:
+        """Remind about the manual steps inside the range; their files are read as inputs."""
+        if self.start_step <= 5 <= self.end_step:
+            logger.info("Step 5 is manual. Please edit 05_decide/decision.md")
+            logger.info("Define which URL patterns to scrape and in what order.")
+        if self.start_step <= 6 <= self.end_step:
+            logger.info("Step 6 is manual. Please edit 06_plan/css_selectors.yaml")
+            logger.info("Define CSS/XPath selectors for data extraction.")
             
     def run(self) -> bool:
         """Run the pipeline for specified step range."""
         if not self.validate_steps():
             return False
             
-        logger.info(f"\nStarting pipeline for domain: {self.domain}")
-        logger.info(f"Running steps {self.start_step} to {self.end_step}")
+        specs = select_steps(self.start_step, self.end_step, stream=self.stream)
+        logger.info(f"\nStarting pipeline for: {', '.join(self.domains)}")
+        logger.info(f"Running steps {self.start_step} to {self.end_step} "
+                    f"({', '.join(spec.name for spec in specs)}) on {self.workers} workers")
+        self.log_manual_steps()
+        
+        runs = []
+        for domain in self.domains:
+            root = prepare_workspace(domain, self.base_dir) if self.workspace else self.base_dir
+            runs.append(DomainRun(domain, root, specs, force=self.force))
+            
+        dag = DagRunner(runs, workers=self.workers)
+        success = asyncio.run(dag.run())
         
-        # Run each step in sequence
-        for step in range(self.start_step, self.end_step + 1):
-            if not self.run_step(step):
-                logger.error(f"Pipeline failed at step {step}")
-                return False
-                
         logger.info(f"\n{'='*60}")
-        logger.info("Pipeline completed successfully!")
+        for domain, statuses in dag.summary().items():
+            logger.info(f"{domain}: " + ', '.join(f"{name}={status}" for name, status in statuses.items()))
+        if success:
+            logger.info("Pipeline completed successfully!")
+        else:
+            logger.error("Pipeline finished with failed steps")
         logger.info(f"{'='*60}")
-        return True
+        return success
 
 
 def main():
@@ -198,6 +118,10 @@ def main():
         description='Run the crawl-scrape pipeline',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
+Steps run as a dependency graph: independent steps run concurrently and
+steps whose script, arguments and inputs are unchanged since their last
+successful run are skipped.
+
 Steps:
   1. Map - URL Discovery
   2. Filter - URL Selection  
@@ -226,22 +150,52 @@ Examples:
   
   # Run steps 7-12
   python run_pipeline.py example.com --start 7 --end 12
+  
+  # Re-run everything, ignoring the step cache
+  python run_pipeline.py example.com --force
+  
+  # Nightly refresh of many sites on one pool of 8 workers
+  python run_pipeline.py --domains-file retailers.txt --workers 8
+  
+  # Parse, dedupe, clean and load concurrently instead of file by file
+  python run_pipeline.py example.com --start 9 --end 13 --stream
         """
     )
     
-    parser.add_argument('domain', help='Domain to process (e.g., example.com)')
+    parser.add_argument('domains', nargs='*', metavar='domain',
+                       help='Domain(s) to process (e.g., example.com)')
+    parser.add_argument('--domains-file', type=Path,
+                       help='File with one domain per line, run alongside any given above')
     parser.add_argument('--start', type=int, default=1, 
                        help='Starting step number (default: 1)')
     parser.add_argument('--end', type=int, default=14,
                        help='Ending step number (default: 14)')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Steps run at once, across all domains (default: 4)')
+    parser.add_argument('--force', action='store_true',
+                       help='Run every step even if its inputs are unchanged')
+    parser.add_argument('--workspace', action='store_true',
+                       help='Run a single domain in data/workspaces/<domain> too')
+    parser.add_argument('--stream', action='store_true',
+                       help='Run steps 9-12 as one streaming process (orchestration/stream_pipeline.py)')
     
     args = parser.parse_args()
     
-    # Clean domain
-    domain = args.domain.replace('https://', '').replace('http://', '').rstrip('/')
+    domains = list(args.domains)
+    if args.domains_file:
+        with open(args.domains_file, 'r', encoding='utf-8') as f:
+            domains.extend(line.strip() for line in f
+                           if line.strip() and not line.startswith('#'))
+    if not domains:
+        parser.error('give at least one domain or --domains-file')
+    
+    # Clean domains
+    domains = [d.replace('https://', '').replace('http://', '').rstrip('/') for d in domains]
     
     # Create and run pipeline
-    runner = PipelineRunner(domain, args.start, args.end)
+    runner = PipelineRunner(domains, args.start, args.end, workers=args.workers,
+                            force=args.force, workspace=args.workspace or None,
+                            stream=args.stream)
     success = runner.run()
     
     sys.exit(0 if success else 1)
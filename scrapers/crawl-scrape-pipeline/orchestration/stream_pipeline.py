@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Steps 09-12 chained in one process: parse -> dedupe -> clean -> load.
+
+Run one after another, each of these steps writes a whole file that the
+next reads back, so a refresh takes the sum of the four step times. Here
+records flow from stage to stage instead:
+
+* parsing runs on its own thread (feeding its process pool), dedupe and
+  clean on a second, and loading on the main thread
+* stages hand records over in small chunks through bounded queues
+  (``record_stream.pipe``); when the database falls behind, the queues
+  fill and parsing waits, so memory stays at a few chunks
+* the loader commits a batch as soon as ``batch_size`` clean records are
+  ready, while parsing carries on behind it
+
+The total time comes close to that of the slowest stage. Files between
+the stages are optional checkpoints (``--checkpoint``), written as the
+records pass by; they do not hold the next stage back.
+
+Dedupe is single-pass here (``Deduplicator.iter_unique``): a record has
+already been handed on by the time a duplicate shows up, so the first
+record per key wins unless the better duplicate has the same URL.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+BASE_DIR = Path(__file__).parent.parent
+
+# Step modules import their helpers as top-level modules
+sys.path.append(str(BASE_DIR / 'orchestration'))
+sys.path.append(str(BASE_DIR))
+for step_dir in ('09_scrape', '10_dedupe', '11_clean', '12_load'):
+    sys.path.append(str(BASE_DIR / step_dir))
+
+from orchestration.record_stream import chunked, pipe, prefetch, tee_records
+from orchestration.utils_minimal import logger
+from parse_dom import DOMParser
+from dedupe import Deduplicator
+from clean import DataCleaner
+from columnar import CLEAN_COLUMNS
+from load_db import DatabaseLoader
+
+
+STATS_FILE = BASE_DIR / '12_load' / 'stream_stats.json'
+
+
+def run(domain: str, since: Optional[str] = None, workers: int = 4, strategy: str = 'auto',
+        batch_size: int = 500, update_existing: bool = True, bulk: bool = False,
+        checkpoint: bool = False, depth: int = 4, chunk_size: int = 100) -> Dict[str, Any]:
+    """Parse the page store and load the result, with every stage running at once."""
+    store_dir = BASE_DIR / '08_fetch' / 'pages'
+    if not (store_dir / 'index.sqlite').exists():
+        logger.error(f"No page store at {store_dir}. Run fetch step first.")
+        return {}
+
+    parser = DOMParser(domain)
+    deduplicator = Deduplicator(domain)
+    cleaner = DataCleaner(domain)
+    loader = DatabaseLoader(domain)
+
+    stats: Dict[str, Any] = {
+        'domain': domain,
+        'parse': {'total_files': 0, 'successful': 0},
+        'dedupe': {'strategy': strategy},
+        'clean': {'cleaned': 0, 'dropped': 0, 'validation_errors': {}, 'validation_warnings': {}},
+    }
+    started = time.time()
+
+    records = parser.iter_successful(
+        parser.iter_page_store(store_dir, since=since, max_workers=workers), stats['parse'])
+    if checkpoint:
+        records = tee_records(records, parser.output_file)
+    records = pipe(records, depth, chunk_size)
+
+    records = deduplicator.iter_unique(records, strategy, stats['dedupe'])
+    if checkpoint:
+        records = tee_records(records, deduplicator.output_file)
+    records = cleaner.iter_cleaned(records, stats['clean'])
+    if checkpoint:
+        # clean.csv is what the loader and QC read when run on their own
+        records = tee_records(records, cleaner.output_csv, fieldnames=CLEAN_COLUMNS)
+
+    batches = prefetch(chunked(records, batch_size), depth)
+    try:
+        stats['load'] = loader.load_batches(batches, update_existing=update_existing, bulk=bulk)
+    finally:
+        # Stops the upstream threads if loading gave up early
+        batches.close()
+
+    parser.save_selector_stats()
+    stats['elapsed'] = round(time.time() - started, 1)
+    stats['checkpoint'] = checkpoint
+    with open(STATS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2, default=str)
+    return stats if stats['load'] else {}
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Parse, dedupe, clean and load in one streaming pass',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Stream the page store into the database
+  python orchestration/stream_pipeline.py --domain example.com --bulk
+
+  # Only pages fetched by tonight's refresh, keeping the usual step files
+  python orchestration/stream_pipeline.py --domain example.com --since 2025-06-15T03:00:00 --checkpoint
+        """
+    )
+
+    parser.add_argument('--domain', required=True, help='Domain being processed')
+    parser.add_argument('--since',
+                       help='Only parse pages fetched at or after this ISO timestamp')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Number of parser processes (1 parses in-process)')
+    parser.add_argument('--strategy', choices=['auto', 'url', 'content', 'id'],
+                       default='auto', help='Deduplication strategy')
+    parser.add_argument('--batch-size', type=int, default=500,
+                       help='Records per database transaction (default: 500)')
+    parser.add_argument('--no-update', action='store_true',
+                       help='Skip updating existing products')
+    parser.add_argument('--bulk', action='store_true',
+                       help='COPY batches into a staging table and upsert them set-based')
+    parser.add_argument('--checkpoint', action='store_true',
+                       help='Also write parsed.ndjson, deduped.ndjson and clean.csv as records pass')
+    parser.add_argument('--buffer', type=int, default=4,
+                       help='Chunks each queue between stages may hold (default: 4)')
+
+    args = parser.parse_args()
+
+    stats = run(args.domain, since=args.since, workers=args.workers, strategy=args.strategy,
+                batch_size=args.batch_size, update_existing=not args.no_update, bulk=args.bulk,
+                checkpoint=args.checkpoint, depth=args.buffer)
+
+    if not stats:
+        sys.exit(1)
+
+    print(f"\nStreaming run complete in {stats['elapsed']}s")
+    print(f"Parsed: {stats['parse']['successful']}/{stats['parse']['total_files']}")
+    print(f"Unique: {stats['dedupe']['unique_items']} (duplicates: {stats['dedupe']['duplicate_items']})")
+    print(f"Cleaned: {stats['clean']['cleaned']} (dropped: {stats['clean']['dropped']})")
+    print(f"Inserted: {stats['load']['inserted']}, updated: {stats['load']['updated']}")
+
+
+if __name__ == '__main__':
+    main()